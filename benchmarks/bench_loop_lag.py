@@ -0,0 +1,73 @@
+"""
+Measure event-loop lag while concurrent logins hash passwords, inline and through the process pool.
+
+A probe task sleeps for a few milliseconds in a loop and records how late it wakes up; that is how
+long any other request on the worker would have waited. No database is needed: only the hashing
+path of a login is exercised.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_loop_lag
+"""
+import asyncio
+import os
+import statistics
+import time
+
+# The services package reads these at import time; nothing here connects to them
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from services import executor  # noqa: E402
+from services.service import get_password_hash  # noqa: E402
+
+# As many as the process pool accepts at once; more would be refused with a 503
+CONCURRENT = executor.pools[executor.PROCESS].workers + executor.pools[executor.PROCESS].queue_limit
+ROUNDS = 4
+PROBE_SECONDS = 0.005
+
+
+async def probe(lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_SECONDS)
+        lags.append(time.perf_counter() - started - PROBE_SECONDS)
+
+
+async def login_inline(password: str):
+    get_password_hash.__wrapped__(password)
+    await asyncio.sleep(0)
+
+
+async def login_offloaded(password: str):
+    await get_password_hash(password)
+
+
+async def measure(login) -> tuple:
+    lags: list = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(lags, stop))
+    started = time.perf_counter()
+    for _ in range(ROUNDS):
+        await asyncio.gather(*(login(f"password-{n}") for n in range(CONCURRENT)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await prober
+    lags.sort()
+    return elapsed, statistics.median(lags), lags[int(len(lags) * 0.99)], lags[-1]
+
+
+async def main():
+    # Start the workers outside the measurement
+    await asyncio.gather(*(get_password_hash("warm-up") for _ in range(executor.PROCESS_POOL_WORKERS)))
+    print(f"{CONCURRENT * ROUNDS} logins, {CONCURRENT} at a time")
+    print(f"{'path':<12}{'total s':>9}{'lag p50 ms':>12}{'lag p99 ms':>12}{'lag max ms':>12}")
+    for name, login in (("inline", login_inline), ("offloaded", login_offloaded)):
+        elapsed, p50, p99, worst = await measure(login)
+        print(f"{name:<12}{elapsed:>9.2f}{p50 * 1e3:>12.2f}{p99 * 1e3:>12.2f}{worst * 1e3:>12.2f}")
+    executor.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,90 @@
+"""
+Compare validated construction with the trusted from_mongo path for every model in database.models.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_models
+"""
+import inspect
+import timeit
+import warnings
+from datetime import datetime
+from typing import Any, Dict, List, Union, get_args, get_origin
+from bson import ObjectId
+from pydantic import BaseModel, EmailStr, HttpUrl
+from database import models
+
+NUMBER = 2000
+REPEAT = 5
+
+
+def sample_value(annotation, name: str = ""):
+    """A realistic stored value for a field annotation."""
+    if annotation is EmailStr:
+        return "supervisor@example.com"
+    if annotation is HttpUrl:
+        return "https://example.com/report.pdf"
+    origin = get_origin(annotation)
+    if origin is Union:
+        return sample_value(next(argument for argument in get_args(annotation) if argument is not type(None)), name)
+    if origin in (list, List):
+        return [sample_value(get_args(annotation)[0], name) for _ in range(3)]
+    if origin in (dict, Dict):
+        return {"title": "Inventory app", "year": 2024}
+    if hasattr(annotation, "__metadata__"):
+        return sample_value(get_args(annotation)[0], name)
+    if inspect.isclass(annotation):
+        if issubclass(annotation, ObjectId):
+            return ObjectId()
+        if issubclass(annotation, BaseModel):
+            return sample_document(annotation)
+        if issubclass(annotation, bool):
+            return True
+        if issubclass(annotation, datetime):
+            return datetime(2024, 9, 2, 8, 30)
+        if issubclass(annotation, int):
+            return 3 if name != "rating_score" else 4
+        if issubclass(annotation, float):
+            return 4.5
+    if annotation is Any:
+        return "value"
+    return f"sample {name}"
+
+
+def sample_document(model) -> Dict[str, Any]:
+    document = {}
+    for name, field in model.model_fields.items():
+        if name == "id":
+            document["_id"] = ObjectId()
+        elif name == "days":
+            document[name] = [0, 1, 2, 3, 4]
+        elif name.endswith("_time"):
+            document[name] = "08:00"
+        else:
+            document[name] = sample_value(field.annotation, name)
+    return document
+
+
+def model_classes():
+    return [
+        model for _, model in inspect.getmembers(models, inspect.isclass)
+        if issubclass(model, models.BaseModelWithConfig) and model is not models.BaseModelWithConfig
+    ]
+
+
+def main():
+    # Stored URLs come back as plain strings, which pydantic's serializer warns about
+    warnings.filterwarnings("ignore", category=UserWarning)
+    print(f"{'model':<22}{'validated µs':>14}{'from_mongo µs':>15}{'speed-up':>10}")
+    for model in model_classes():
+        document = sample_document(model)
+        # The validated path takes the id under its field name, as get_user used to pass it
+        payload = {("id" if key == "_id" else key): value for key, value in document.items()}
+        assert model.from_mongo(document).model_dump(mode="json") == model(**payload).model_dump(mode="json")
+        validated = min(timeit.repeat(lambda: model(**payload), number=NUMBER, repeat=REPEAT)) / NUMBER
+        trusted = min(timeit.repeat(lambda: model.from_mongo(document), number=NUMBER, repeat=REPEAT)) / NUMBER
+        print(f"{model.__name__:<22}{validated * 1e6:>14.2f}{trusted * 1e6:>15.2f}{validated / trusted:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
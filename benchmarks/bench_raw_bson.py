@@ -0,0 +1,48 @@
+"""
+Compare decoding reads into dicts with the RawBSONDocument pass-through used for logs and reports.
+
+Both paths start from the BSON bytes a cursor batch delivers and end with the JSON body; the
+memory column is what a page of documents costs while it waits to be encoded.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_raw_bson
+"""
+import timeit
+import tracemalloc
+import bson
+from bson.raw_bson import RawBSONDocument
+from services.responses import dumps
+from benchmarks.bench_serialization import make_documents
+
+REPEAT = 5
+NUMBER = 20
+
+
+def held_bytes(build) -> int:
+    tracemalloc.start()
+    documents = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del documents
+    return size
+
+
+def main():
+    payloads = [bson.encode(document) for document in make_documents()]
+
+    def decoded():
+        return [bson.decode(payload) for payload in payloads]
+
+    def raw():
+        return [RawBSONDocument(payload) for payload in payloads]
+
+    assert dumps(decoded()) == dumps(raw())
+    print(f"{'path':<12}{'decode+encode ms':>18}{'held KiB':>10}")
+    for name, build in (("dict", decoded), ("raw", raw)):
+        seconds = min(timeit.repeat(lambda: dumps(build()), number=NUMBER, repeat=REPEAT)) / NUMBER
+        print(f"{name:<12}{seconds * 1e3:>18.2f}{held_bytes(build) / 1024:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
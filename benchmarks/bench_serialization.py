@@ -0,0 +1,65 @@
+"""
+Compare FastAPI's generic encoding path with BSONJSONResponse on 1,000 raw Mongo documents.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_serialization
+"""
+import random
+import timeit
+from datetime import datetime, timedelta
+from bson import ObjectId, Decimal128
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from services.responses import BSONJSONResponse, orjson
+
+DOCUMENTS = 1000
+REPEAT = 5
+NUMBER = 20
+
+
+def make_documents(count: int = DOCUMENTS):
+    random.seed(0)
+    start = datetime(2024, 9, 2, 8, 0)
+    return [
+        {
+            "_id": ObjectId(),
+            "student_id": ObjectId(),
+            "internship_id": ObjectId(),
+            "date": start + timedelta(days=i),
+            "activities": [f"Activity {i}-{j}" for j in range(5)],
+            "learning_outcomes": [f"Outcome {i}-{j}" for j in range(3)],
+            "challenges": "Network outage in the afternoon",
+            "hours_worked": Decimal128(str(round(random.uniform(4, 9), 1))),
+            "status": "Submitted",
+            "supervisor_comments": None,
+            "created_at": start + timedelta(days=i, hours=9),
+            "updated_at": start + timedelta(days=i, hours=10),
+        }
+        for i in range(count)
+    ]
+
+
+def generic(documents):
+    encoded = jsonable_encoder(documents, custom_encoder={ObjectId: str, Decimal128: lambda value: str(value.to_decimal())})
+    return JSONResponse(encoded).body
+
+
+def fast(documents):
+    return BSONJSONResponse(documents).body
+
+
+def main():
+    documents = make_documents()
+    assert len(fast(documents)) > 0
+    print(f"{DOCUMENTS} documents, best of {REPEAT} x {NUMBER} runs (orjson: {'yes' if orjson else 'no'})")
+    results = {}
+    for name, function in (("jsonable_encoder + JSONResponse", generic), ("BSONJSONResponse", fast)):
+        best = min(timeit.repeat(lambda: function(documents), repeat=REPEAT, number=NUMBER)) / NUMBER
+        results[name] = best
+        print(f"  {name:<34} {best * 1000:8.2f} ms")
+    print(f"  speed-up {results['jsonable_encoder + JSONResponse'] / results['BSONJSONResponse']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
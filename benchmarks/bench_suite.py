@@ -0,0 +1,227 @@
+"""
+Micro-benchmarks for the authentication, geometry and model hot paths, compared with a stored baseline.
+
+Each case is timed in several repeats after a warm-up, with the loop count per repeat calibrated
+so one repeat takes about REPEAT_SECONDS. Shared CI runners change speed from minute to minute by
+more than the regressions worth catching, so every repeat is followed by a repeat of a fixed
+pure-Python reference loop, and a case is scored by the median ratio of its time to the
+reference's. That ratio is what is compared with the baseline; the absolute times are shown
+alongside. A case whose ratio grew by more than --threshold is a regression, and any regression
+makes the run exit with status 1, so CI can run it as a step.
+
+The ratio cancels the speed of the machine, not its kind: a baseline recorded on another Python
+version or CPU is reported as such, and is best re-recorded there with --save.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_suite                  # compare with benchmarks/baseline.json
+    python -m benchmarks.bench_suite --save           # record a new baseline
+    python -m benchmarks.bench_suite -k jwt -k model  # only cases whose name contains a pattern
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import warnings
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+# The services package reads these at import time; nothing here connects to them
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "bench")
+os.environ.setdefault("SECRET_KEY", "bench")
+
+from bson import ObjectId  # noqa: E402
+from jose import jwt  # noqa: E402
+from database.config import SECRET_KEY, ALGORITHM  # noqa: E402
+from database.models import PyObjectId  # noqa: E402
+from services import passwords  # noqa: E402
+from services.service import create_access_token, distance_meters, verify_password  # noqa: E402
+from benchmarks.bench_models import sample_document, model_classes  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+REPEAT = 7
+REPEAT_SECONDS = 0.05
+# Slower than the baseline, relative to the reference loop, by more than this fraction fails the run
+THRESHOLD = 0.25
+# What the reference ratio does not cancel; the rest of machine() is recorded for information
+COMPARED_MACHINE = ("python", "implementation", "processor")
+
+PASSWORD = "correct horse battery staple"
+# Accra to Kumasi, about 200 km
+ACCRA = (5.6037, -0.1870)
+KUMASI = (6.6885, -1.6244)
+
+
+def cases() -> Dict[str, Callable[[], object]]:
+    """Name to a no-argument callable doing one unit of the work being measured."""
+    # The process-pool wrappers are bypassed: the suite measures the work, not the hand-off
+    stored_hash = passwords.get_password_hash(PASSWORD)
+    token = create_access_token({"sub": "supervisor@example.com"}, timedelta(days=1)).access_token
+    object_id = ObjectId()
+    object_id_text = str(object_id)
+
+    suite = {
+        "auth.get_password_hash": lambda: passwords.get_password_hash(PASSWORD),
+        # What login's verify_password runs in the pool
+        "auth.verify_password": lambda: verify_password.__wrapped__(PASSWORD, stored_hash),
+        "auth.create_access_token": lambda: create_access_token({"sub": "supervisor@example.com"}),
+        # The CPU part of get_current_user; the user lookup after it is a database round trip
+        "auth.jwt_decode": lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]),
+        "models.PyObjectId.validate[str]": lambda: PyObjectId.validate(object_id_text),
+        "models.PyObjectId.validate[ObjectId]": lambda: PyObjectId.validate(object_id),
+        "geo.geodesic": lambda: distance_meters.__wrapped__(ACCRA, KUMASI),
+    }
+    for model in model_classes():
+        document = sample_document(model)
+        # Validated construction takes the id under its field name, as inbound payloads do
+        payload = {("id" if key == "_id" else key): value for key, value in document.items()}
+        suite[f"models.{model.__name__}"] = lambda model=model, payload=payload: model(**payload)
+        suite[f"models.{model.__name__}.from_mongo"] = lambda model=model, document=document: model.from_mongo(document)
+    return suite
+
+
+def reference():
+    """Interpreter-bound work with no I/O or allocation spikes, the yardstick for every case."""
+    total = 0
+    for number in range(2000):
+        total += number * number % 7
+    return total
+
+
+def calibrate(fn: Callable[[], object], target: float) -> int:
+    """Loop count that makes one repeat take at least `target` seconds."""
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= target:
+            return number
+        number = max(number * 2, int(number * target / elapsed * 1.1) if elapsed else number * 10)
+
+
+def _time(fn: Callable[[], object], number: int) -> float:
+    started = time.perf_counter()
+    for _ in range(number):
+        fn()
+    return (time.perf_counter() - started) / number
+
+
+def measure(fn: Callable[[], object], repeat: int, target: float) -> dict:
+    number = calibrate(fn, target)
+    reference_number = calibrate(reference, target / 2)
+    timings, ratios = [], []
+    for _ in range(repeat):
+        timing = _time(fn, number)
+        timings.append(timing)
+        ratios.append(timing / _time(reference, reference_number))
+    return {
+        "relative": statistics.median(ratios),
+        "median": statistics.median(timings),
+        "min": min(timings),
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def machine() -> dict:
+    return {
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "processor": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def _format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e3), ("µs", 1e6)):
+        if seconds * scale >= 1:
+            return f"{seconds * scale:.2f} {unit}"
+    return f"{seconds * 1e9:.0f} ns"
+
+
+def compare(results: Dict[str, dict], baseline: Optional[dict], threshold: float) -> List[str]:
+    """Print the results against the baseline and return the names of the cases that regressed."""
+    recorded = (baseline or {}).get("results", {})
+    regressions = []
+    print(f"{'case':<44}{'median':>12}{'stdev':>8}{'× ref':>10}{'baseline':>10}{'change':>9}")
+    for name, result in results.items():
+        spread = result["stdev"] / result["median"] * 100 if result["median"] else 0.0
+        line = f"{name:<44}{_format_time(result['median']):>12}{spread:>7.1f}%{result['relative']:>10.4f}"
+        before = recorded.get(name)
+        if before:
+            change = result["relative"] / before["relative"] - 1
+            line += f"{before['relative']:>10.4f}{change * 100:>+8.1f}%"
+            if change > threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        else:
+            line += f"{'-':>10}{'new':>9}"
+        print(line)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--baseline", default=BASELINE, help="Baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="Record these results as the baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="Allowed slowdown as a fraction (default 0.25)")
+    parser.add_argument("-k", dest="patterns", action="append", default=[], help="Only cases containing this text")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--repeat-seconds", type=float, default=REPEAT_SECONDS, help="Target duration of one repeat")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    # Stored URLs come back as plain strings, which pydantic's serializer warns about
+    warnings.filterwarnings("ignore", category=UserWarning)
+    selected = {
+        name: fn for name, fn in cases().items()
+        if not args.patterns or any(pattern in name for pattern in args.patterns)
+    }
+    if not selected:
+        parser.error("no case matches the -k patterns")
+
+    baseline = None
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as source:
+            baseline = json.load(source)
+    current = machine()
+    recorded_on = (baseline or {}).get("machine", {})
+    if baseline and any(recorded_on.get(key) != current[key] for key in COMPARED_MACHINE):
+        print(f"Baseline was recorded on a different machine: {baseline.get('machine')}", file=sys.stderr)
+
+    results = {name: measure(fn, args.repeat, args.repeat_seconds) for name, fn in selected.items()}
+    regressions = compare(results, baseline, args.threshold)
+
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"machine": current, "results": results, "regressions": regressions}, output, indent=2)
+    if args.save:
+        recorded = {}
+        if os.path.exists(args.baseline):
+            # A partial run with -k only replaces the cases it measured
+            with open(args.baseline) as source:
+                recorded = json.load(source).get("results", {})
+        recorded.update(results)
+        with open(args.baseline, "w") as output:
+            json.dump({"machine": current, "results": recorded}, output, indent=2, sort_keys=True)
+            output.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+        return 0
+    if regressions:
+        print(f"\n{len(regressions)} case(s) slower than the baseline by more than {args.threshold:.0%}: "
+              f"{', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
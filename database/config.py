@@ -15,6 +15,26 @@ SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
 
+# Rate limiting: "local" keeps each worker's buckets to itself, "mongo" shares them best-effort
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "local")
+# Comma-separated proxy addresses whose X-Forwarded-For is believed when rate limiting by address
+TRUSTED_PROXIES = frozenset(address.strip() for address in os.getenv("TRUSTED_PROXIES", "").split(",") if address.strip())
+
+# Workers for CPU-bound calls moved off the event loop
+THREAD_POOL_WORKERS = int(os.getenv("THREAD_POOL_WORKERS", "4"))
+PROCESS_POOL_WORKERS = int(os.getenv("PROCESS_POOL_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+# Debugging aid: log the stack of any callback holding the event loop longer than this; 0 turns it off
+LOOP_WATCHDOG_SECONDS = float(os.getenv("LOOP_WATCHDOG_SECONDS", "0"))
+
+# Shared secret for the batch rewrite routes, the /admin endpoints and the X-Profile header; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Fraction of requests profiled without being asked to; 0 leaves the profiler off
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# Mongo commands slower than this are logged with their shape and explain plan
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
 # Ensure all required environment variables are set
 required_vars = ["MONGODB_URI", "DATABASE_NAME", "SECRET_KEY"]
 for var in required_vars:
@@ -1,8 +1,8 @@
 from bson import ObjectId
 from pydantic import BaseModel, Field, EmailStr, HttpUrl, ConfigDict, GetCoreSchemaHandler
-from typing import Any, Dict, Optional, List, Annotated
+from typing import Any, Dict, Optional, List, Annotated, Union, get_args, get_origin
 from datetime import datetime
-from pydantic_core import core_schema
+from pydantic_core import core_schema, PydanticUndefined
 
 class PyObjectId(ObjectId):
     @classmethod
@@ -34,6 +34,91 @@ class BaseModelWithConfig(BaseModel):
         json_encoders={ObjectId: str}
     )
 
+    @classmethod
+    def from_mongo(cls, document: Dict[str, Any]):
+        """
+        Build a model from a document read back from the database, without validation.
+
+        Documents in Mongo were validated on the way in, so reads skip the EmailStr/ObjectId
+        checks and the timestamp default factories. Fields missing from the document are left
+        at their plain default (None for factory defaults). Inbound API payloads must still be
+        validated by calling the model normally.
+        """
+        return _hydrate(cls, document)
+
+# Compiled per-model hydrators, built on first use
+_hydrators: Dict[type, Any] = {}
+
+def _nested_model(annotation):
+    """Return (model class, is_list) when a field holds a model or a list of models."""
+    origin = get_origin(annotation)
+    if origin in (Union, Annotated):
+        for argument in get_args(annotation):
+            nested = _nested_model(argument)
+            if nested[0] is not None:
+                return nested
+        return None, False
+    if origin in (list, List):
+        arguments = get_args(annotation)
+        nested, _ = _nested_model(arguments[0]) if arguments else (None, False)
+        return nested, nested is not None
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation, False
+    return None, False
+
+def _compile_hydrator(cls):
+    """
+    Generate a function that copies a document into an instance of cls.
+
+    Each field becomes a straight run of dict lookups, so a read costs no more than
+    pydantic-core's own loop and none of the validators run.
+    """
+    namespace = {"_new": cls.__new__, "_set": object.__setattr__, "_cls": cls}
+    lines = ["def hydrate(document):", "    values = {}", "    fields_set = set()"]
+    for index, (name, field) in enumerate(cls.model_fields.items()):
+        keys = [key for key in (field.alias, name) if key]
+        if name == "id":
+            # The id alias sits inside Optional[...] and is not applied by pydantic
+            keys.insert(0, "_id")
+        nested, many = _nested_model(field.annotation)
+        if nested is not None:
+            namespace[f"_nested{index}"] = _hydrator(nested)
+        for position, key in enumerate(dict.fromkeys(keys)):
+            lines.append(f"    {'elif' if position else 'if'} {key!r} in document:")
+            lines.append(f"        value = document[{key!r}]")
+            if nested is not None and many:
+                lines.append("        if value is not None:")
+                lines.append(f"            value = [_nested{index}(item) if isinstance(item, dict) else item for item in value]")
+            elif nested is not None:
+                lines.append("        if isinstance(value, dict):")
+                lines.append(f"            value = _nested{index}(value)")
+            lines.append(f"        values[{name!r}] = value")
+            lines.append(f"        fields_set.add({name!r})")
+        default = None if field.default_factory is not None or field.default is PydanticUndefined else field.default
+        namespace[f"_default{index}"] = default
+        lines.append("    else:")
+        lines.append(f"        values[{name!r}] = _default{index}")
+    # Same slots model_construct fills in, without its per-field Python overhead
+    lines += [
+        "    instance = _new(_cls)",
+        "    _set(instance, '__dict__', values)",
+        "    _set(instance, '__pydantic_fields_set__', fields_set)",
+        "    _set(instance, '__pydantic_extra__', None)",
+        "    _set(instance, '__pydantic_private__', None)",
+        "    return instance",
+    ]
+    exec("\n".join(lines), namespace)
+    return namespace["hydrate"]
+
+def _hydrator(cls):
+    hydrator = _hydrators.get(cls)
+    if hydrator is None:
+        hydrator = _hydrators[cls] = _compile_hydrator(cls)
+    return hydrator
+
+def _hydrate(cls, document: Dict[str, Any]):
+    return _hydrator(cls)(document)
+
 class Coordinate(BaseModelWithConfig):
     latitude: Optional[float] = None
     longitude: Optional[float] = None
@@ -109,6 +194,11 @@ class AcademicInfo(BaseModelWithConfig):
     year_of_study: Optional[int] = None
     gpa: Optional[float] = None
 
+class WorkingHours(BaseModelWithConfig):
+    open_time: Optional[str] = "08:00"
+    close_time: Optional[str] = "17:00"
+    days: Optional[List[int]] = None  # 0 = Monday
+
 class Company(BaseModelWithConfig):
     id: Optional[Annotated[PyObjectId, Field(alias="_id")]] = None
     user_id: Optional[PyObjectId] = None
@@ -121,6 +211,7 @@ class Company(BaseModelWithConfig):
     description: Optional[str] = None
     address: Optional[Address] = None
     contact_info: Optional[ContactInfo] = None
+    working_hours: Optional[WorkingHours] = None
     internships_posted: Optional[List[PyObjectId]] = None
     company_supervisors: Optional[List[PyObjectId]] = None
     created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
@@ -292,6 +383,7 @@ class SchoolSupervisor(BaseModelWithConfig):
     qualifications: Optional[List[str]] = None
     areas_of_expertise: Optional[List[str]] = None
     zone_id: Optional[PyObjectId] = None
+    capacity: Optional[int] = None  # maximum number of assigned students
     created_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
     updated_at: Optional[datetime] = Field(default_factory=datetime.utcnow)
 
@@ -305,6 +397,8 @@ class Student(BaseModelWithConfig):
     interests: Optional[List[str]] = None
     homeTown: Optional[str] = None
     homeTown_GPS_Address: Optional[str] = None
+    homeTown_coordinate: Optional[Coordinate] = None
+    homeTown_coordinate_approximate: Optional[bool] = None  # estimated from the digital address, not surveyed
     internships: Optional[List[PyObjectId]] = None
     projects: Optional[List[Dict[str, Any]]] = None
     department_id: Optional[PyObjectId] = None
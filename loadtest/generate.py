@@ -0,0 +1,350 @@
+"""
+Seeded synthetic data for load tests, built through the database.models schemas.
+
+The default sizes are a production-like cohort: 500 supervisors, 5,000 companies, 50,000
+students and about two million logbook entries. --scale shrinks every count together. The
+same seed always produces the same cohort, ObjectIds included, so runs can be compared; only the
+created_at and updated_at stamps of models that default them differ.
+
+Fill a local mongod (the database is dropped first):
+
+    python -m loadtest.generate --mongo-uri mongodb://localhost:27017 --database ims_load
+
+Every generated user can sign in with LOGIN_PASSWORD; load-test requests authenticate with
+APP_ID and APP_KEY.
+"""
+import argparse
+import asyncio
+import os
+import random
+import struct
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List
+
+from bson import ObjectId
+from pydantic import BaseModel
+from database.models import (
+    Address, AcademicInfo, AppCredentials, AttachmentReport, Company, ContactInfo, Coordinate, Department,
+    Evaluation, EvaluationCriteria, Faculty, FinalAssessment, Internship, Application, LogBookEntry,
+    MonthlySummary, Notification, Programme, SchoolSupervisor, Student, User, VisitLocation, WorkingHours, Zone,
+)
+from services import passwords
+
+APP_ID = "loadtest"
+APP_KEY = "loadtest-key"
+LOGIN_PASSWORD = "loadtest-password"
+SUPERVISOR_ROLE = "Supervisor-School-Base"
+
+SIZES = {
+    "supervisors": 500,
+    "companies": 5_000,
+    "students": 50_000,
+    # Weekday entries over the placement, which is 40 working days long
+    "logs_per_student": 40,
+}
+BATCH = 5_000
+PLACEMENT_START = datetime(2024, 6, 3, 8, 0)
+PLACEMENT_WEEKS = 8
+
+# Regions with a representative point; students and companies are scattered around them
+REGIONS = [
+    ("Greater Accra", 5.6037, -0.1870), ("Ashanti", 6.6885, -1.6244), ("Western", 4.8963, -1.7554),
+    ("Central", 5.1053, -1.2466), ("Eastern", 6.0940, -0.2591), ("Volta", 6.6008, 0.4713),
+    ("Northern", 9.4034, -0.8424), ("Upper East", 10.7856, -0.8514), ("Upper West", 10.0601, -2.5099),
+    ("Bono", 7.3399, -2.3268), ("Bono East", 7.5900, -1.9344), ("Ahafo", 6.8000, -2.5200),
+    ("Western North", 6.2000, -2.4800), ("Oti", 8.0667, 0.1833), ("Savannah", 9.0833, -1.8167),
+    ("North East", 10.5167, -0.3667),
+]
+FACULTIES = {
+    "Applied Sciences": ["Computer Science", "Statistics", "Hospitality", "Medical Laboratory"],
+    "Engineering": ["Civil Engineering", "Electrical Engineering", "Mechanical Engineering", "Agricultural Engineering"],
+    "Business Studies": ["Accounting", "Marketing", "Procurement", "Secretaryship"],
+    "Applied Arts": ["Fashion Design", "Graphic Design", "Ceramics", "Textiles"],
+    "Built Environment": ["Building Technology", "Estate Management", "Interior Design", "Quantity Surveying"],
+}
+INDUSTRIES = ["Technology", "Construction", "Finance", "Manufacturing", "Hospitality", "Health", "Energy", "Retail"]
+FIRST_NAMES = ["Kwame", "Ama", "Kofi", "Akosua", "Yaw", "Abena", "Kwabena", "Adwoa", "Kojo", "Efua", "Kwesi", "Esi"]
+LAST_NAMES = ["Mensah", "Owusu", "Boateng", "Asante", "Osei", "Addo", "Appiah", "Agyeman", "Ofori", "Darko"]
+ACTIVITIES = [
+    "Site inspection", "Drafted monthly report", "Customer support shift", "Inventory count", "Attended staff meeting",
+    "Prepared drawings", "Data entry", "Equipment maintenance", "Shadowed supervisor", "Configured network devices",
+]
+
+
+class CohortGenerator:
+    """Builds one cohort's documents from a seed; ObjectIds come from the same generator."""
+
+    def __init__(self, seed: int = 0, scale: float = 1.0):
+        self.rng = random.Random(seed)
+        self.sizes = {name: max(1, int(round(count * scale))) if name != "logs_per_student" else count
+                      for name, count in SIZES.items()}
+
+    def object_id(self, at: datetime = PLACEMENT_START) -> ObjectId:
+        return ObjectId(struct.pack(">I", int(at.timestamp())) + self.rng.randbytes(8))
+
+    def near(self, latitude: float, longitude: float, spread: float = 0.3) -> Coordinate:
+        return Coordinate(
+            latitude=round(latitude + self.rng.uniform(-spread, spread), 6),
+            longitude=round(longitude + self.rng.uniform(-spread, spread), 6),
+        )
+
+    def person(self) -> Dict[str, str]:
+        return {"first_name": self.rng.choice(FIRST_NAMES), "last_name": self.rng.choice(LAST_NAMES)}
+
+    @staticmethod
+    def document(model) -> dict:
+        return _document(model)
+
+    def reference(self) -> Dict[str, List[dict]]:
+        zones = [
+            Zone(id=self.object_id(), name=name, region=name, description=f"{name} region",
+                 boundaries=[self.near(lat, lon, 0.8) for _ in range(4)])
+            for name, lat, lon in REGIONS
+        ]
+        faculties, departments, programmes = [], [], []
+        for faculty_name, department_names in FACULTIES.items():
+            faculty = Faculty(id=self.object_id(), name=f"Faculty of {faculty_name}")
+            faculties.append(faculty)
+            for department_name in department_names:
+                department = Department(id=self.object_id(), name=department_name, faculty_id=faculty.id)
+                departments.append(department)
+                programmes.extend(
+                    Programme(id=self.object_id(), name=f"{level} {department_name}", department_id=department.id)
+                    for level in ("HND", "BTech")
+                )
+        return {
+            "zones": [self.document(zone) for zone in zones],
+            "faculties": [self.document(faculty) for faculty in faculties],
+            "departments": [self.document(department) for department in departments],
+            "programmes": [self.document(programme) for programme in programmes],
+        }
+
+    def user(self, role: str, email: str, password_hash: str, location: Coordinate) -> User:
+        person = self.person()
+        return User(
+            id=self.object_id(), role=role, email=email, password=password_hash, **person,
+            contact_info=ContactInfo(phone=f"+23324{self.rng.randrange(10**7):07d}", email=email),
+            address=Address(city="Takoradi", country="Ghana", coordinate=location),
+            gender=self.rng.choice(["Male", "Female"]), nationality="Ghanaian",
+        )
+
+    async def fill(self, db, password_hash: str, log=print):
+        """Drop-in population of `db`; collections are written in batches as they are generated."""
+        started = time.monotonic()
+        reference = self.reference()
+        for name, documents in reference.items():
+            await db[name].insert_many(documents)
+        zones = reference["zones"]
+        departments = reference["departments"]
+        programmes_by_department: Dict[ObjectId, List[ObjectId]] = {}
+        for programme in reference["programmes"]:
+            programmes_by_department.setdefault(programme["department_id"], []).append(programme["_id"])
+        await db.app_credentials.insert_one(self.document(
+            AppCredentials(id=self.object_id(), app_id=APP_ID, app_key=APP_KEY, app_name="Load test")
+        ))
+
+        # Supervisors, each posted to a zone and a department
+        supervisor_users, supervisors = [], []
+        for index in range(self.sizes["supervisors"]):
+            zone = zones[index % len(zones)]
+            location = zone["boundaries"][0]
+            user = self.user(SUPERVISOR_ROLE, f"supervisor{index}@loadtest.ttu.edu.gh", password_hash,
+                             Coordinate(**location))
+            supervisor_users.append(self.document(user))
+            supervisors.append(SchoolSupervisor(
+                id=self.object_id(), user_id=user.id, department_id=self.rng.choice(departments)["_id"],
+                position="Lecturer", assigned_students=[], zone_id=zone["_id"],
+                qualifications=["MPhil"], areas_of_expertise=[self.rng.choice(INDUSTRIES)], capacity=150,
+            ))
+        await db.users.insert_many(supervisor_users)
+        log(f"  {len(supervisors)} supervisors")
+
+        # Companies with one internship each
+        companies, internships = [], []
+        for index in range(self.sizes["companies"]):
+            _, lat, lon = REGIONS[index % len(REGIONS)]
+            company = Company(
+                id=self.object_id(), company_name=f"Company {index}", industry=self.rng.choice(INDUSTRIES),
+                company_size=self.rng.choice(["1-10", "11-50", "51-200", "200+"]),
+                address=Address(city=REGIONS[index % len(REGIONS)][0], country="Ghana", coordinate=self.near(lat, lon)),
+                contact_info=ContactInfo(phone=f"+23330{self.rng.randrange(10**7):07d}"),
+                working_hours=WorkingHours(days=[0, 1, 2, 3, 4]), internships_posted=[],
+            )
+            internship = Internship(
+                id=self.object_id(), company_id=company.id, title=f"{company.industry} intern",
+                location=company.address, industry=company.industry, internship_type="Industrial attachment",
+                start_date=PLACEMENT_START, end_date=PLACEMENT_START + timedelta(weeks=PLACEMENT_WEEKS), status="Open",
+            )
+            company.internships_posted.append(internship.id)
+            companies.append(self.document(company))
+            internships.append(self.document(internship))
+        await self._insert(db.companies, companies)
+        await self._insert(db.internships, internships)
+        log(f"  {len(companies)} companies")
+
+        # Students, their placement, visits, logbooks and assessments, written batch by batch
+        supervisors_by_zone: Dict[ObjectId, List[SchoolSupervisor]] = {}
+        for supervisor in supervisors:
+            supervisors_by_zone.setdefault(supervisor.zone_id, []).append(supervisor)
+        # For zones left without a supervisor in small cohorts
+        supervisors_by_zone[None] = supervisors
+        logs_written = 0
+        for first in range(0, self.sizes["students"], BATCH):
+            batch = {name: [] for name in (
+                "users", "students", "applications", "visit_locations", "logbook_entries", "monthly_summaries",
+                "evaluations", "final_assessments", "attachment_reports", "notifications",
+            )}
+            for index in range(first, min(first + BATCH, self.sizes["students"])):
+                self._student(index, zones, departments, programmes_by_department, companies, internships,
+                              supervisors_by_zone, password_hash, batch)
+            for name, documents in batch.items():
+                await self._insert(db[name], documents)
+            logs_written += len(batch["logbook_entries"])
+            log(f"  {min(first + BATCH, self.sizes['students'])} students, {logs_written} logbook entries")
+
+        await self._insert(db.school_supervisors, [
+            # Stored the way the service looks supervisors up: user_id as a string
+            {**self.document(supervisor), "user_id": str(supervisor.user_id)} for supervisor in supervisors
+        ])
+        log(f"Generated in {time.monotonic() - started:.1f}s")
+
+    def _student(self, index, zones, departments, programmes_by_department, companies, internships,
+                 supervisors_by_zone, password_hash, batch):
+        rng = self.rng
+        zone = zones[index % len(zones)]
+        _, lat, lon = REGIONS[index % len(REGIONS)]
+        department = rng.choice(departments)
+        # Companies were laid out region by region in turn; pick one in the student's region
+        company_index = (rng.randrange(max(1, len(companies) // len(REGIONS))) * len(REGIONS) + index % len(REGIONS)) % len(companies)
+        company, internship = companies[company_index], internships[company_index]
+        supervisor = rng.choice(supervisors_by_zone.get(zone["_id"]) or supervisors_by_zone[None])
+
+        user = self.user("student", f"student{index}@loadtest.ttu.edu.gh", password_hash, self.near(lat, lon))
+        student = Student(
+            id=self.object_id(), user_id=user.id, registration_number=f"TTU/{index:06d}",
+            academic_info=AcademicInfo(institution="Takoradi Technical University", degree="HND",
+                                       major=department["name"], year_of_study=rng.choice([2, 3])),
+            skills=rng.sample(ACTIVITIES, 3), homeTown=zone["name"], homeTown_coordinate=self.near(lat, lon, 0.6),
+            internships=[internship["_id"]], department_id=department["_id"],
+            programme_id=rng.choice(programmes_by_department[department["_id"]]), zone_id=zone["_id"],
+            current_location=self.near(company["address"]["coordinate"]["latitude"],
+                                       company["address"]["coordinate"]["longitude"], 0.002),
+            assigned_supervisor=supervisor.id,
+        )
+        supervisor.assigned_students.append(student.id)
+        application = Application(
+            id=self.object_id(), student_id=student.id, internship_id=internship["_id"], status="Accepted",
+            application_date=PLACEMENT_START - timedelta(days=30), start_date=PLACEMENT_START,
+            end_date=PLACEMENT_START + timedelta(weeks=PLACEMENT_WEEKS),
+        )
+        batch["users"].append(self.document(user))
+        batch["students"].append(self.document(student))
+        batch["applications"].append(self.document(application))
+
+        for visit in range(rng.randint(1, 3)):
+            batch["visit_locations"].append(self.document(VisitLocation(
+                id=self.object_id(), supervisor_id=supervisor.user_id, student_id=student.id,
+                internship_id=internship["_id"], company_id=company["_id"], destination_location=Address(**company["address"]),
+                visit_date=PLACEMENT_START + timedelta(days=rng.randrange(PLACEMENT_WEEKS * 7)),
+                status=rng.choice(["Scheduled", "Completed", "Pending"]),
+            )))
+        day = 0
+        for entry in range(self.sizes["logs_per_student"]):
+            date = PLACEMENT_START + timedelta(days=day + (day // 5) * 2)
+            day += 1
+            batch["logbook_entries"].append(self.document(LogBookEntry(
+                id=self.object_id(date), student_id=student.id, internship_id=internship["_id"], date=date,
+                activities=rng.sample(ACTIVITIES, 3), learning_outcomes=rng.sample(ACTIVITIES, 2),
+                challenges="None" if rng.random() < 0.7 else "Power outage", hours_worked=round(rng.uniform(4, 9), 1),
+                status=rng.choice(["Submitted", "Submitted", "Submitted", "Approved", "Draft"]),
+                created_at=date, updated_at=date,
+            )))
+        for month in ("2024-06", "2024-07"):
+            batch["monthly_summaries"].append(self.document(MonthlySummary(
+                id=self.object_id(), student_id=student.id, internship_id=internship["_id"], month=month,
+                summary="Progressing well", key_learnings=rng.sample(ACTIVITIES, 2), status="Submitted",
+            )))
+        if rng.random() < 0.3:
+            batch["evaluations"].append(self.document(Evaluation(
+                id=self.object_id(), application_id=application.id, supervisor_id=supervisor.user_id,
+                evaluation_type="Visit", evaluation_date=PLACEMENT_START + timedelta(weeks=4),
+                criteria=[EvaluationCriteria(criterion="Punctuality", score=rng.randint(5, 10), max_score=10, weight=1)],
+                total_score=rng.randint(50, 100), max_total_score=100,
+            )))
+        batch["final_assessments"].append({
+            **self.document(FinalAssessment(
+                id=self.object_id(), student_id=student.id, internship_id=internship["_id"],
+                assessment_date=PLACEMENT_START + timedelta(weeks=PLACEMENT_WEEKS), final_grade=rng.randint(50, 100),
+            )),
+            # Checked by create_final_report, though not part of the model
+            "status": "Approved" if rng.random() < 0.8 else "Pending",
+        })
+        if rng.random() < 0.5:
+            batch["attachment_reports"].append({
+                **self.document(AttachmentReport(
+                    id=self.object_id(), student_id=student.id, internship_id=internship["_id"],
+                    submission_date=PLACEMENT_START + timedelta(weeks=PLACEMENT_WEEKS), executive_summary="Summary",
+                    learnings=rng.sample(ACTIVITIES, 3), status="Submitted",
+                )),
+                "supervisor_id": supervisor.user_id,
+            })
+        if index % 10 == 0:
+            batch["notifications"].append(self.document(Notification(
+                id=self.object_id(), user_id=supervisor.user_id, title="Logbook submitted",
+                description=f"{user.first_name} {user.last_name} submitted a logbook entry", notification_type="logbook",
+            )))
+
+    @staticmethod
+    async def _insert(collection, documents: Iterable[dict]):
+        documents = list(documents)
+        for first in range(0, len(documents), BATCH):
+            await collection.insert_many(documents[first:first + BATCH], ordered=False)
+
+
+def _document(model: BaseModel) -> dict:
+    """
+    The model as the services store it. model_dump would turn ObjectIds into strings and keep `id`
+    under its own name, so the field values are taken as they are instead.
+    """
+    return {("_id" if name == "id" else name): _raw(getattr(model, name)) for name in type(model).model_fields}
+
+
+def _raw(value):
+    if isinstance(value, BaseModel):
+        return _document(value)
+    if isinstance(value, list):
+        return [_raw(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _raw(item) for key, item in value.items()}
+    return value
+
+
+def login_password_hash() -> str:
+    return passwords.get_password_hash(LOGIN_PASSWORD)
+
+
+async def generate(db, seed: int = 0, scale: float = 1.0, log=print):
+    await db.client.drop_database(db.name)
+    generator = CohortGenerator(seed, scale)
+    log(f"Generating {generator.sizes} with seed {seed}")
+    await generator.fill(db, login_password_hash(), log)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="ims_load")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier on every collection size")
+    args = parser.parse_args()
+    os.environ.setdefault("MONGODB_URI", args.mongo_uri)
+    os.environ.setdefault("DATABASE_NAME", args.database)
+    os.environ.setdefault("SECRET_KEY", "loadtest")
+
+    from motor.motor_asyncio import AsyncIOMotorClient
+    asyncio.run(generate(AsyncIOMotorClient(args.mongo_uri)[args.database], args.seed, args.scale))
+
+
+if __name__ == "__main__":
+    main()
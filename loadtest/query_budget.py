@@ -0,0 +1,219 @@
+"""
+Check the Mongo round trips and documents each route costs against a checked-in budget.
+
+Every route in loadtest.run is requested once, one at a time, against a freshly generated
+cohort, with the in-process caches emptied before each request so the cold path is measured. A
+command listener attributes every command to the route whose request issued it, through the
+context Motor copies into its worker threads and the cache carries into its loads; the
+change-stream feeds and other background work run in their own context and are not counted. The
+authentication lookups every request makes are part of each route's count.
+
+A route that makes more round trips or reads more documents than its budget, or answers with a
+different status, fails the run with exit status 1; the commands it sent are listed to show
+where an N+1 crept in. Routes under budget are reported so the budget can be tightened.
+
+Budgets are kept per backend, since the in-memory stand-in only reproduces the driver's batching;
+it sends the counter the command events the driver would:
+
+    # On the in-memory stand-in
+    python -m loadtest.query_budget --fake
+
+    # On a local mongod; the database is dropped and refilled
+    python -m loadtest.query_budget --mongo-uri mongodb://localhost:27017
+
+    # Record the current counts as the budget after an intended change
+    python -m loadtest.query_budget --fake --save
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+from pymongo import monitoring
+
+from loadtest.run import ROUTES, Recorder, load_sessions, login, open_app, send
+
+BUDGET = os.path.join(os.path.dirname(os.path.abspath(__file__)), "query_budget.json")
+SEED = 0
+# Two supervisors with a hundred students each; enough for every route to have ids to ask for
+SCALE = 0.004
+ADMIN_TOKEN = "query-budget"
+# Holds the stream open; its work happens after the response starts
+SKIPPED = ("events",)
+# Run last, in this order: each one removes data or the session later routes need
+LAST = ("delete_visit", "delete_report", "assignments", "home_towns", "logout", "delete_profile")
+# Route whose request is running now
+current_route: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("current_route", default=None)
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Round trips, documents returned and commands sent per route."""
+
+    def __init__(self):
+        self.round_trips: Counter = Counter()
+        self.documents: Counter = Counter()
+        self.commands: Dict[str, Counter] = {}
+        # Collection of each command in flight, by request id; only started events carry the command
+        self._collections: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, command: str, collection: str, documents: int):
+        route = current_route.get()
+        if route is None:
+            return
+        with self._lock:
+            self.round_trips[route] += 1
+            self.documents[route] += documents
+            self.commands.setdefault(route, Counter())[f"{command} {collection}"] += 1
+
+    def started(self, event):
+        if current_route.get() is not None:
+            self._collections[event.request_id] = self._collection(event)
+
+    def succeeded(self, event):
+        reply = event.reply
+        cursor = reply.get("cursor")
+        if cursor is not None:
+            documents = len(cursor.get("firstBatch", cursor.get("nextBatch", ())))
+        else:
+            documents = int(event.command_name == "findAndModify" and reply.get("value") is not None)
+        self.observe(event.command_name, self._collections.pop(event.request_id, "?"), documents)
+
+    def failed(self, event):
+        self.observe(event.command_name, self._collections.pop(event.request_id, "?"), 0)
+
+    @staticmethod
+    def _collection(event) -> str:
+        # getMore names the collection separately; its own field is the cursor id
+        if event.command_name == "getMore":
+            return event.command.get("collection", "?")
+        return str(event.command.get(event.command_name, "?"))
+
+
+def route_order():
+    return [key for key in ROUTES if key not in SKIPPED and key not in LAST] + list(LAST)
+
+
+async def measure(args, counter: CommandCounter) -> Dict[str, dict]:
+    from services.cache import clear_all
+
+    client, db, close = await open_app(args, [counter])
+    try:
+        sessions = await load_sessions(db, 1, args.seed)
+        if not sessions:
+            raise SystemExit("The generated cohort has no supervisor with students")
+        session = sessions[0]
+        async with client:
+            if not await login(client, session, Recorder()):
+                raise SystemExit("Could not sign in as the generated supervisor")
+            results = {}
+            for key in route_order():
+                request = ROUTES[key][2](session, random.Random(args.seed))
+                if request is None:
+                    continue
+                clear_all()
+                token = current_route.set(key)
+                try:
+                    status = await send(client, session, request, ADMIN_TOKEN)
+                finally:
+                    current_route.reset(token)
+                # Let work the request handed to tasks finish before the next route is counted
+                await asyncio.sleep(0.05)
+                if key == "logout":
+                    # Sign in again, uncounted, so the route after it runs as a signed-in supervisor
+                    session.token = None
+                    await login(client, session, Recorder())
+                results[key] = {
+                    "status": status,
+                    "round_trips": counter.round_trips[key],
+                    "documents": counter.documents[key],
+                }
+    finally:
+        await close()
+    return results
+
+
+def check(results: Dict[str, dict], budget: Dict[str, dict], counter: CommandCounter) -> int:
+    failures = 0
+    print(f"{'route':<28}{'status':>7}{'round trips':>13}{'documents':>11}  verdict")
+    for key, result in results.items():
+        allowed = budget.get(key)
+        problems, notes = [], []
+        if allowed is None:
+            problems.append("no budget")
+        else:
+            if result["status"] != allowed["status"]:
+                problems.append(f"status was {allowed['status']}")
+            for measure_name in ("round_trips", "documents"):
+                if result[measure_name] > allowed[measure_name]:
+                    problems.append(f"{measure_name.replace('_', ' ')} over {allowed[measure_name]}")
+                elif result[measure_name] < allowed[measure_name]:
+                    notes.append(f"{measure_name.replace('_', ' ')} under {allowed[measure_name]}")
+        verdict = "FAIL: " + ", ".join(problems) if problems else ("ok, " + ", ".join(notes) if notes else "ok")
+        print(f"{key:<28}{result['status']:>7}{result['round_trips']:>13}{result['documents']:>11}  {verdict}")
+        if problems:
+            failures += 1
+            for command, count in counter.commands.get(key, Counter()).most_common():
+                print(f"{'':<30}{count:>4} × {command}")
+    for key in budget.keys() - results.keys():
+        print(f"{key:<28}{'':>31}  not run; budget left unchecked")
+    return failures
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fake", action="store_true", help="Run on the in-memory Mongo stand-in")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="ims_query_budget", help="Dropped and refilled by the run")
+    parser.add_argument("--budget", default=BUDGET)
+    parser.add_argument("--save", action="store_true", help="Record the counts of this run as the budget")
+    args = parser.parse_args(argv)
+    backend = "fake" if args.fake else "mongod"
+
+    budgets = {}
+    if os.path.exists(args.budget):
+        with open(args.budget) as source:
+            budgets = json.load(source)
+    recorded = budgets.get(backend, {})
+    # The counts depend on the data, so a budget is only checked against the cohort it was taken on
+    args.seed = recorded.get("seed", SEED)
+    args.scale = recorded.get("scale", SCALE)
+    args.generate, args.throttled = True, False
+
+    os.environ.setdefault("MONGODB_URI", args.mongo_uri)
+    os.environ.setdefault("DATABASE_NAME", args.database)
+    os.environ.setdefault("SECRET_KEY", "query-budget")
+    os.environ.setdefault("ADMIN_TOKEN", ADMIN_TOKEN)
+    from services import cache
+
+    # Cache loads run in a fresh context; the route is carried in so what they read is counted
+    cache.carry(current_route)
+    counter = CommandCounter()
+    if not args.fake:
+        # Listeners registered before the services create their client apply to it; the
+        # stand-in is handed the counter instead
+        monitoring.register(counter)
+
+    results = asyncio.run(measure(args, counter))
+    if args.save:
+        budgets[backend] = {"seed": args.seed, "scale": args.scale, "routes": results}
+        with open(args.budget, "w") as output:
+            json.dump(budgets, output, indent=2, sort_keys=True)
+            output.write("\n")
+        print(f"Budget for {backend} saved to {args.budget}")
+        return 0
+    failures = check(results, recorded.get("routes", {}), counter)
+    if failures:
+        print(f"\n{failures} route(s) over budget on {backend}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,586 @@
+"""
+Async load driver for every route in main.py, reporting latency percentiles and throughput per route.
+
+Targets, from lightest to closest to production:
+
+    # The app in this process, on an in-memory Mongo stand-in filled by the generator
+    python -m loadtest.run --fake --scale 0.01 --duration 30
+
+    # The app in this process, on a local mongod (add --generate to refill it first)
+    python -m loadtest.run --mongo-uri mongodb://localhost:27017 --database ims_load
+
+    # A running server; the database is only read to find ids to ask for
+    python -m loadtest.run --base-url http://localhost:8000 --mongo-uri mongodb://localhost:27017
+
+The request mix is weighted; --mix overrides weights by route key, e.g. --mix dashboard=50,login=0.
+Routes that delete data or rewrite the whole cohort default to weight 0. In-process runs lift the
+per-address, per-app and per-user rate limits unless --throttled is given, so the numbers show capacity rather
+than quotas; load shedding and deadlines stay on as part of the system under test.
+
+The stand-in is for trying the harness and comparing runs, not for absolute numbers: it has no
+change streams, so the live feeds are not started, and it lacks `$lookup` with `let`, so the
+assigned-students routes fail there.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+from bson import ObjectId
+from pymongo import monitoring
+
+from loadtest.generate import APP_ID, APP_KEY, LOGIN_PASSWORD, PLACEMENT_START, PLACEMENT_WEEKS, generate
+
+# Per-session samples of each kind of id; enough variety without loading the whole cohort
+SAMPLE_IDS = 20
+PLACEMENT_END = PLACEMENT_START + timedelta(weeks=PLACEMENT_WEEKS)
+
+
+class Session:
+    """One signed-in supervisor and the ids their requests refer to."""
+
+    def __init__(self, email: str, user_id: str, supervisor_id: str, zone_id: Optional[str], department_id: Optional[str]):
+        self.email = email
+        self.user_id = user_id
+        self.supervisor_id = supervisor_id
+        self.zone_id = zone_id
+        self.department_id = department_id
+        self.token: Optional[str] = None
+        self.students: List[str] = []
+        self.student_users: List[str] = []
+        self.companies: Dict[str, str] = {}
+        self.applications: List[str] = []
+        self.visits: List[str] = []
+        self.logbooks: List[str] = []
+        self.reports: List[str] = []
+        self.lock = asyncio.Lock()
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"X-App-ID": APP_ID, "X-App-Key": APP_KEY}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        return headers
+
+
+Request = Tuple[str, str, dict]
+Builder = Callable[[Session, random.Random], Optional[Request]]
+
+
+def _pick(rng: random.Random, items: list) -> Optional[str]:
+    return rng.choice(items) if items else None
+
+
+def _needs(value, request: Request) -> Optional[Request]:
+    return request if value else None
+
+
+def _pop(items: list) -> Optional[str]:
+    return items.pop() if items else None
+
+
+# key: (label, default weight, builder). Labels are the route templates, as FastAPI records them.
+ROUTES: Dict[str, Tuple[str, float, Builder]] = {
+    "root": ("GET /", 1, lambda s, r: ("GET", "/", {})),
+    "login": ("POST /login", 1, lambda s, r: ("POST", "/login", {"json": {
+        "grant_type": "password", "email": s.email, "password": LOGIN_PASSWORD}})),
+    "logout": ("POST /logout", 0, lambda s, r: ("POST", "/logout", {})),
+    "dashboard": ("GET /dashboard", 20, lambda s, r: ("GET", "/dashboard", {})),
+    "events": ("GET /events", 0, lambda s, r: ("GET", "/events", {"stream": True})),
+    "student_location": ("GET /students/{student_id}/location", 3, lambda s, r: _needs(
+        s.student_users, ("GET", f"/students/{_pick(r, s.student_users)}/location", {}))),
+    "at_company": ("GET /students/{student_id}/at-company/{company_id}", 3, lambda s, r: _needs(s.companies, (
+        lambda student: ("GET", f"/students/{student}/at-company/{s.companies[student]}", {}))(_pick(r, list(s.companies))))),
+    "visit_locations": ("GET /visit-locations", 10, lambda s, r: ("GET", "/visit-locations", {})),
+    "schedule": ("POST /visit-locations/schedule", 0.5, lambda s, r: ("POST", "/visit-locations/schedule", {"params": {
+        "start_date": PLACEMENT_START.isoformat(), "end_date": PLACEMENT_END.isoformat()}})),
+    "reschedule": ("POST /visit-locations/{visit_id}/reschedule", 1, lambda s, r: _needs(
+        s.visits, ("POST", f"/visit-locations/{_pick(r, s.visits)}/reschedule", {"params": {
+            "start_date": PLACEMENT_START.isoformat(), "end_date": PLACEMENT_END.isoformat()}}))),
+    "update_visit": ("PUT /visit-locations/{visit_location_id}", 1, lambda s, r: _needs(
+        s.visits, ("PUT", f"/visit-locations/{_pick(r, s.visits)}", {"json": {
+            "supervisor_id": s.user_id, "notes": "Updated by load test", "status": "Scheduled"}}))),
+    "delete_visit": ("DELETE /visit-locations/{visit_location_id}", 0, lambda s, r: _needs(
+        s.visits, ("DELETE", f"/visit-locations/{_pop(s.visits)}", {}))),
+    "visit_status": ("PUT /visit-locations/{visit_id}/status", 2, lambda s, r: _needs(
+        s.visits, ("PUT", f"/visit-locations/{_pick(r, s.visits)}/status", {"params": {"status": "Completed"}}))),
+    "profile": ("GET /profile", 8, lambda s, r: ("GET", "/profile", {})),
+    "update_profile": ("PUT /profile", 1, lambda s, r: ("PUT", "/profile", {"json": {"position": r.choice(
+        ["Lecturer", "Senior Lecturer"])}})),
+    "delete_profile": ("DELETE /profile", 0, lambda s, r: ("DELETE", "/profile", {})),
+    "daily_logs": ("GET /logs/{student_id}/{log_type}", 10, lambda s, r: _needs(
+        s.students, ("GET", f"/logs/{_pick(r, s.students)}/daily", {}))),
+    "monthly_logs": ("GET /logs/{student_id}/{log_type}", 3, lambda s, r: _needs(
+        s.students, ("GET", f"/logs/{_pick(r, s.students)}/monthly", {}))),
+    "mark_log": ("PUT /logs/{logbook_id}/mark", 4, lambda s, r: _needs(
+        s.logbooks, ("PUT", f"/logs/{_pick(r, s.logbooks)}/mark", {"params": {"status": "Approved", "comments": "Seen"}}))),
+    "create_report": ("POST /final-reports", 1, lambda s, r: _needs(
+        s.students, ("POST", "/final-reports", {"params": {"student_id": _pick(r, s.students)}, "json": {
+            "executive_summary": "Load test report", "status": "Submitted"}}))),
+    "update_report": ("PUT /final-reports/{report_id}", 1, lambda s, r: _needs(
+        s.reports, ("PUT", f"/final-reports/{_pick(r, s.reports)}", {"json": {"status": "Reviewed"}}))),
+    "report": ("GET /final-reports/{report_id}", 4, lambda s, r: _needs(
+        s.reports, ("GET", f"/final-reports/{_pick(r, s.reports)}", {}))),
+    "delete_report": ("DELETE /final-reports/{report_id}", 0, lambda s, r: _needs(
+        s.reports, ("DELETE", f"/final-reports/{_pop(s.reports)}", {}))),
+    "evaluation": ("POST /evaluations", 1, lambda s, r: _needs(
+        s.applications, ("POST", "/evaluations", {"params": {"application_id": _pick(r, s.applications)}, "json": {
+            "evaluation_type": "Visit", "total_score": r.randint(50, 100), "max_total_score": 100,
+            "criteria": [{"criterion": "Punctuality", "score": r.randint(5, 10), "max_score": 10, "weight": 1}]}}))),
+    "assigned_students": ("GET /supervisors/{supervisor_id}/assigned-students", 5, lambda s, r: (
+        "GET", f"/supervisors/{s.supervisor_id}/assigned-students", {})),
+    "workload": ("GET /supervisors/{supervisor_id}/workload", 3, lambda s, r: (
+        "GET", f"/supervisors/{s.supervisor_id}/workload", {})),
+    "distance_matrix": ("POST /zones/{zone_id}/distance-matrix", 0.2, lambda s, r: _needs(
+        s.zone_id, ("POST", f"/zones/{s.zone_id}/distance-matrix", {}))),
+    "assignments": ("POST /assignments", 0, lambda s, r: ("POST", "/assignments", {"params": {
+        "department_id": s.department_id}} if s.department_id else {})),
+    "balance": ("GET /assignments/balance", 1, lambda s, r: ("GET", "/assignments/balance", {})),
+    "markers": ("GET /map/markers", 3, lambda s, r: ("GET", "/map/markers", {"params": {
+        "min_lat": 4.5, "min_lon": -3.3, "max_lat": 11.2, "max_lon": 1.2, "zoom": r.randint(6, 12)}})),
+    "ghanapost": ("GET /geocode/ghanapost", 2, lambda s, r: ("GET", "/geocode/ghanapost", {"params": {
+        "address": r.choice(["GA-183-8164", "AK-039-5028", "WS-001-2345", "CP-123-4567"])}})),
+    "home_towns": ("POST /geocode/home-towns", 0, lambda s, r: ("POST", "/geocode/home-towns", {})),
+    "attendance": ("GET /attendance", 2, lambda s, r: ("GET", "/attendance", {"params": {
+        "start_date": PLACEMENT_START.isoformat(), "end_date": (PLACEMENT_START + timedelta(weeks=2)).isoformat()}})),
+    "reference": ("GET /reference", 2, lambda s, r: ("GET", "/reference", {})),
+    "zones": ("GET /reference/zones", 2, lambda s, r: ("GET", "/reference/zones", {})),
+    "faculties": ("GET /reference/faculties", 2, lambda s, r: ("GET", "/reference/faculties", {})),
+    "metrics": ("GET /metrics", 1, lambda s, r: ("GET", "/metrics", {})),
+    "profiles": ("GET /admin/profiles", 0, lambda s, r: ("GET", "/admin/profiles", {})),
+    "collapsed_profiles": ("GET /admin/profiles/collapsed", 0, lambda s, r: ("GET", "/admin/profiles/collapsed", {})),
+    "slow_queries": ("GET /admin/slow-queries", 0, lambda s, r: ("GET", "/admin/slow-queries", {})),
+    "legacy_assigned_students": ("GET /supervisor/{supervisor_id}/assigned-students", 2, lambda s, r: (
+        "GET", f"/supervisor/{s.supervisor_id}/assigned-students", {})),
+}
+
+
+def parse_mix(text: Optional[str]) -> Dict[str, float]:
+    weights = {key: weight for key, (_, weight, _) in ROUTES.items()}
+    for part in filter(None, (text or "").split(",")):
+        key, _, weight = part.partition("=")
+        if key.strip() not in ROUTES:
+            raise SystemExit(f"Unknown route key {key!r}; choose from {', '.join(ROUTES)}")
+        weights[key.strip()] = float(weight)
+    return {key: weight for key, weight in weights.items() if weight > 0}
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+
+    def record(self, key: str, status: int, seconds: float):
+        self.latencies[key].append(seconds)
+        self.statuses[key][status] += 1
+
+    @staticmethod
+    def percentile(ordered: List[float], fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+    def summary(self, elapsed: float) -> List[dict]:
+        rows = []
+        for key in sorted(self.latencies, key=lambda key: -len(self.latencies[key])):
+            ordered = sorted(self.latencies[key])
+            statuses = self.statuses[key]
+            rows.append({
+                "route": key,
+                "label": ROUTES[key][0],
+                "requests": len(ordered),
+                "per_second": round(len(ordered) / elapsed, 2),
+                "ok": sum(count for status, count in statuses.items() if status < 400),
+                "statuses": dict(sorted(statuses.items())),
+                "p50_ms": round(self.percentile(ordered, 0.50) * 1e3, 2),
+                "p95_ms": round(self.percentile(ordered, 0.95) * 1e3, 2),
+                "p99_ms": round(self.percentile(ordered, 0.99) * 1e3, 2),
+                "max_ms": round(ordered[-1] * 1e3, 2),
+            })
+        return rows
+
+
+async def load_sessions(db, count: int, seed: int) -> List[Session]:
+    """Pick supervisors with students and collect ids for their requests."""
+    rng = random.Random(seed)
+    supervisors = await db.school_supervisors.find(
+        {"assigned_students.0": {"$exists": True}}, {"user_id": 1, "zone_id": 1, "department_id": 1, "assigned_students": 1}
+    ).limit(count).to_list(None)
+    sessions = []
+    for supervisor in supervisors:
+        user = await db.users.find_one({"_id": ObjectId(supervisor["user_id"])}, {"email": 1})
+        if not user:
+            continue
+        session = Session(user["email"], str(user["_id"]), str(supervisor["_id"]),
+                          str(supervisor["zone_id"]) if supervisor.get("zone_id") else None,
+                          str(supervisor["department_id"]) if supervisor.get("department_id") else None)
+        student_ids = rng.sample(supervisor["assigned_students"], min(SAMPLE_IDS, len(supervisor["assigned_students"])))
+        for student in await db.students.find({"_id": {"$in": student_ids}}, {"user_id": 1, "internships": 1}).to_list(None):
+            session.students.append(str(student["_id"]))
+            session.student_users.append(str(student["user_id"]))
+            if student.get("internships"):
+                internship = await db.internships.find_one({"_id": student["internships"][0]}, {"company_id": 1})
+                if internship:
+                    session.companies[str(student["_id"])] = str(internship["company_id"])
+        session.applications = [str(document["_id"]) for document in await db.applications.find(
+            {"student_id": {"$in": student_ids}}, {"_id": 1}).to_list(SAMPLE_IDS)]
+        session.visits = [str(document["_id"]) for document in await db.visit_locations.find(
+            {"supervisor_id": user["_id"]}, {"_id": 1}).limit(SAMPLE_IDS).to_list(None)]
+        session.logbooks = [str(document["_id"]) for document in await db.logbook_entries.find(
+            {"student_id": {"$in": student_ids}}, {"_id": 1}).limit(SAMPLE_IDS).to_list(None)]
+        session.reports = [str(document["_id"]) for document in await db.attachment_reports.find(
+            {"student_id": {"$in": student_ids}}, {"_id": 1}).limit(SAMPLE_IDS).to_list(None)]
+        sessions.append(session)
+    return sessions
+
+
+async def send(client: httpx.AsyncClient, session: Session, request: Request, admin_token: Optional[str]) -> int:
+    method, url, options = request
+    headers = session.headers()
+    if admin_token:
+        headers["X-Admin-Token"] = admin_token
+    if method in ("POST", "PUT", "PATCH"):
+        # As a browser client sends on every write, body or not; the app rejects writes without it
+        headers["Content-Type"] = "application/json"
+    if options.pop("stream", False):
+        # Long-lived streams: time to the response head, then hang up
+        async with client.stream(method, url, headers=headers, **options) as response:
+            return response.status_code
+    response = await client.request(method, url, headers=headers, **options)
+    await response.aread()
+    return response.status_code
+
+
+async def login(client: httpx.AsyncClient, session: Session, recorder: Recorder) -> bool:
+    async with session.lock:
+        if session.token:
+            return True
+        _, url, options = ROUTES["login"][2](session, None)
+        started = time.perf_counter()
+        response = await client.post(url, headers=session.headers(), **options)
+        recorder.record("login", response.status_code, time.perf_counter() - started)
+        if response.status_code == 200:
+            session.token = response.json()["access_token"]
+        return session.token is not None
+
+
+async def worker(number: int, client, sessions: List[Session], weights: Dict[str, float], recorder: Recorder,
+                 deadline: float, remaining: List[int], seed: int, admin_token: Optional[str]):
+    rng = random.Random(seed * 1000 + number)
+    keys, cumulative = list(weights), list(weights.values())
+    while time.monotonic() < deadline and remaining[0] > 0:
+        remaining[0] -= 1
+        session = rng.choice(sessions)
+        if not session.token and not await login(client, session, recorder):
+            continue
+        key = rng.choices(keys, cumulative)[0]
+        request = ROUTES[key][2](session, rng)
+        if request is None:
+            continue
+        started = time.perf_counter()
+        try:
+            status = await send(client, session, request, admin_token)
+        except httpx.HTTPError:
+            status = 599
+        recorder.record(key, status, time.perf_counter() - started)
+        if key == "logout" and status == 200:
+            session.token = None
+
+
+async def open_app(args, listeners: Sequence[monitoring.CommandListener] = ()):
+    """
+    The app in this process and the database it reads, started the way the lifespan would.
+
+    `listeners` are handed to the in-memory stand-in; see fake_client_class. Against a real
+    server, register them with pymongo.monitoring instead.
+    """
+    if args.fake:
+        import motor.motor_asyncio
+        # Must happen before the services create their clients
+        motor.motor_asyncio.AsyncIOMotorClient = fake_client_class(listeners)
+
+    import main
+    from middleware.rateLimit import use_backend
+    from services import service, attendance, reference, slowqueries
+
+    if args.generate or args.fake:
+        await generate(service.db, args.seed, args.scale)
+    if not args.throttled:
+        use_backend(Unthrottled())
+    # Request logs would drown the report
+    logging.getLogger("middleware.log").setLevel(logging.WARNING)
+
+    if args.fake:
+        # No change streams, capped collections or tailable cursors in the stand-in; run only the
+        # startup that request handling depends on
+        await service.ensure_indexes()
+        await attendance.ensure_indexes()
+        await reference.registry.load(service.db)
+        slowqueries.listener.start(service.db)
+        lifespan = None
+    else:
+        lifespan = main.app.router.lifespan_context(main.app)
+        await lifespan.__aenter__()
+
+    async def close():
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    # An unhandled error is a 500 to the client, as under a server, not an exception in the driver
+    transport = httpx.ASGITransport(app=main.app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=120), service.db, close
+
+
+# Driver defaults: the first reply of a cursor holds up to 101 documents, and without a batch size
+# a getMore returns the rest (up to 16 MB, more than any route reads here)
+FIRST_BATCH = 101
+# Stand-in collection methods and the server command each one is sent as
+FAKE_COMMANDS = {
+    "find_one": "find", "count_documents": "aggregate", "estimated_document_count": "count",
+    "distinct": "distinct", "insert_one": "insert", "insert_many": "insert", "replace_one": "update",
+    "update_one": "update", "update_many": "update", "bulk_write": "update", "delete_one": "delete",
+    "delete_many": "delete", "find_one_and_update": "findAndModify", "find_one_and_replace": "findAndModify",
+    "find_one_and_delete": "findAndModify", "create_index": "createIndexes",
+}
+# Reported as the server address of the stand-in's commands
+FAKE_ADDRESS = ("fake", 27017)
+
+
+def _fake_reply(command: str, result) -> dict:
+    """The parts of the server's reply to one stand-in call that listeners read."""
+    if command == "findAndModify":
+        return {"value": result, "ok": 1.0}
+    if command in ("find", "aggregate"):
+        # find_one, and count_documents' single $group result
+        batch = [] if result is None else [result if command == "find" else {"n": result}]
+        return {"cursor": {"firstBatch": batch, "id": 0}, "ok": 1.0}
+    return {"ok": 1.0}
+
+
+def fake_client_class(listeners: Sequence[monitoring.CommandListener] = ()):
+    """
+    mongomock-motor's client, with databases whose `with_options` stays asynchronous.
+
+    The stand-in has no raw BSON codec, so the raw-document database in services.service reads
+    plain dicts there; the routes using it return the same JSON either way.
+
+    `listeners` are sent pymongo's command events for each round trip the real driver would
+    make for the same calls: one command per collection method, and for cursors a find or
+    aggregate with the first batch followed by getMores for the rest. The commands carry only
+    their name and collection, and replies only the documents returned.
+    """
+    try:
+        from bson.raw_bson import RawBSONDocument
+        from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection, AsyncMongoMockDatabase
+    except ImportError:
+        raise SystemExit("--fake needs mongomock-motor: pip install mongomock-motor")
+
+    request_ids = itertools.count(1)
+
+    def round_trip(database: str, command: dict, seconds: float, reply: dict = None, failure: dict = None):
+        request_id = next(request_ids)
+        name = next(iter(command))
+        duration = timedelta(seconds=seconds)
+        for listener in listeners:
+            listener.started(monitoring.CommandStartedEvent(command, database, request_id, FAKE_ADDRESS, request_id))
+            if failure is None:
+                listener.succeeded(monitoring.CommandSucceededEvent(
+                    duration, reply, name, request_id, FAKE_ADDRESS, request_id, database_name=database))
+            else:
+                listener.failed(monitoring.CommandFailedEvent(
+                    duration, failure, name, request_id, FAKE_ADDRESS, request_id, database_name=database))
+
+    class Cursor:
+        """Fetches everything on first use and reports it batch by batch."""
+
+        def __init__(self, cursor, command: str, collection):
+            self._cursor = cursor
+            self._command = command
+            self._collection = collection
+            self._batch_size = 0
+            self._items = None
+
+        def __getattr__(self, name):
+            attribute = getattr(self._cursor, name)
+            if not callable(attribute):
+                return attribute
+
+            def call(*args, **kwargs):
+                result = attribute(*args, **kwargs)
+                # Chained modifiers return the cursor; keep callers on the counting wrapper
+                return self if result is self._cursor else result
+            return call
+
+        def batch_size(self, size: int):
+            self._batch_size = size
+            self._cursor.batch_size(size)
+            return self
+
+        async def _fetch(self) -> list:
+            if self._items is None:
+                database, name = self._collection.database.name, self._collection.name
+                started = time.perf_counter()
+                try:
+                    self._items = await self._cursor.to_list(None)
+                except Exception as e:
+                    round_trip(database, {self._command: name}, time.perf_counter() - started,
+                               failure={"errmsg": str(e), "ok": 0.0})
+                    raise
+                seconds = time.perf_counter() - started
+                first = min(len(self._items), self._batch_size or FIRST_BATCH)
+                # A cursor id other than 0 tells the client there is more to fetch
+                cursor_id = int(first < len(self._items))
+                round_trip(database, {self._command: name}, seconds,
+                           {"cursor": {"firstBatch": self._items[:first], "id": cursor_id}, "ok": 1.0})
+                sent = first
+                while sent < len(self._items):
+                    batch = self._items[sent:sent + self._batch_size] if self._batch_size else self._items[sent:]
+                    sent += len(batch)
+                    round_trip(database, {"getMore": cursor_id, "collection": name}, 0.0,
+                               {"cursor": {"nextBatch": batch, "id": int(sent < len(self._items))}, "ok": 1.0})
+            return self._items
+
+        def __aiter__(self):
+            return self
+
+        async def next(self):
+            items = await self._fetch()
+            if not items:
+                raise StopAsyncIteration()
+            return items.pop(0)
+
+        __anext__ = next
+
+        async def to_list(self, *args, **kwargs) -> list:
+            items, self._items = await self._fetch(), []
+            return items
+
+    def counted(method: str, command: str):
+        original = getattr(AsyncMongoMockCollection, method)
+
+        async def wrapper(self, *args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = await original(self, *args, **kwargs)
+            except Exception as e:
+                round_trip(self.database.name, {command: self.name}, time.perf_counter() - started,
+                           failure={"errmsg": str(e), "ok": 0.0})
+                raise
+            round_trip(self.database.name, {command: self.name}, time.perf_counter() - started,
+                       _fake_reply(command, result))
+            return result
+        return wrapper
+
+    collection_class = AsyncMongoMockCollection
+    if listeners:
+        class Collection(AsyncMongoMockCollection):
+            def find(self, *args, **kwargs):
+                return Cursor(super().find(*args, **kwargs), "find", self)
+
+            def aggregate(self, *args, **kwargs):
+                return Cursor(super().aggregate(*args, **kwargs), "aggregate", self)
+
+        for method, command in FAKE_COMMANDS.items():
+            setattr(Collection, method, counted(method, command))
+        collection_class = Collection
+
+    class Database(AsyncMongoMockDatabase):
+        def with_options(self, codec_options=None, **kwargs):
+            if codec_options is not None and codec_options.document_class is RawBSONDocument:
+                codec_options = None
+            options = self.delegate.with_options(codec_options=codec_options, **kwargs)
+            return Database(self.client, options)
+
+        def get_collection(self, *args, **kwargs):
+            return collection_class(self, self.delegate.get_collection(*args, **kwargs))
+
+    class Client(AsyncMongoMockClient):
+        def get_database(self, *args, **kwargs):
+            return Database(self, super().get_database(*args, **kwargs).delegate)
+
+    return Client
+
+
+class Unthrottled:
+    """Rate-limit backend that admits everything; see middleware.rateLimit.LocalBackend."""
+
+    def take(self, keys, cost):
+        return None, 0.0
+
+
+async def run(args):
+    os.environ.setdefault("MONGODB_URI", args.mongo_uri)
+    os.environ.setdefault("DATABASE_NAME", args.database)
+    os.environ.setdefault("SECRET_KEY", "loadtest")
+    weights = parse_mix(args.mix)
+
+    if args.base_url:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        db = AsyncIOMotorClient(args.mongo_uri)[args.database]
+        if args.generate:
+            await generate(db, args.seed, args.scale)
+        client, close = httpx.AsyncClient(base_url=args.base_url, timeout=120), None
+    else:
+        client, db, close = await open_app(args)
+
+    sessions = await load_sessions(db, args.users, args.seed)
+    if not sessions:
+        raise SystemExit("No supervisors with assigned students; generate data first")
+    recorder = Recorder()
+    print(f"{len(sessions)} supervisors, {args.concurrency} concurrent clients, "
+          f"{args.duration}s or {args.requests} requests, {len(weights)} routes in the mix")
+    started = time.monotonic()
+    remaining = [args.requests]
+    async with client:
+        await asyncio.gather(*(
+            worker(number, client, sessions, weights, recorder, started + args.duration, remaining, args.seed,
+                   args.admin_token)
+            for number in range(args.concurrency)
+        ))
+    elapsed = time.monotonic() - started
+    if close is not None:
+        await close()
+
+    rows = recorder.summary(elapsed)
+    total = sum(row["requests"] for row in rows)
+    print(f"\n{total} requests in {elapsed:.1f}s, {total / elapsed:.1f}/s")
+    print(f"{'route':<58}{'count':>7}{'/s':>8}{'ok':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}  statuses")
+    for row in rows:
+        label = f"{row['label']} [{row['route']}]"
+        print(f"{label:<58}{row['requests']:>7}{row['per_second']:>8.1f}{row['ok']:>7}"
+              f"{row['p50_ms']:>9.1f}{row['p95_ms']:>9.1f}{row['p99_ms']:>9.1f}  {row['statuses']}")
+    if args.json:
+        with open(args.json, "w") as output:
+            json.dump({"elapsed": elapsed, "requests": total, "routes": rows}, output, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--fake", action="store_true", help="Run the app on an in-memory Mongo stand-in")
+    parser.add_argument("--base-url", help="Load a running server instead of the app in this process")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017")
+    parser.add_argument("--database", default="ims_load")
+    parser.add_argument("--generate", action="store_true", help="Refill the database before the run")
+    parser.add_argument("--scale", type=float, default=None, help="Cohort size multiplier (default 1, or 0.01 with --fake)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=50, help="Supervisors to sign in as")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run")
+    parser.add_argument("--requests", type=int, default=10**9, help="Stop after this many requests")
+    parser.add_argument("--mix", help="Comma-separated key=weight overrides")
+    parser.add_argument("--throttled", action="store_true", help="Keep the production rate limits")
+    parser.add_argument("--admin-token", help="Sent with every request, for the /admin routes")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+    if args.scale is None:
+        args.scale = 0.01 if args.fake else 1.0
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
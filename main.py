@@ -1,16 +1,45 @@
-from fastapi import FastAPI, Depends, HTTPException, status,Request
+from fastapi import FastAPI, Depends, HTTPException, status,Request, Query
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
+from pymongo.errors import PyMongoError
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from typing import List, Optional
+from datetime import datetime
 from database.models import User, Student, SchoolSupervisor, Evaluation, Notification, VisitLocation, Token, LogBookEntry, MonthlySummary, FinalAssessment, AttachmentReport
-from services import service
-from middleware.log import log_middleware
+from services import service, scheduler, assignment, markers, ghanapost, realtime, attendance, metrics, etags, reference, invalidation, executor, loopmonitor, slowqueries
+from services.profiler import profiler
+from services.responses import BSONJSONResponse, stream_json_array
+from middleware.log import log_middleware, configure_logging
 from middleware.auth import auth_middleware
 from middleware.requestValidity import request_validity_middleware
-from database.config import get_database
+from middleware.rateLimit import rate_limit_middleware, use_backend, MongoBackend
+from middleware.loadShedding import load_shedding_middleware
+from middleware.deadline import DeadlineMiddleware
+from middleware.profiling import ProfilingMiddleware
+from database.config import get_database, RATE_LIMIT_BACKEND, ADMIN_TOKEN, PROFILE_SAMPLE_RATE
 from pydantic import BaseModel, EmailStr
-
-app = FastAPI(title="Supervisor API", description="API for managing supervisor activities in the internship system")
+from contextlib import asynccontextmanager
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    stop_logging = configure_logging()
+    await service.ensure_indexes()
+    await attendance.ensure_indexes()
+    await reference.registry.load(service.db)
+    slowqueries.listener.start(service.db)
+    feeds = realtime.start_feeds() + attendance.engine.start() + [reference.registry.start(), loopmonitor.monitor.start()]
+    feeds.append(await invalidation.bus.start(service.db))
+    if RATE_LIMIT_BACKEND == "mongo":
+        rate_limits = MongoBackend(service.db.rate_limits)
+        use_backend(rate_limits)
+        feeds.append(await rate_limits.start())
+    yield
+    for feed in feeds:
+        feed.cancel()
+    executor.shutdown()
+    stop_logging()
+
+app = FastAPI(title="Supervisor API", description="API for managing supervisor activities in the internship system", lifespan=lifespan, default_response_class=BSONJSONResponse)
 
 # Add CORS middleware
 app.add_middleware(
@@ -25,6 +54,15 @@ app.add_middleware(
 app.middleware("http")(log_middleware)
 app.middleware("http")(auth_middleware)
 app.middleware("http")(request_validity_middleware)
+# Added last so it runs first, before auth spends a database round trip on the request
+app.middleware("http")(rate_limit_middleware)
+# Outermost: sheds work before any other middleware spends time on it
+app.middleware("http")(load_shedding_middleware)
+# Not registered at all unless profiles can be asked for
+if ADMIN_TOKEN or PROFILE_SAMPLE_RATE:
+    app.add_middleware(ProfilingMiddleware)
+# The deadline covers everything above, queueing for a slot included
+app.add_middleware(DeadlineMiddleware)
 
 class CustomLoginRequest(BaseModel):
     grant_type: str
@@ -55,27 +93,48 @@ async def login_for_access_token(request:Request,Login_request: CustomLoginReque
     return access_token
 
 @app.post("/logout", summary="Logout and invalidate the current token")
-async def logout_user(current_user: User = Depends(service.get_current_active_supervisor)):
-    await service.logout(current_user.token)
+async def logout_user(token: str = Depends(service.oauth2_scheme), current_user: User = Depends(service.get_current_active_supervisor)):
+    await service.logout(token)
     return {"message": "Successfully logged out"}
 
 @app.get("/dashboard", summary="Get supervisor dashboard information")
-async def dashboard(current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.get_supervisor_dashboard(str(current_user.id))
+async def dashboard(request: Request, fields: Optional[str] = Query(None, description="Comma-separated student fields, or * for whole documents"), current_user: User = Depends(service.get_current_active_supervisor)):
+    return etags.content_conditional(request, await service.get_supervisor_dashboard(str(current_user.id), fields))
+
 
+@app.get("/events", summary="Stream live locations, notifications and logbook submissions")
+async def events_endpoint(request: Request, current_user: User = Depends(service.get_current_active_supervisor)):
+    topics = await realtime.supervisor_topics(str(current_user.id))
+    subscription = realtime.hub.connect(topics)
+    return StreamingResponse(
+        realtime.event_stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.get("/students/{student_id}/location", summary="Get student's current location")
 async def get_student_location_endpoint(student_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.get_student_location(student_id)
+    return BSONJSONResponse(await service.get_student_location(student_id))
 
 @app.get("/students/{student_id}/at-company/{company_id}", summary="Check if student is at company")
 async def is_student_at_company_endpoint(student_id: str, company_id: str, max_distance: float = 200, current_user: User = Depends(service.get_current_active_supervisor)):
     return await service.is_student_at_company(student_id, company_id, max_distance)
 
 @app.get("/visit-locations", summary="Get visit locations")
-async def visit_locations(current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.get_visit_locations(str(current_user.id))
+async def visit_locations(request: Request, fields: Optional[str] = Query(None, description="Comma-separated visit fields"), current_user: User = Depends(service.get_current_active_supervisor)):
+    supervisor_id = str(current_user.id)
+    return await etags.conditional(
+        request, await service.get_visit_locations_version(supervisor_id),
+        lambda: service.get_visit_locations(supervisor_id, fields)
+    )
 
+@app.post("/visit-locations/schedule", summary="Plan pending visits across the supervision period")
+async def schedule_visit_locations_endpoint(start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, max_visits_per_day: int = scheduler.DEFAULT_MAX_VISITS_PER_DAY, max_km_per_day: float = scheduler.DEFAULT_MAX_KM_PER_DAY, incremental: bool = True, current_user: User = Depends(service.get_current_active_supervisor)):
+    return await scheduler.schedule_visits(str(current_user.id), start_date, end_date, max_visits_per_day, max_km_per_day, incremental)
+
+@app.post("/visit-locations/{visit_id}/reschedule", summary="Re-plan a single visit")
+async def reschedule_visit_location_endpoint(visit_id: str, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None, max_visits_per_day: int = scheduler.DEFAULT_MAX_VISITS_PER_DAY, max_km_per_day: float = scheduler.DEFAULT_MAX_KM_PER_DAY, current_user: User = Depends(service.get_current_active_supervisor)):
+    return await scheduler.reschedule_visit(str(current_user.id), visit_id, start_date=start_date, end_date=end_date, max_visits_per_day=max_visits_per_day, max_km_per_day=max_km_per_day)
 
 @app.put("/visit-locations/{visit_location_id}", summary="Update a visit location")
 async def update_visit_location_endpoint(visit_location_id: str, visit_location: VisitLocation, current_user: User = Depends(service.get_current_active_supervisor)):
@@ -90,9 +149,12 @@ async def update_visit_status_endpoint(visit_id: str, status: str, current_user:
     return await service.update_visit_status(visit_id, status)
 
 @app.get("/profile", summary="Get supervisor profile")
-async def get_profile(current_user: User = Depends(service.get_current_active_supervisor)):
-    
-    return await service.get_supervisor_profile(str(current_user.id))
+async def get_profile(request: Request, current_user: User = Depends(service.get_current_active_supervisor)):
+    supervisor_id = str(current_user.id)
+    return await etags.conditional(
+        request, await service.get_supervisor_profile_version(supervisor_id),
+        lambda: service.get_supervisor_profile(supervisor_id)
+    )
 @app.put("/profile", summary="Update supervisor profile")
 async def update_profile(profile_data: dict, current_user: User = Depends(service.get_current_active_supervisor)):
     return await service.update_supervisor_profile(str(current_user.id), profile_data)
@@ -102,8 +164,10 @@ async def delete_profile(current_user: User = Depends(service.get_current_active
     return await service.delete_supervisor(str(current_user.id))
 
 @app.get("/logs/{student_id}/{log_type}", summary="View student logs")
-async def get_student_logs(student_id: str, log_type: str, current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.view_student_logs(student_id, log_type)
+async def get_student_logs(student_id: str, log_type: str, fields: Optional[str] = Query(None, description="Comma-separated log fields"), current_user: User = Depends(service.get_current_active_supervisor)):
+    return StreamingResponse(
+        stream_json_array(service.student_logs_cursor(student_id, log_type, fields)), media_type="application/json"
+    )
 
 @app.put("/logs/{logbook_id}/mark", summary="Mark logbook entry")
 async def mark_logbook_entry(logbook_id: str, status: str, comments: Optional[str] = None, current_user: User = Depends(service.get_current_active_supervisor)):
@@ -118,8 +182,10 @@ async def update_final_report_endpoint(report_id: str, report_data: dict, curren
     return await service.update_final_report(report_id, report_data)
 
 @app.get("/final-reports/{report_id}", summary="Get final report")
-async def get_final_report_endpoint(report_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.get_final_report(report_id)
+async def get_final_report_endpoint(request: Request, report_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
+    return await etags.conditional(
+        request, await service.get_final_report_version(report_id), lambda: service.get_final_report(report_id)
+    )
 
 @app.delete("/final-reports/{report_id}", summary="Delete final report")
 async def delete_final_report_endpoint(report_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
@@ -132,12 +198,78 @@ async def create_evaluation_endpoint(application_id: str, evaluation_data: dict,
 
 @app.get("/supervisors/{supervisor_id}/assigned-students", summary="Get assigned students")
 async def get_assigned_students_endpoint(supervisor_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
-    return await service.get_assigned_students(supervisor_id)
+    return BSONJSONResponse(await service.get_assigned_students(supervisor_id))
 
 @app.get("/supervisors/{supervisor_id}/workload", summary="Get supervisor workload")
 async def get_supervisor_workload_endpoint(supervisor_id: str, current_user: User = Depends(service.get_current_active_supervisor)):
     return await service.get_supervisor_workload(supervisor_id)
 
+@app.post("/zones/{zone_id}/distance-matrix", summary="Precompute site distances for a zone in the background", dependencies=[Depends(service.require_admin)])
+async def precompute_zone_distances_endpoint(zone_id: str):
+    return scheduler.schedule_zone_distance_precompute(zone_id)
+
+@app.post("/assignments", summary="Assign students to supervisors by department, zone and workload", dependencies=[Depends(service.require_admin)])
+async def assign_students_endpoint(department_id: Optional[str] = None, student_ids: Optional[List[str]] = Query(None), rebalance: bool = False):
+    return await assignment.assign_students(department_id, student_ids, rebalance)
+
+@app.get("/assignments/balance", summary="Report how evenly students are spread across supervisors")
+async def assignment_balance_endpoint(department_id: Optional[str] = None, current_user: User = Depends(service.get_current_active_supervisor)):
+    return await assignment.get_assignment_balance(department_id)
+
+@app.get("/map/markers", summary="Get clustered map markers for a bounding box and zoom level")
+async def map_markers_endpoint(min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int, assigned_only: bool = False, current_user: User = Depends(service.get_current_active_supervisor)):
+    supervisor_id = str(current_user.id) if assigned_only else None
+    return await markers.get_map_markers(min_lat, min_lon, max_lat, max_lon, zoom, supervisor_id)
+
+@app.get("/geocode/ghanapost", summary="Resolve a GhanaPostGPS digital address offline")
+async def decode_ghanapost_endpoint(address: str, current_user: User = Depends(service.get_current_active_supervisor)):
+    location = ghanapost.decode_with_precision(address)
+    if location is None:
+        raise HTTPException(status_code=404, detail="Digital address could not be resolved")
+    return location
+
+@app.post("/geocode/home-towns", summary="Estimate missing home town coordinates from digital addresses", dependencies=[Depends(service.require_admin)])
+async def backfill_home_towns_endpoint():
+    return await ghanapost.backfill_home_coordinates()
+
+@app.get("/attendance", summary="Get daily attendance for the supervisor's students")
+async def attendance_endpoint(start_date: datetime, end_date: datetime, current_user: User = Depends(service.get_current_active_supervisor)):
+    return BSONJSONResponse(await attendance.get_cohort_attendance(str(current_user.id), start_date, end_date))
+
+
+@app.get("/reference", summary="Zones and the faculty, department and programme tree")
+async def reference_endpoint(request: Request, current_user: User = Depends(service.get_current_active_supervisor)):
+    data = reference.registry.current
+    return await etags.conditional(request, data.version, lambda: {"zones": data.zone_list(), "faculties": data.tree})
+
+@app.get("/reference/zones", summary="List zones")
+async def reference_zones_endpoint(request: Request, current_user: User = Depends(service.get_current_active_supervisor)):
+    data = reference.registry.current
+    return await etags.conditional(request, data.version, data.zone_list)
+
+@app.get("/reference/faculties", summary="Faculties with their departments and programmes")
+async def reference_faculties_endpoint(request: Request, current_user: User = Depends(service.get_current_active_supervisor)):
+    data = reference.registry.current
+    return await etags.conditional(request, data.version, lambda: data.tree)
+
+@app.get("/metrics", summary="Prometheus metrics for this worker", response_class=PlainTextResponse)
+async def metrics_endpoint(current_user: User = Depends(service.get_current_active_supervisor)):
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/profiles", summary="Recorded request profiles, newest last", dependencies=[Depends(service.require_admin)])
+async def list_profiles(route: Optional[str] = Query(None, description="Route template, e.g. /dashboard")):
+    return [profile.summary() for profile in profiler.find(route)]
+
+@app.get("/admin/profiles/collapsed", summary="Collapsed stacks for flamegraph tools", response_class=PlainTextResponse, dependencies=[Depends(service.require_admin)])
+async def collapsed_profiles(route: Optional[str] = Query(None, description="Route template, e.g. /dashboard"), profile_id: Optional[int] = None):
+    profiles = profiler.find(route, profile_id)
+    if not profiles:
+        raise HTTPException(status_code=404, detail="No matching profiles")
+    return PlainTextResponse(profiler.collapsed(profiles))
+
+@app.get("/admin/slow-queries", summary="Slow Mongo command shapes with their plans, slowest total first", dependencies=[Depends(service.require_admin)])
+async def slow_queries():
+    return slowqueries.listener.report()
 
 @app.get("/supervisor/{supervisor_id}/assigned-students", response_model=List[dict])
 async def get_supervisor_students(supervisor_id: str):
@@ -157,9 +289,9 @@ async def get_supervisor_students(supervisor_id: str):
     """
     try:
         students = await service.get_assigned_students(supervisor_id)
-        return students
-    except HTTPException as http_ex:
-        raise http_ex
+        return BSONJSONResponse(students)
+    except (HTTPException, PyMongoError):
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An unexpected error occurred: {str(e)}")
 
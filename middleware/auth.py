@@ -1,6 +1,7 @@
 from fastapi import Request, Response
 from starlette.status import HTTP_401_UNAUTHORIZED
 from services.service import verify_app_credentials, is_token_blacklisted
+from middleware.rateLimit import app_verified
 
 async def auth_middleware(request: Request, call_next):
     # List of paths that don't require authentication
@@ -21,6 +22,8 @@ async def auth_middleware(request: Request, call_next):
     # Verify application credentials
     if not await verify_app_credentials(app_id, app_key):
         return Response(content="Unauthorized: Invalid application credentials", status_code=HTTP_401_UNAUTHORIZED)
+    # From now on the rate limiter charges this app's own bucket
+    app_verified(app_id, app_key)
     
     # Check Authorization header for token
     authorization = request.headers.get("Authorization")
@@ -0,0 +1,94 @@
+# middleware/deadline.py
+import asyncio
+import contextvars
+import time
+from typing import Optional
+import pymongo
+from pymongo.errors import PyMongoError
+from fastapi import Response
+from starlette.status import HTTP_504_GATEWAY_TIMEOUT
+from services import metrics
+
+DEFAULT_BUDGET_SECONDS = 10.0
+# Latency budget by path prefix; the first match wins
+ROUTE_BUDGETS = (
+    ("/assignments", 60.0),
+    ("/visit-locations/schedule", 30.0),
+    ("/geocode/home-towns", 60.0),
+    ("/login", 5.0),
+    ("/profile", 5.0),
+    ("/reference", 5.0),
+)
+# Long-lived streams have no deadline
+EXEMPT_PATHS = {"/events"}
+
+expired_total = metrics.counter("request_deadline_expired_total", "Requests stopped at their deadline", ("source",))
+
+# Absolute time.monotonic() deadline of the request being handled
+current_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("current_deadline", default=None)
+
+
+def route_budget(path: str) -> float:
+    for prefix, budget in ROUTE_BUDGETS:
+        if path.startswith(prefix):
+            return budget
+    return DEFAULT_BUDGET_SECONDS
+
+
+def remaining() -> Optional[float]:
+    """Seconds left for the current request, or None outside of one."""
+    deadline = current_deadline.get()
+    return None if deadline is None else max(deadline - time.monotonic(), 0.0)
+
+
+class DeadlineMiddleware:
+    """
+    Gives every request a latency budget and stops all of its work when the budget runs out.
+
+    The budget is opened with pymongo.timeout, so every Mongo operation issued for the request,
+    on any task that inherits its context, is sent with the remaining time as maxTimeMS and the
+    server abandons the query too. The downstream app runs under asyncio.wait_for, so pending
+    awaits are cancelled at the deadline and the client gets a 504 if nothing was sent yet.
+
+    Written as plain ASGI rather than an @app.middleware function: those run the endpoint in a
+    separate task that keeps going after the middleware has given up on it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        budget = route_budget(scope["path"])
+        started = False
+
+        async def send_tracking(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+            await send(message)
+
+        token = current_deadline.set(time.monotonic() + budget)
+        try:
+            with pymongo.timeout(budget):
+                await asyncio.wait_for(self.app(scope, receive, send_tracking), budget)
+        except asyncio.TimeoutError:
+            expired_total.inc(source="asyncio")
+            await self._timed_out(started, scope, receive, send)
+        except PyMongoError as e:
+            if not e.timeout:
+                raise
+            expired_total.inc(source="mongo")
+            await self._timed_out(started, scope, receive, send)
+        finally:
+            current_deadline.reset(token)
+
+    @staticmethod
+    async def _timed_out(started: bool, scope, receive, send):
+        # Once the response has started there is nothing left to tell the client
+        if not started:
+            response = Response(content="Deadline exceeded", status_code=HTTP_504_GATEWAY_TIMEOUT)
+            await response(scope, receive, send)
@@ -0,0 +1,164 @@
+# middleware/loadShedding.py
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict
+from fastapi import Request, Response
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+from services import metrics
+
+CRITICAL = "critical"
+NORMAL = "normal"
+LOW = "low"
+PRIORITIES = (CRITICAL, NORMAL, LOW)
+
+# Per class: share of the concurrency limit it may use, waiting room, and longest wait in seconds.
+# Low-priority work never queues; it is refused as soon as its share is used up.
+CLASSES = {
+    CRITICAL: (1.0, 200, 2.0),
+    NORMAL: (0.85, 100, 1.0),
+    LOW: (0.5, 0, 0.0),
+}
+# Analytics, exports and batch jobs. Checked before the method, so batch writes such as a cohort
+# reassignment or a schedule run are shed with the rest rather than ranked with single writes
+LOW_PRIORITY_PREFIXES = (
+    "/assignments", "/visit-locations/schedule", "/zones/", "/geocode/home-towns",
+    "/attendance", "/map/markers", "/metrics", "/admin",
+)
+CRITICAL_PATHS = {"/login", "/logout"}
+# Long-lived streams would hold a slot for their whole life
+EXEMPT_PATHS = {"/docs", "/openapi.json", "/", "/events"}
+
+INITIAL_LIMIT = 64
+MIN_LIMIT = 8
+MAX_LIMIT = 512
+# Requests slower than this count as congestion
+LATENCY_TARGET_SECONDS = 1.0
+BACKOFF = 0.9
+# At most one decrease per interval, so one slow burst does not collapse the limit
+BACKOFF_INTERVAL_SECONDS = 1.0
+
+shed_total = metrics.counter("load_shed_total", "Requests refused with 503", ("priority", "reason"))
+request_seconds = metrics.histogram("http_request_duration_seconds", "Handler latency by priority class", ("priority",))
+
+
+def route_class(request: Request) -> str:
+    path = request.url.path
+    if path.startswith(LOW_PRIORITY_PREFIXES):
+        return LOW
+    if path in CRITICAL_PATHS or request.method in ("POST", "PUT", "PATCH", "DELETE"):
+        return CRITICAL
+    return NORMAL
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit in front of the whole middleware stack.
+
+    The limit grows by about one request per limit's worth of fast completions and shrinks by
+    10% when requests exceed the latency target, tracking how much concurrency the Mongo pool
+    absorbs before queueing sets in. Each priority class may only fill its share of the limit, so
+    low-priority work is refused while auth and writes still have room.
+    """
+
+    def __init__(self, initial: float = INITIAL_LIMIT):
+        self.limit = float(initial)
+        self.inflight: Dict[str, int] = {priority: 0 for priority in PRIORITIES}
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {priority: deque() for priority in PRIORITIES}
+        self._backed_off = 0.0
+
+    @property
+    def total(self) -> int:
+        return sum(self.inflight.values())
+
+    def _admissible(self, priority: str) -> bool:
+        return self.total < self.limit * CLASSES[priority][0]
+
+    async def acquire(self, priority: str) -> bool:
+        if self._admissible(priority) and not any(self._waiters[p] for p in PRIORITIES[:PRIORITIES.index(priority) + 1]):
+            self.inflight[priority] += 1
+            return True
+        _, room, wait = CLASSES[priority]
+        waiters = self._waiters[priority]
+        if len(waiters) >= room:
+            shed_total.inc(priority=priority, reason="queue_full" if room else "over_share")
+            return False
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), wait)
+            return True
+        except asyncio.TimeoutError:
+            if _granted(waiter):
+                return True
+            shed_total.inc(priority=priority, reason="queue_timeout")
+            return False
+        except asyncio.CancelledError:
+            # The client went away; hand back a slot that was granted in the meantime
+            if _granted(waiter):
+                self.release(priority, 0.0)
+            raise
+        finally:
+            if waiter in waiters:
+                waiters.remove(waiter)
+            waiter.cancel()
+
+    def release(self, priority: str, latency: float):
+        self.inflight[priority] -= 1
+        self._adjust(latency)
+        self._wake()
+
+    def _adjust(self, latency: float):
+        now = time.monotonic()
+        if latency > LATENCY_TARGET_SECONDS:
+            if now - self._backed_off >= BACKOFF_INTERVAL_SECONDS:
+                self.limit = max(MIN_LIMIT, self.limit * BACKOFF)
+                self._backed_off = now
+        elif self.total >= self.limit * 0.5:
+            # Only grow while the limit is actually being used
+            self.limit = min(MAX_LIMIT, self.limit + 1 / self.limit)
+
+    def _wake(self):
+        for priority in PRIORITIES:
+            waiters = self._waiters[priority]
+            while waiters and self._admissible(priority):
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    self.inflight[priority] += 1
+                    waiter.set_result(True)
+
+
+def _granted(waiter: asyncio.Future) -> bool:
+    return waiter.done() and not waiter.cancelled() and waiter.result() is True
+
+
+limiter = AdaptiveLimiter()
+
+metrics.gauge("concurrency_limit", "Current adaptive concurrency limit", callback=lambda: round(limiter.limit, 2))
+inflight_gauge = metrics.gauge("requests_inflight", "Requests being handled by priority class", ("priority",))
+queue_gauge = metrics.gauge("requests_queued", "Requests waiting for a slot by priority class", ("priority",))
+
+
+async def load_shedding_middleware(request: Request, call_next):
+    if request.url.path in EXEMPT_PATHS:
+        return await call_next(request)
+
+    priority = route_class(request)
+    admitted = await limiter.acquire(priority)
+    queue_gauge.set(len(limiter._waiters[priority]), priority=priority)
+    if not admitted:
+        return Response(
+            content="Service overloaded: try again shortly",
+            status_code=HTTP_503_SERVICE_UNAVAILABLE,
+            headers={"Retry-After": "1"},
+        )
+
+    inflight_gauge.set(limiter.inflight[priority], priority=priority)
+    started = time.monotonic()
+    try:
+        return await call_next(request)
+    finally:
+        latency = time.monotonic() - started
+        limiter.release(priority, latency)
+        request_seconds.observe(latency, priority=priority)
+        inflight_gauge.set(limiter.inflight[priority], priority=priority)
@@ -1,10 +1,41 @@
 # middleware/log.py
+import logging
+import queue
 import time
+from typing import Callable
+from logging.handlers import QueueHandler, QueueListener
 from fastapi import Request
 
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(level: int = logging.INFO) -> Callable[[], None]:
+    """
+    Route log records through a queue drained by a background thread.
+
+    The event loop only enqueues; writing to stderr, which blocks when the terminal or log
+    collector is slow, happens on the listener thread. Returns the function that undoes it.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    records = queue.SimpleQueue()
+    listener = QueueListener(records, handler, respect_handler_level=True)
+    root = logging.getLogger()
+    queue_handler = QueueHandler(records)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+
+    def stop():
+        root.removeHandler(queue_handler)
+        listener.stop()
+
+    return stop
+
+
 async def log_middleware(request: Request, call_next):
     start_time = time.time()
     response = await call_next(request)
     process_time = time.time() - start_time
-    print(f"Request: {request.method} {request.url} - Process Time: {process_time:.4f}s")
+    logger.info("Request: %s %s - Process Time: %.4fs", request.method, request.url, process_time)
     return response
@@ -0,0 +1,42 @@
+# middleware/profiling.py
+import random
+from typing import Optional
+from database.config import PROFILE_SAMPLE_RATE
+from services.profiler import profiler
+from services.service import is_admin_token
+
+
+def _trigger(scope) -> Optional[str]:
+    headers = dict(scope["headers"])
+    if headers.get(b"x-profile") == b"1" and is_admin_token(headers.get(b"x-admin-token", b"").decode("latin-1")):
+        return "header"
+    if PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+        return "sample"
+    return None
+
+
+class ProfilingMiddleware:
+    """
+    Profiles a request when an admin asks with `X-Profile: 1` and `X-Admin-Token`, or when the
+    request falls in the PROFILE_SAMPLE_RATE sample.
+
+    Only registered when an admin token or a sample rate is configured, so with both unset the
+    request path is unchanged. Plain ASGI, so the profile is opened in the context every task of
+    the request inherits, and the route template FastAPI records in the scope is available once
+    the request is done.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        trigger = _trigger(scope) if scope["type"] == "http" else None
+        session = profiler.begin(scope["method"], scope["path"], trigger) if trigger else None
+        if session is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route = scope.get("route")
+            profiler.end(session, getattr(route, "path", None))
@@ -0,0 +1,256 @@
+# middleware/rateLimit.py
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+from fastapi import Request, Response
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS
+from database.config import TRUSTED_PROXIES
+from services import metrics
+from services.service import verified_subject
+
+logger = logging.getLogger(__name__)
+
+# (burst, tokens per second) for each scope. An app or user is only charged once its credentials
+# are known to be genuine, so made-up ones buy nothing; requests without a known user are charged
+# to the client address instead
+IP_LIMIT = (600, 100.0)
+APP_LIMIT = (600, 100.0)
+USER_LIMIT = (120, 10.0)
+# Cost of a request by method (None for any) and path; a path ending in "/" is a prefix, any other
+# must match exactly. The first match wins, everything else costs 1
+ROUTE_COSTS = (
+    ("POST", "/assignments", 20),
+    ("POST", "/visit-locations/schedule", 10),
+    (None, "/dashboard", 5),
+    (None, "/supervisor/", 5),
+    (None, "/supervisors/", 5),
+    (None, "/attendance", 3),
+    (None, "/map/markers", 2),
+)
+EXEMPT_PATHS = {"/docs", "/openapi.json", "/"}
+# Buckets idle this long are dropped
+IDLE_SECONDS = 600
+SYNC_SECONDS = 1.0
+# Beyond this many buckets the least recently used are dropped, so memory stays bounded whatever
+# the keys a client sends
+MAX_BUCKETS = 100_000
+# App credentials auth_middleware has accepted, most recent last
+MAX_VERIFIED_APPS = 10_000
+
+limited_total = metrics.counter("rate_limited_total", "Requests refused with 429", ("scope",))
+
+
+def route_cost(method: str, path: str) -> int:
+    for route_method, route_path, cost in ROUTE_COSTS:
+        if route_method not in (None, method):
+            continue
+        if path == route_path or (route_path.endswith("/") and path.startswith(route_path)):
+            return cost
+    return 1
+
+
+def client_address(request: Request) -> str:
+    """The peer address, or behind a trusted proxy the nearest address it forwarded for."""
+    host = request.client.host if request.client else "unknown"
+    if host not in TRUSTED_PROXIES:
+        return host
+    forwarded = [part.strip() for part in request.headers.get("X-Forwarded-For", "").split(",") if part.strip()]
+    # Entries are appended by each hop, so the rightmost one not added by a trusted proxy is the client
+    for address in reversed(forwarded):
+        if address not in TRUSTED_PROXIES:
+            return address
+    return host
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class LocalBackend:
+    """Token buckets in this worker's memory; each worker enforces the limits on its own."""
+
+    def __init__(self):
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._swept = time.monotonic()
+
+    def bucket(self, key: str, limit: Tuple[float, float], now: float) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(limit[0], limit[1], now)
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def take(self, keys: Dict[str, Tuple[float, float]], cost: float) -> Tuple[Optional[str], float]:
+        """Charge every key or none; returns the scope that refused and how long to wait."""
+        now = time.monotonic()
+        self._sweep(now)
+        buckets = {key.split(":", 1)[0]: self.bucket(key, limit, now) for key, limit in keys.items()}
+        for scope, bucket in buckets.items():
+            bucket.refill(now)
+            if bucket.tokens < cost:
+                return scope, (cost - bucket.tokens) / bucket.rate
+        for bucket in buckets.values():
+            bucket.tokens -= cost
+        self.charged(keys, cost)
+        return None, 0.0
+
+    def charged(self, keys, cost: float):
+        pass
+
+    def _sweep(self, now: float):
+        if now - self._swept < IDLE_SECONDS:
+            return
+        self._swept = now
+        for key in [key for key, bucket in self.buckets.items() if now - bucket.updated > IDLE_SECONDS]:
+            del self.buckets[key]
+
+
+class MongoBackend(LocalBackend):
+    """
+    Local buckets kept roughly in step across workers through a Mongo counter per key.
+
+    Every second each worker adds what it charged to the shared counters and takes back the total,
+    and whatever the other workers spent meanwhile is drained from its own buckets. Checks stay
+    in memory, so a worker may briefly overshoot by one sync interval of traffic.
+    """
+
+    def __init__(self, collection):
+        super().__init__()
+        self.collection = collection
+        self._unsynced: Dict[str, float] = {}
+        self._seen: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def charged(self, keys, cost: float):
+        for key in keys:
+            self._unsynced[key] = self._unsynced.get(key, 0) + cost
+
+    async def sync(self):
+        unsynced, self._unsynced = self._unsynced, {}
+        now = datetime.utcnow()
+        keys = set(unsynced) | set(self._seen)
+        if not keys:
+            return
+        if unsynced:
+            await self.collection.bulk_write([
+                UpdateOne({"_id": key}, {"$inc": {"used": used}, "$set": {"updated_at": now}}, upsert=True)
+                for key, used in unsynced.items()
+            ], ordered=False)
+        totals = {
+            document["_id"]: document["used"]
+            for document in await self.collection.find({"_id": {"$in": list(keys)}}, {"used": 1}).to_list(None)
+        }
+        monotonic = time.monotonic()
+        for key, total in totals.items():
+            previous = self._seen.get(key)
+            self._seen[key] = total
+            if previous is None:
+                continue
+            others = total - previous - unsynced.get(key, 0)
+            bucket = self.buckets.get(key)
+            if bucket is not None and others > 0:
+                bucket.refill(monotonic)
+                bucket.tokens = max(bucket.tokens - others, -bucket.capacity)
+        for key in [key for key in self._seen if key not in self.buckets]:
+            del self._seen[key]
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(SYNC_SECONDS)
+            try:
+                await self.sync()
+            except PyMongoError as e:
+                logger.warning("Rate limit sync failed: %s", e)
+
+    async def start(self) -> asyncio.Task:
+        await self.collection.create_index("updated_at", expireAfterSeconds=IDLE_SECONDS)
+        self._task = asyncio.create_task(self.run())
+        return self._task
+
+
+# Digests of (app id, app key) pairs, so knowing an app's id is not enough to drain its bucket
+_verified_apps: "OrderedDict[bytes, None]" = OrderedDict()
+
+
+def _credentials_digest(app_id: str, app_key: str) -> bytes:
+    return hashlib.sha256(f"{app_id}\0{app_key}".encode()).digest()
+
+
+def app_verified(app_id: str, app_key: str):
+    """Called by auth_middleware once an app's credentials check out; later requests charge its bucket."""
+    digest = _credentials_digest(app_id, app_key)
+    _verified_apps[digest] = None
+    _verified_apps.move_to_end(digest)
+    while len(_verified_apps) > MAX_VERIFIED_APPS:
+        _verified_apps.popitem(last=False)
+
+
+def _app_key(request: Request) -> Optional[str]:
+    app_id, app_key = request.headers.get("X-App-ID"), request.headers.get("X-App-Key")
+    if not app_id or not app_key or _credentials_digest(app_id, app_key) not in _verified_apps:
+        return None
+    return f"app:{app_id}"
+
+
+def _user_key(request: Request) -> Optional[str]:
+    authorization = request.headers.get("Authorization", "")
+    token = authorization[7:] if authorization[:7].lower() == "bearer " else None
+    if not token:
+        return None
+    # Only tokens authentication already accepted; a token's first request is charged to its address
+    subject = verified_subject(token)
+    return f"user:{subject}" if subject else None
+
+
+backend: LocalBackend = LocalBackend()
+
+
+def use_backend(new_backend: LocalBackend):
+    global backend
+    backend = new_backend
+
+
+async def rate_limit_middleware(request: Request, call_next):
+    if request.url.path in EXEMPT_PATHS:
+        return await call_next(request)
+
+    keys = {}
+    app_key = _app_key(request)
+    if app_key:
+        keys[app_key] = APP_LIMIT
+    user_key = _user_key(request)
+    if user_key:
+        keys[user_key] = USER_LIMIT
+    else:
+        # Users behind one proxy or campus NAT share an address, so it only limits the anonymous
+        keys[f"ip:{client_address(request)}"] = IP_LIMIT
+
+    scope, retry_after = backend.take(keys, route_cost(request.method, request.url.path))
+    if scope is not None:
+        limited_total.inc(scope=scope)
+        return Response(
+            content="Too many requests: rate limit exceeded",
+            status_code=HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+    return await call_next(request)
@@ -0,0 +1,273 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+import numpy as np
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from services.service import db
+from services import geo
+from services.cache import AsyncCache, cached, invalidate_tags
+
+DEFAULT_CAPACITY = 30
+# Extra cost, in km, for supervising a student outside the supervisor's zone
+ZONE_MISMATCH_KM = 50.0
+# Cost used when either side has no usable coordinate
+UNKNOWN_DISTANCE_KM = 500.0
+# Rows of the student x supervisor cost matrix computed at a time
+BLOCK_ROWS = 4096
+
+balance_cache = AsyncCache("assignment_balance", maxsize=256, ttl=60, stale_ttl=120)
+
+
+def pairwise_km(from_points: np.ndarray, to_points: np.ndarray) -> np.ndarray:
+    """Vectorised haversine distance matrix between two (n, 2) arrays of lat/lon degrees."""
+    lat1, lon1 = np.radians(from_points[:, 0])[:, None], np.radians(from_points[:, 1])[:, None]
+    lat2, lon2 = np.radians(to_points[:, 0])[None, :], np.radians(to_points[:, 1])[None, :]
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    km = 2 * geo.EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+    return np.nan_to_num(km, nan=UNKNOWN_DISTANCE_KM).astype(np.float32)
+
+
+def _points(coordinates: List[Optional[tuple]]) -> np.ndarray:
+    return np.array([coordinate or (np.nan, np.nan) for coordinate in coordinates], dtype=np.float64).reshape(-1, 2)
+
+
+async def _student_sites(students: List[dict]) -> Dict[Any, Optional[tuple]]:
+    """Locate each student at the company of their latest internship, falling back to their last known position."""
+    latest = {student["_id"]: student["internships"][-1] for student in students if student.get("internships")}
+    internships = {
+        internship["_id"]: internship
+        for internship in await db.internships.find(
+            {"_id": {"$in": list(set(latest.values()))}}, {"company_id": 1, "location.coordinate": 1}
+        ).to_list(None)
+    }
+    company_ids = list({internship["company_id"] for internship in internships.values() if internship.get("company_id")})
+    companies = {
+        company["_id"]: geo.coordinate_of(company.get("address"))
+        for company in await db.companies.find({"_id": {"$in": company_ids}}, {"address.coordinate": 1}).to_list(None)
+    }
+
+    sites = {}
+    for student in students:
+        internship = internships.get(latest.get(student["_id"])) or {}
+        sites[student["_id"]] = (
+            geo.coordinate_of(internship.get("location"))
+            or companies.get(internship.get("company_id"))
+            or geo.coordinate_of(student.get("current_location"))
+        )
+    return sites
+
+
+async def _supervisor_bases(supervisors: List[dict]) -> Dict[Any, Optional[tuple]]:
+    """Place each supervisor at the centre of their zone, or at their own address when they have no zone."""
+    zone_ids = list({supervisor["zone_id"] for supervisor in supervisors if supervisor.get("zone_id")})
+    zones = {
+        zone["_id"]: geo.centroid([geo.coordinate_of(point) for point in zone.get("boundaries") or []])
+        for zone in await db.zones.find({"_id": {"$in": zone_ids}}, {"boundaries": 1}).to_list(None)
+    }
+    user_ids = [ObjectId(supervisor["user_id"]) for supervisor in supervisors if ObjectId.is_valid(supervisor.get("user_id"))]
+    users = {
+        str(user["_id"]): geo.coordinate_of(user.get("address"))
+        for user in await db.users.find({"_id": {"$in": user_ids}}, {"address.coordinate": 1}).to_list(None)
+    }
+    return {
+        supervisor["_id"]: zones.get(supervisor.get("zone_id")) or users.get(str(supervisor.get("user_id")))
+        for supervisor in supervisors
+    }
+
+
+def _cost_matrix(students: List[dict], supervisors: List[dict], sites: dict, bases: dict) -> np.ndarray:
+    student_points = _points([sites.get(student["_id"]) for student in students])
+    supervisor_points = _points([bases.get(supervisor["_id"]) for supervisor in supervisors])
+    student_zones = np.array([str(student.get("zone_id")) for student in students])
+    supervisor_zones = np.array([str(supervisor.get("zone_id")) for supervisor in supervisors])
+
+    cost = np.empty((len(students), len(supervisors)), dtype=np.float32)
+    for start in range(0, len(students), BLOCK_ROWS):
+        stop = start + BLOCK_ROWS
+        block = pairwise_km(student_points[start:stop], supervisor_points)
+        block += np.where(student_zones[start:stop, None] == supervisor_zones[None, :], 0.0, ZONE_MISMATCH_KM).astype(np.float32)
+        cost[start:stop] = block
+    return cost
+
+
+def _assign(cost: np.ndarray, loads: np.ndarray, capacities: np.ndarray) -> np.ndarray:
+    """
+    Capacitated regret assignment.
+
+    Students whose best and second-best supervisors differ most are placed first, each on the
+    cheapest supervisor below the balanced target load; the hard capacity is only used once every
+    supervisor has reached the target.
+    """
+    n_students, n_supervisors = cost.shape
+    choice = np.full(n_students, -1, dtype=np.int64)
+    if n_students == 0 or n_supervisors == 0:
+        return choice
+
+    target = math.ceil((loads.sum() + n_students) / n_supervisors)
+    soft = np.minimum(capacities, max(target, 1))
+    if n_supervisors > 1:
+        two_best = np.partition(cost, 1, axis=1)[:, :2]
+        regret = two_best[:, 1] - two_best[:, 0]
+    else:
+        regret = np.zeros(n_students, dtype=np.float32)
+
+    loads = loads.copy()
+    blocked = np.where(loads >= soft, np.inf, 0.0)
+    for row in np.argsort(-regret, kind="stable"):
+        if np.isinf(blocked).all():
+            # Every supervisor is at the balanced load; open up the remaining hard capacity
+            soft = capacities
+            blocked = np.where(loads >= soft, np.inf, 0.0)
+            if np.isinf(blocked).all():
+                break
+        column = int(np.argmin(cost[row] + blocked))
+        choice[row] = column
+        loads[column] += 1
+        if loads[column] >= soft[column]:
+            blocked[column] = np.inf
+    return choice
+
+
+def balance_report(supervisors: List[dict], loads: np.ndarray, distances: List[float], cross_zone: Optional[int], unassigned: int) -> Dict[str, Any]:
+    mean = float(loads.mean()) if len(loads) else 0.0
+    std = float(loads.std()) if len(loads) else 0.0
+    return {
+        "supervisors": len(supervisors),
+        "assigned_students": int(loads.sum()),
+        "unassigned_students": unassigned,
+        "load_min": int(loads.min()) if len(loads) else 0,
+        "load_max": int(loads.max()) if len(loads) else 0,
+        "load_mean": round(mean, 2),
+        "load_std": round(std, 2),
+        # 0 means perfectly even; the max/mean ratio shows the worst overload
+        "load_cv": round(std / mean, 3) if mean else 0.0,
+        "max_to_mean": round(float(loads.max()) / mean, 3) if mean else 0.0,
+        "mean_distance_km": round(float(np.mean(distances)), 2) if distances else None,
+        "p95_distance_km": round(float(np.percentile(distances, 95)), 2) if distances else None,
+        "cross_zone_assignments": cross_zone,
+        "loads": {str(supervisor["_id"]): int(load) for supervisor, load in zip(supervisors, loads)},
+    }
+
+
+async def assign_students(
+    department_id: Optional[str] = None,
+    student_ids: Optional[List[str]] = None,
+    rebalance: bool = False,
+) -> Dict[str, Any]:
+    """
+    Assign students to school supervisors of their department by geography and workload.
+
+    By default only students without a supervisor (or the given student_ids) are placed and
+    existing assignments count towards each supervisor's load. With rebalance every student in
+    scope is placed again, assigned or not; roster entries outside the scope are always kept.
+    """
+    student_query: Dict[str, Any] = {}
+    supervisor_query: Dict[str, Any] = {}
+    if department_id:
+        if not ObjectId.is_valid(department_id):
+            raise HTTPException(status_code=400, detail="Invalid department ID")
+        student_query["department_id"] = ObjectId(department_id)
+        supervisor_query["department_id"] = ObjectId(department_id)
+    if student_ids:
+        student_query["_id"] = {"$in": [ObjectId(student_id) for student_id in student_ids]}
+    elif not rebalance:
+        student_query["assigned_supervisor"] = None
+
+    students = await db.students.find(
+        student_query,
+        {"department_id": 1, "zone_id": 1, "internships": 1, "current_location": 1, "assigned_supervisor": 1},
+    ).to_list(None)
+    supervisors = await db.school_supervisors.find(
+        supervisor_query, {"department_id": 1, "zone_id": 1, "capacity": 1, "assigned_students": 1, "user_id": 1}
+    ).to_list(None)
+    if not supervisors:
+        raise HTTPException(status_code=404, detail="No supervisors found")
+
+    sites = await _student_sites(students)
+    bases = await _supervisor_bases(supervisors)
+    moving = {student["_id"] for student in students}
+
+    # Current rosters, minus the students that are about to be (re)placed
+    previous = {
+        supervisor["_id"]: [ObjectId(student_id) for student_id in supervisor.get("assigned_students") or []]
+        for supervisor in supervisors
+    }
+    rosters = {
+        supervisor_id: [student_id for student_id in roster if student_id not in moving]
+        for supervisor_id, roster in previous.items()
+    }
+
+    by_department = defaultdict(list)
+    for student in students:
+        by_department[str(student.get("department_id"))].append(student)
+
+    assignment = {}
+    distances = []
+    cross_zone = 0
+    unassigned = []
+    for department, group in by_department.items():
+        candidates = [supervisor for supervisor in supervisors if str(supervisor.get("department_id")) == department]
+        if not candidates:
+            unassigned.extend(str(student["_id"]) for student in group)
+            continue
+        cost = _cost_matrix(group, candidates, sites, bases)
+        loads = np.array([len(rosters[supervisor["_id"]]) for supervisor in candidates], dtype=np.int64)
+        capacities = np.array([supervisor.get("capacity") or DEFAULT_CAPACITY for supervisor in candidates], dtype=np.int64)
+        choice = _assign(cost, loads, capacities)
+        for row, (student, column) in enumerate(zip(group, choice)):
+            if column < 0:
+                unassigned.append(str(student["_id"]))
+                continue
+            supervisor = candidates[column]
+            assignment[student["_id"]] = supervisor["_id"]
+            rosters[supervisor["_id"]].append(student["_id"])
+            distance = float(cost[row, column])
+            if str(student.get("zone_id")) != str(supervisor.get("zone_id")):
+                cross_zone += 1
+                distance -= ZONE_MISMATCH_KM
+            distances.append(distance)
+
+    now = datetime.utcnow()
+    student_updates = [
+        UpdateOne({"_id": student_id}, {"$set": {"assigned_supervisor": supervisor_id, "updated_at": now}})
+        for student_id, supervisor_id in assignment.items()
+    ]
+    # Students left unplaced were taken off their old roster above, so they lose the link too
+    student_updates.extend(
+        UpdateOne({"_id": student["_id"]}, {"$unset": {"assigned_supervisor": ""}, "$set": {"updated_at": now}})
+        for student in students
+        if student["_id"] not in assignment and student.get("assigned_supervisor") is not None
+    )
+    # Supervisors whose roster gained or lost a student
+    changed = {supervisor_id for supervisor_id, roster in rosters.items() if set(roster) != set(previous[supervisor_id])}
+    supervisor_updates = [
+        UpdateOne({"_id": supervisor_id}, {"$set": {"assigned_students": rosters[supervisor_id], "updated_at": now}})
+        for supervisor_id in changed
+    ]
+    if student_updates:
+        await db.students.bulk_write(student_updates, ordered=False)
+    if supervisor_updates:
+        await db.school_supervisors.bulk_write(supervisor_updates, ordered=False)
+    if student_updates or supervisor_updates:
+        invalidate_tags("students", "school_supervisors")
+
+    loads = np.array([len(rosters[supervisor["_id"]]) for supervisor in supervisors], dtype=np.int64)
+    report = balance_report(supervisors, loads, distances, cross_zone, len(unassigned))
+    report["newly_assigned"] = len(assignment)
+    report["unassigned"] = unassigned
+    return report
+
+
+@cached(balance_cache, tags=("school_supervisors", "students"))
+async def get_assignment_balance(department_id: Optional[str] = None) -> Dict[str, Any]:
+    """Report how evenly the current rosters are spread, without changing them."""
+    query = {"department_id": ObjectId(department_id)} if department_id and ObjectId.is_valid(department_id) else {}
+    supervisors = await db.school_supervisors.find(query, {"assigned_students": 1, "zone_id": 1, "user_id": 1}).to_list(None)
+    if not supervisors:
+        raise HTTPException(status_code=404, detail="No supervisors found")
+    loads = np.array([len(supervisor.get("assigned_students") or []) for supervisor in supervisors], dtype=np.int64)
+    unassigned = await db.students.count_documents({**query, "assigned_supervisor": None})
+    return balance_report(supervisors, loads, [], None, unassigned)
@@ -0,0 +1,187 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from services.service import db
+from services import geo, realtime
+
+logger = logging.getLogger(__name__)
+
+GEOFENCE_METERS = 200
+# Time between two on-site pings is only credited when they are at most this far apart
+MAX_GAP_MINUTES = 30
+QUEUE_SIZE = 10_000
+BATCH_SIZE = 500
+SITE_TTL_SECONDS = 600
+LEASE_SECONDS = 30
+
+
+def rollup_id(student_id, day) -> str:
+    return f"{student_id}:{day.isoformat()}"
+
+
+class AttendanceEngine:
+    """
+    Turns location pings into per-student daily presence rollups.
+
+    Pings arrive from the realtime broker, are matched against the geofence of the student's
+    internship company and folded into one upsert per student and day, so rollups are updated
+    incrementally and never recomputed. Only the worker holding the attendance lease writes,
+    otherwise every worker would credit the same ping.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.stats = {"pings": 0, "dropped": 0, "on_site": 0, "writes": 0}
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._sites: Dict[ObjectId, Tuple[Optional[tuple], float]] = {}
+        self._last: Dict[ObjectId, Tuple[datetime, bool]] = {}
+        self._leader = False
+
+    def on_event(self, event: dict):
+        if event.get("type") != "location" or not self._leader:
+            return
+        data = event["data"]
+        coordinate = geo.coordinate_of(data.get("location"))
+        if coordinate is None or not ObjectId.is_valid(data.get("student_id")):
+            return
+        try:
+            self._queue.put_nowait((ObjectId(data["student_id"]), coordinate, data.get("timestamp") or datetime.utcnow()))
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+
+    async def _load_sites(self, student_ids: List[ObjectId]):
+        now = time.monotonic()
+        missing = [student_id for student_id in student_ids if self._sites.get(student_id, (None, 0))[1] < now]
+        if not missing:
+            return
+        students = await db.students.find({"_id": {"$in": missing}}, {"internships": 1}).to_list(None)
+        latest = {student["_id"]: student["internships"][-1] for student in students if student.get("internships")}
+        internships = {
+            internship["_id"]: internship
+            for internship in await db.internships.find(
+                {"_id": {"$in": list(set(latest.values()))}}, {"company_id": 1, "location.coordinate": 1}
+            ).to_list(None)
+        }
+        company_ids = list({internship["company_id"] for internship in internships.values() if internship.get("company_id")})
+        companies = {
+            company["_id"]: geo.coordinate_of(company.get("address"))
+            for company in await db.companies.find({"_id": {"$in": company_ids}}, {"address.coordinate": 1}).to_list(None)
+        }
+        for student_id in missing:
+            internship = internships.get(latest.get(student_id)) or {}
+            site = geo.coordinate_of(internship.get("location")) or companies.get(internship.get("company_id"))
+            self._sites[student_id] = (site, now + SITE_TTL_SECONDS)
+
+    async def process(self, pings: List[tuple]):
+        await self._load_sites(list({student_id for student_id, _, _ in pings}))
+        rollups: Dict[str, Dict[str, Any]] = {}
+        for student_id, coordinate, timestamp in sorted(pings, key=lambda ping: ping[2]):
+            self.stats["pings"] += 1
+            site = self._sites[student_id][0]
+            on_site = site is not None and geo.haversine_km(site, coordinate) * 1000 <= GEOFENCE_METERS
+            day = timestamp.date()
+
+            credit = 0.0
+            previous = self._last.get(student_id)
+            if previous and previous[1] and on_site and previous[0].date() == day:
+                gap = (timestamp - previous[0]).total_seconds() / 60
+                if 0 < gap <= MAX_GAP_MINUTES:
+                    credit = gap
+            self._last[student_id] = (timestamp, on_site)
+
+            key = rollup_id(student_id, day)
+            rollup = rollups.setdefault(key, {
+                "student_id": student_id, "date": datetime.combine(day, datetime.min.time()),
+                "first_seen": None, "last_seen": None, "minutes": 0.0, "pings": 0, "pings_on_site": 0, "last_ping_at": timestamp,
+            })
+            rollup["pings"] += 1
+            rollup["last_ping_at"] = max(rollup["last_ping_at"], timestamp)
+            if on_site:
+                self.stats["on_site"] += 1
+                rollup["pings_on_site"] += 1
+                rollup["minutes"] += credit
+                rollup["first_seen"] = min(rollup["first_seen"] or timestamp, timestamp)
+                rollup["last_seen"] = max(rollup["last_seen"] or timestamp, timestamp)
+
+        operations = []
+        for key, rollup in rollups.items():
+            update: Dict[str, Any] = {
+                "$setOnInsert": {"student_id": rollup["student_id"], "date": rollup["date"]},
+                "$inc": {"minutes_on_site": round(rollup["minutes"], 2), "pings": rollup["pings"], "pings_on_site": rollup["pings_on_site"]},
+                "$max": {"last_ping_at": rollup["last_ping_at"]},
+            }
+            if rollup["first_seen"]:
+                update["$min"] = {"first_seen": rollup["first_seen"]}
+                update["$max"]["last_seen"] = rollup["last_seen"]
+            operations.append(UpdateOne({"_id": key}, update, upsert=True))
+        if operations:
+            await db.attendance.bulk_write(operations, ordered=False)
+            self.stats["writes"] += len(operations)
+
+    async def run(self):
+        while True:
+            pings = [await self._queue.get()]
+            while len(pings) < BATCH_SIZE and not self._queue.empty():
+                pings.append(self._queue.get_nowait())
+            try:
+                await self.process(pings)
+            except PyMongoError as e:
+                logger.warning("Attendance batch of %d pings lost: %s", len(pings), e)
+
+    async def hold_lease(self):
+        """Keep (or take over) the single-writer lease for attendance rollups."""
+        while True:
+            now = datetime.utcnow()
+            try:
+                await db.leases.find_one_and_update(
+                    {"_id": "attendance", "$or": [{"owner": self.worker_id}, {"expires_at": {"$lt": now}}]},
+                    {"$set": {"owner": self.worker_id, "expires_at": now + timedelta(seconds=LEASE_SECONDS)}},
+                    upsert=True,
+                )
+                self._leader = True
+            except DuplicateKeyError:
+                # Another worker holds a live lease
+                self._leader = False
+            except PyMongoError as e:
+                logger.warning("Attendance lease renewal failed: %s", e)
+                self._leader = False
+            await asyncio.sleep(LEASE_SECONDS / 3)
+
+    def start(self) -> List[asyncio.Task]:
+        realtime.broker.subscribe(self.on_event)
+        return [asyncio.create_task(self.run()), asyncio.create_task(self.hold_lease())]
+
+
+engine = AttendanceEngine()
+
+
+async def ensure_indexes():
+    await db.attendance.create_index([("student_id", ASCENDING), ("date", ASCENDING)])
+
+
+async def get_cohort_attendance(supervisor_id: str, start_date: datetime, end_date: datetime) -> List[dict]:
+    """Daily presence of every student assigned to the supervisor between two dates, inclusive."""
+    if end_date < start_date:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+    supervisor = await db.school_supervisors.find_one({"user_id": supervisor_id}, {"assigned_students": 1})
+    if not supervisor:
+        raise HTTPException(status_code=404, detail="Supervisor not found")
+    student_ids = [ObjectId(student_id) for student_id in supervisor.get("assigned_students") or []]
+    return await db.attendance.find(
+        {
+            "student_id": {"$in": student_ids},
+            "date": {
+                "$gte": datetime.combine(start_date.date(), datetime.min.time()),
+                "$lte": datetime.combine(end_date.date(), datetime.min.time()),
+            },
+        },
+        {"_id": 0, "student_id": 1, "date": 1, "first_seen": 1, "last_seen": 1, "minutes_on_site": 1, "pings": 1, "pings_on_site": 1},
+    ).sort([("student_id", ASCENDING), ("date", ASCENDING)]).to_list(None)
@@ -0,0 +1,224 @@
+import asyncio
+import contextvars
+import functools
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+from services import metrics
+
+requests_total = metrics.counter(
+    "cache_requests_total", "Cache lookups by result: hit, stale, miss or coalesced", ("cache", "result")
+)
+evictions_total = metrics.counter("cache_evictions_total", "Entries evicted to stay within maxsize", ("cache",))
+invalidations_total = metrics.counter("cache_invalidations_total", "Entries dropped by invalidation", ("cache",))
+load_seconds = metrics.histogram("cache_load_seconds", "Time spent computing missing values", ("cache",))
+
+# Every cache in the process, so a write can invalidate by tag without knowing which caches exist
+_caches: "weakref.WeakSet[AsyncCache]" = weakref.WeakSet()
+# Other in-process caches with their own storage, told about every invalidation
+_subscribers: List[Callable[[Tuple[str, ...]], None]] = []
+# Told only about invalidations that start in this process, to pass them on to other workers
+_forwarders: List[Callable[[Tuple[str, ...]], None]] = []
+# Context variables copied into the otherwise empty context loads run in; for instrumentation
+# that attributes work to the request behind it, never for deadlines or other request state
+_carried: List[contextvars.ContextVar] = []
+_UNSET = object()
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until", "tags")
+
+    def __init__(self, value, fresh_until: float, stale_until: float, tags: frozenset):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.tags = tags
+
+
+class AsyncCache:
+    """
+    Read-through cache for coroutine results.
+
+    Entries are fresh for `ttl` seconds and may then be served for another `stale_ttl` seconds
+    while one background refresh runs (stale-while-revalidate). Concurrent misses for the same
+    key share a single computation. Entries carry tags, normally the collections they were read
+    from, so a write can drop everything derived from that collection. The least recently used
+    entry is evicted beyond `maxsize`.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 60, stale_ttl: float = 0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._by_tag: Dict[str, Set[Hashable]] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        # Bumped by invalidation so a load that started earlier does not store its stale result
+        self._generation = 0
+        _caches.add(self)
+
+    def __len__(self):
+        return len(self._entries)
+
+    async def get_or_load(
+        self, key: Hashable, loader: Callable[[], Awaitable[Any]], tags: Iterable[str] = (), ttl: Optional[float] = None
+    ):
+        now = time.monotonic()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self._entries.move_to_end(key)
+                requests_total.inc(cache=self.name, result="hit")
+                return entry.value
+            if now < entry.stale_until:
+                self._entries.move_to_end(key)
+                requests_total.inc(cache=self.name, result="stale")
+                if key not in self._inflight:
+                    self._start_load(key, loader, tags, ttl)
+                return entry.value
+            self._drop(key)
+
+        task = self._inflight.get(key)
+        if task is not None:
+            requests_total.inc(cache=self.name, result="coalesced")
+        else:
+            requests_total.inc(cache=self.name, result="miss")
+            task = self._start_load(key, loader, tags, ttl)
+        # The load runs in its own task and is shielded, so a caller that goes away does not
+        # cancel it for the others waiting on the same key
+        return await asyncio.shield(task)
+
+    def _start_load(self, key, loader, tags, ttl) -> asyncio.Task:
+        # A fresh context, so the load shared by every caller does not inherit the first caller's
+        # request deadline (pymongo.timeout) or anything else scoped to its request
+        task = asyncio.create_task(
+            self._load(key, loader, frozenset(tags), self.ttl if ttl is None else ttl), context=_load_context()
+        )
+        self._inflight[key] = task
+        task.add_done_callback(_ignore_result)
+        return task
+
+    async def _load(self, key, loader, tags: frozenset, ttl: float):
+        generation = self._generation
+        started = time.monotonic()
+        try:
+            value = await loader()
+        finally:
+            self._inflight.pop(key, None)
+            load_seconds.observe(time.monotonic() - started, cache=self.name)
+        if generation == self._generation:
+            self._store(key, value, tags, ttl)
+        return value
+
+    def _store(self, key, value, tags: frozenset, ttl: float):
+        if key in self._entries:
+            self._drop(key)
+        now = time.monotonic()
+        self._entries[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl, tags)
+        for tag in tags:
+            self._by_tag.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._drop(next(iter(self._entries)))
+            evictions_total.inc(cache=self.name)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, key: Hashable):
+        self._generation += 1
+        if key in self._entries:
+            self._drop(key)
+            invalidations_total.inc(cache=self.name)
+
+    def invalidate_tags(self, *tags: str) -> int:
+        self._generation += 1
+        keys = set().union(*(self._by_tag.get(tag, ()) for tag in tags))
+        for key in keys:
+            self._drop(key)
+        if keys:
+            invalidations_total.inc(len(keys), cache=self.name)
+        return len(keys)
+
+    def clear(self):
+        self._generation += 1
+        self._entries.clear()
+        self._by_tag.clear()
+
+
+def _ignore_result(task: asyncio.Future):
+    # Callers waiting on the load see its error themselves; this only keeps a failed background
+    # refresh, or a load nobody waits for any more, from being reported as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+def _load_context() -> contextvars.Context:
+    context = contextvars.Context()
+    for var in _carried:
+        value = var.get(_UNSET)
+        if value is not _UNSET:
+            context.run(var.set, value)
+    return context
+
+
+def carry(var: contextvars.ContextVar):
+    _carried.append(var)
+
+
+def subscribe(handler: Callable[[Tuple[str, ...]], None]):
+    _subscribers.append(handler)
+
+
+def forward(handler: Callable[[Tuple[str, ...]], None]):
+    _forwarders.append(handler)
+
+
+def invalidate_tags(*tags: str, remote: bool = False) -> int:
+    """
+    Drop entries carrying any of the tags from every cache in the process.
+
+    Local invalidations are also forwarded to the other workers; `remote` marks one that arrived
+    from another worker and must not be sent back out.
+    """
+    count = sum(cache.invalidate_tags(*tags) for cache in list(_caches))
+    for handler in _subscribers:
+        handler(tags)
+    if not remote:
+        for handler in _forwarders:
+            handler(tags)
+    return count
+
+
+def clear_all():
+    for cache in list(_caches):
+        cache.clear()
+
+
+def cached(cache: AsyncCache, tags: Iterable[str] = (), ttl: Optional[float] = None):
+    """
+    Cache a coroutine function on its arguments.
+
+    Arguments must be hashable; the result is shared between callers, who must not mutate it.
+    """
+    tags = tuple(tags)
+
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            key = (function.__qualname__, args, tuple(sorted(kwargs.items())))
+            return await cache.get_or_load(key, lambda: function(*args, **kwargs), tags, ttl)
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
@@ -0,0 +1,186 @@
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from pymongo import UpdateOne
+from services import geo, cache, executor
+
+# Coordinates are snapped to a 1e-4 degree grid (about 11 m) before keying
+QUANTUM = 1e-4
+MEMORY_ENTRIES = 200_000
+STORE_BATCH = 1000
+# Keys per $in read against the store, well under the 16 MB command limit
+READ_BATCH = 1000
+# Pairs computed per worker call; smaller batches are computed inline, as the hand-off costs more
+COMPUTE_BATCH = 20_000
+INLINE_PAIRS = 256
+# WGS84 ellipsoid
+WGS84_A_KM = 6378.137
+WGS84_F = 1 / 298.257223563
+# Invalidation tag for every cached pair touching a point
+POINT_TAG = "distance_point:"
+
+
+def point_key(coord: Tuple[float, float]) -> str:
+    return f"{round(coord[0] / QUANTUM)},{round(coord[1] / QUANTUM)}"
+
+
+@executor.offload(executor.THREAD)
+def geodesic_km(pairs: np.ndarray) -> np.ndarray:
+    """
+    Ellipsoidal distances for an (n, 4) array of lat1, lon1, lat2, lon2 rows.
+
+    Lambert's formula on WGS84, vectorised: within a few metres of geopy's geodesic over the
+    distances between sites in a region, at a fraction of the cost. numpy releases the GIL on
+    arrays this size, so it runs in the thread pool.
+    """
+    lat1, lon1, lat2, lon2 = np.radians(pairs).T
+    # Reduced latitudes, then the central angle between them on the auxiliary sphere
+    beta1 = np.arctan((1 - WGS84_F) * np.tan(lat1))
+    beta2 = np.arctan((1 - WGS84_F) * np.tan(lat2))
+    h = np.sin((beta2 - beta1) / 2) ** 2 + np.cos(beta1) * np.cos(beta2) * np.sin((lon2 - lon1) / 2) ** 2
+    sigma = 2 * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+    p, q = (beta1 + beta2) / 2, (beta2 - beta1) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x = (sigma - np.sin(sigma)) * np.sin(p) ** 2 * np.cos(q) ** 2 / np.cos(sigma / 2) ** 2
+        y = (sigma + np.sin(sigma)) * np.cos(p) ** 2 * np.sin(q) ** 2 / np.sin(sigma / 2) ** 2
+        km = WGS84_A_KM * (sigma - WGS84_F / 2 * (x + y))
+    # Coincident points divide by zero above
+    return np.where(sigma > 0, km, 0.0)
+
+
+def pair_key(a: Tuple[float, float], b: Tuple[float, float]) -> str:
+    # Distances are symmetric, so both directions share one entry
+    first, second = sorted((point_key(a), point_key(b)))
+    return f"{first}|{second}"
+
+
+class DistanceCache:
+    """
+    Two-tier cache of site-to-site distances and travel times.
+
+    Lookups hit an in-process LRU first and a Mongo collection second; only pairs missing from
+    both are computed, and those are written back so other workers and later runs reuse them.
+    """
+
+    def __init__(self, collection, maxsize: int = MEMORY_ENTRIES):
+        self.collection = collection
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._by_point: Dict[str, set] = defaultdict(set)
+        self.stats = {"memory_hits": 0, "store_hits": 0, "computed": 0}
+        cache.subscribe(self.on_invalidate)
+
+    def _remember(self, key: str, km: float):
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        self._entries[key] = km
+        for point in key.split("|"):
+            self._by_point[point].add(key)
+        while len(self._entries) > self.maxsize:
+            evicted, _ = self._entries.popitem(last=False)
+            for point in evicted.split("|"):
+                self._by_point[point].discard(evicted)
+                if not self._by_point[point]:
+                    del self._by_point[point]
+
+    def _recall(self, key: str) -> Optional[float]:
+        km = self._entries.get(key)
+        if km is not None:
+            self._entries.move_to_end(key)
+        return km
+
+    async def get_many(self, pairs: Iterable[Tuple[Tuple[float, float], Tuple[float, float]]]) -> Dict[str, float]:
+        """Resolve many pairs with batched reads and bulk writes against Mongo."""
+        wanted = {}
+        for a, b in pairs:
+            wanted.setdefault(pair_key(a, b), (a, b))
+
+        found = {}
+        missing = []
+        for key in wanted:
+            km = self._recall(key)
+            if km is None:
+                missing.append(key)
+            else:
+                found[key] = km
+        self.stats["memory_hits"] += len(found)
+
+        for start in range(0, len(missing), READ_BATCH):
+            async for entry in self.collection.find({"_id": {"$in": missing[start:start + READ_BATCH]}}, {"km": 1}):
+                found[entry["_id"]] = entry["km"]
+                self._remember(entry["_id"], entry["km"])
+                self.stats["store_hits"] += 1
+
+        computed = [key for key in missing if key not in found]
+        distances = await self._compute([wanted[key] for key in computed])
+        operations = []
+        now = datetime.utcnow()
+        for key, km in zip(computed, distances):
+            km = float(km)
+            found[key] = km
+            self._remember(key, km)
+            first, second = key.split("|")
+            operations.append(UpdateOne(
+                {"_id": key},
+                {"$setOnInsert": {"a": first, "b": second, "km": km, "minutes": geo.travel_minutes(km), "computed_at": now}},
+                upsert=True,
+            ))
+        self.stats["computed"] += len(operations)
+        for start in range(0, len(operations), STORE_BATCH):
+            await self.collection.bulk_write(operations[start:start + STORE_BATCH], ordered=False)
+        return found
+
+    @staticmethod
+    async def _compute(pairs: List[Tuple[Tuple[float, float], Tuple[float, float]]]) -> np.ndarray:
+        if not pairs:
+            return np.empty(0)
+        rows = np.array([(a[0], a[1], b[0], b[1]) for a, b in pairs], dtype=np.float64)
+        if len(rows) <= INLINE_PAIRS:
+            return geodesic_km.__wrapped__(rows)
+        return np.concatenate([
+            await geodesic_km(rows[start:start + COMPUTE_BATCH]) for start in range(0, len(rows), COMPUTE_BATCH)
+        ])
+
+    async def distance(self, a: Tuple[float, float], b: Tuple[float, float]) -> float:
+        return (await self.get_many([(a, b)]))[pair_key(a, b)]
+
+    async def matrix(self, points: List[Tuple[float, float]]):
+        """Load every pairwise distance between points and return a synchronous (a, b) -> km lookup."""
+        points = list({point_key(point): point for point in points if point}.values())
+        known = await self.get_many((points[i], points[j]) for i in range(len(points)) for j in range(i, len(points)))
+
+        def lookup(a, b):
+            key = pair_key(a, b)
+            km = known.get(key)
+            if km is None:
+                # Outside the preloaded set; keep it in memory for the rest of the run
+                km = self._recall(key)
+                if km is None:
+                    km = float(geodesic_km.__wrapped__(np.array([(a[0], a[1], b[0], b[1])]))[0])
+                    self._remember(key, km)
+                known[key] = km
+            return km
+
+        return lookup
+
+    def forget_point(self, point: str):
+        """Drop a point's pairs from the memory tier only."""
+        for key in self._by_point.pop(point, set()):
+            self._entries.pop(key, None)
+            first, second = key.split("|")
+            other = second if first == point else first
+            if other in self._by_point:
+                self._by_point[other].discard(key)
+
+    def on_invalidate(self, tags: Tuple[str, ...]):
+        for tag in tags:
+            if tag.startswith(POINT_TAG):
+                self.forget_point(tag[len(POINT_TAG):])
+
+    async def invalidate_point(self, coord: Tuple[float, float]):
+        """Forget every pair touching a site whose coordinate has moved."""
+        point = point_key(coord)
+        await self.collection.delete_many({"$or": [{"a": point}, {"b": point}]})
+        # Clears this worker's memory tier through on_invalidate, and the other workers' through the bus
+        cache.invalidate_tags(POINT_TAG + point)
@@ -0,0 +1,82 @@
+import hashlib
+import inspect
+from typing import Any, Awaitable, Callable, Optional, Union
+from fastapi import Request, Response
+from services.responses import BSONJSONResponse, dumps
+
+# Clients may reuse a stored copy but must revalidate it on every use
+CACHE_CONTROL = "private, no-cache"
+
+
+def _digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=12).hexdigest()
+
+
+def version_etag(*parts: Any) -> str:
+    """
+    Weak ETag derived from metadata such as ids, updated_at values and counts.
+
+    Weak because it identifies the version of the data, not the exact bytes of a response.
+    """
+    return f'W/"{_digest(dumps(parts))}"'
+
+
+def content_etag(body: bytes) -> str:
+    return f'"{_digest(body)}"'
+
+
+def matches(request: Request, etag: str) -> bool:
+    """Weak comparison against If-None-Match, as RFC 9110 prescribes for GET."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    tag = etag[2:] if etag.startswith("W/") else etag
+    return any(
+        (candidate[2:] if candidate.startswith("W/") else candidate) == tag
+        for candidate in (part.strip() for part in header.split(","))
+    )
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+
+async def conditional(request: Request, version: Optional[Any], build: Callable[[], Union[Any, Awaitable[Any]]]) -> Response:
+    """
+    Answer a GET from metadata when possible.
+
+    `version` is whatever identifies the current state of the data (None when it does not exist,
+    so the body builder reports the 404). A matching If-None-Match gets a 304 without `build`
+    being called; otherwise the body is built and sent with the ETag.
+    """
+    if version is None:
+        return BSONJSONResponse(await _call(build))
+    etag = version_etag(request.url.path, str(request.query_params), version)
+    if matches(request, etag):
+        return not_modified(etag)
+    response = BSONJSONResponse(await _call(build))
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return response
+
+
+async def _call(build):
+    body = build()
+    return await body if inspect.isawaitable(body) else body
+
+
+def content_conditional(request: Request, content: Any) -> Response:
+    """
+    ETag from the encoded body, for views whose state cannot be read from metadata.
+
+    The body still has to be built, but an unchanged one is not sent again.
+    """
+    body = dumps(content)
+    etag = content_etag(body)
+    if matches(request, etag):
+        return not_modified(etag)
+    return Response(
+        content=body, media_type="application/json", headers={"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    )
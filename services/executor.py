@@ -0,0 +1,157 @@
+import asyncio
+import functools
+import importlib
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, Optional
+from fastapi import HTTPException, status
+from database.config import THREAD_POOL_WORKERS, PROCESS_POOL_WORKERS
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+THREAD = "thread"
+PROCESS = "process"
+# Calls allowed to wait for a free worker, per worker; past that new calls are refused with a 503
+QUEUE_PER_WORKER = 16
+
+tasks_total = metrics.counter("executor_tasks_total", "Calls handed to a worker pool by outcome", ("pool", "result"))
+pending_gauge = metrics.gauge("executor_pending", "Calls queued or running in a worker pool", ("pool",))
+wait_seconds = metrics.histogram(
+    "executor_wait_seconds", "Time a call waited for a free worker", ("pool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+run_seconds = metrics.histogram(
+    "executor_run_seconds", "Time a call spent running in a worker", ("pool", "function"),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+
+
+def _execute(target, args, kwargs):
+    # Runs in the worker. Process pools get a (module, qualname) pair, since the function itself
+    # was replaced at module level by its async wrapper and cannot be pickled by reference.
+    if isinstance(target, tuple):
+        module, qualname = target
+        target = importlib.import_module(module)
+        for part in qualname.split("."):
+            target = getattr(target, part)
+        target = getattr(target, "__wrapped__", target)
+    started = time.time()
+    result = target(*args, **kwargs)
+    return started, time.time(), result
+
+
+class BoundedPool:
+    """
+    A thread or process pool that refuses work instead of queueing it without limit.
+
+    Both kinds of executor keep an unbounded internal queue, so the pool counts calls that are
+    queued or running and answers 503 once that passes the worker count plus the allowed backlog.
+    A caller that is cancelled, by its deadline or a dropped client, also withdraws its call if no
+    worker has picked it up yet. The executor is created on first use and re-created if a worker
+    process dies.
+    """
+
+    def __init__(self, name: str, workers: int, queue_limit: int):
+        self.name = name
+        self.workers = workers
+        self.queue_limit = queue_limit
+        self.pending = 0
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+    def _create(self) -> Executor:
+        if self.name == PROCESS:
+            # forkserver children start clean instead of copying this process's threads and sockets
+            return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("forkserver"))
+        return ThreadPoolExecutor(self.workers, thread_name_prefix=f"{self.name}-pool")
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = self._create()
+        return self._executor
+
+    def _finished(self, future):
+        with self._lock:
+            self.pending -= 1
+            pending_gauge.set(self.pending, pool=self.name)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        with self._lock:
+            if self.pending >= self.workers + self.queue_limit:
+                tasks_total.inc(pool=self.name, result="rejected")
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Server busy: try again shortly",
+                    headers={"Retry-After": "1"},
+                )
+            self.pending += 1
+            pending_gauge.set(self.pending, pool=self.name)
+
+        target = (fn.__module__, fn.__qualname__) if self.name == PROCESS else fn
+        submitted = time.time()
+        try:
+            future = self.executor.submit(_execute, target, args, kwargs)
+        except BaseException:
+            self._finished(None)
+            raise
+        future.add_done_callback(self._finished)
+        try:
+            started, finished, result = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            logger.warning("%s pool lost a worker; starting a new pool", self.name)
+            self._executor = None
+            tasks_total.inc(pool=self.name, result="error")
+            raise
+        except asyncio.CancelledError:
+            tasks_total.inc(pool=self.name, result="cancelled")
+            raise
+        except Exception:
+            tasks_total.inc(pool=self.name, result="error")
+            raise
+        tasks_total.inc(pool=self.name, result="ok")
+        wait_seconds.observe(max(started - submitted, 0.0), pool=self.name)
+        run_seconds.observe(finished - started, pool=self.name, function=fn.__qualname__)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+pools: Dict[str, BoundedPool] = {
+    # Short calls and anything that releases the GIL
+    THREAD: BoundedPool(THREAD, THREAD_POOL_WORKERS, THREAD_POOL_WORKERS * QUEUE_PER_WORKER),
+    # Pure-Python CPU work, which would otherwise hold the GIL against the event loop
+    PROCESS: BoundedPool(PROCESS, PROCESS_POOL_WORKERS, PROCESS_POOL_WORKERS * QUEUE_PER_WORKER),
+}
+
+
+def offload(pool: str = THREAD):
+    """
+    Turn a blocking function into a coroutine function that runs it in one of the shared pools.
+
+    The original stays reachable as `__wrapped__`. Functions sent to the process pool must be
+    defined at module level and take and return picklable values, and each worker imports their
+    module, so they belong in modules that are cheap to import.
+    """
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            return await pools[pool].run(fn, *args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def shutdown():
+    for pool in pools.values():
+        pool.shutdown()
@@ -0,0 +1,46 @@
+import math
+from typing import Any, Optional, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Average door-to-door speed used to turn distances into travel times
+AVERAGE_SPEED_KMH = 40.0
+
+
+def coordinate_of(value: Any) -> Optional[Tuple[float, float]]:
+    """Return (latitude, longitude) from a Coordinate/Address model or raw Mongo dict."""
+    if value is None:
+        return None
+    if not isinstance(value, dict):
+        value = value.model_dump() if hasattr(value, "model_dump") else vars(value)
+    # Addresses wrap the point in a nested coordinate
+    if "coordinate" in value:
+        return coordinate_of(value["coordinate"])
+    latitude = value.get("latitude")
+    longitude = value.get("longitude")
+    if latitude is None or longitude is None:
+        return None
+    return float(latitude), float(longitude)
+
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    lat1, lon1 = math.radians(a[0]), math.radians(a[1])
+    lat2, lon2 = math.radians(b[0]), math.radians(b[1])
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def travel_minutes(km: float) -> float:
+    return km / AVERAGE_SPEED_KMH * 60
+
+
+def bearing(origin: Tuple[float, float], point: Tuple[float, float]) -> float:
+    # Planar angle is enough to sweep points around a supervisor's base
+    return math.atan2(point[0] - origin[0], (point[1] - origin[1]) * math.cos(math.radians(origin[0])))
+
+
+def centroid(points) -> Optional[Tuple[float, float]]:
+    points = [p for p in points if p]
+    if not points:
+        return None
+    return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
@@ -0,0 +1,122 @@
+import json
+import os
+import re
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+from pymongo import UpdateOne
+from services.service import db, distance_cache
+from services import geo
+from services.cache import invalidate_tags
+
+GRID_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "ghanapost_grid.json")
+CACHE_SIZE = 100_000
+
+# e.g. "AK-484-9321", "GA0123 4567" or "ak4849321"
+ADDRESS_PATTERN = re.compile(r"^([A-Z])([A-Z])-?(\d{3,4})-?(\d{4})$")
+
+with open(GRID_FILE) as grid_file:
+    _grid = json.load(grid_file)
+REGIONS = _grid["regions"]
+DISTRICTS = _grid["districts"]
+
+
+def normalize(address: str) -> str:
+    return re.sub(r"[\s_]+", "", address or "").upper()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _decode(address: str) -> Optional[Tuple[float, float, str]]:
+    match = ADDRESS_PATTERN.match(address)
+    if not match:
+        return None
+    region, district, column, row = match.groups()
+    entry = DISTRICTS.get(region + district)
+    precision = "district"
+    if entry is None:
+        entry = REGIONS.get(region)
+        precision = "region"
+    if entry is None:
+        return None
+
+    # The two numeric blocks locate a cell west-to-east and south-to-north inside the
+    # district (or region) extent; the centre of that cell is returned
+    south, west, north, east = entry["bounds"]
+    x = (int(column) + 0.5) / 10 ** len(column)
+    y = (int(row) + 0.5) / 10 ** len(row)
+    return round(south + y * (north - south), 6), round(west + x * (east - west), 6), precision
+
+
+def decode(address: Optional[str]) -> Optional[Tuple[float, float]]:
+    """
+    Estimate the (latitude, longitude) of a GhanaPostGPS digital address without any network call.
+
+    This is not the GhanaPost grid: the numeric blocks are spread linearly over approximate
+    district or region extents, so the result is only good to a few kilometres and codes from
+    regions missing from the grid file do not resolve.
+    """
+    decoded = _decode(normalize(address)) if address else None
+    return decoded[:2] if decoded else None
+
+
+def decode_with_precision(address: Optional[str]) -> Optional[Dict[str, object]]:
+    decoded = _decode(normalize(address)) if address else None
+    if not decoded:
+        return None
+    return {"latitude": decoded[0], "longitude": decoded[1], "precision": decoded[2], "approximate": True}
+
+
+def decode_many(addresses: Iterable[Optional[str]]) -> Dict[str, Optional[Tuple[float, float]]]:
+    """Decode a batch, resolving each distinct address once."""
+    return {address: decode(address) for address in set(addresses) if address}
+
+
+def cache_info():
+    return _decode.cache_info()._asdict()
+
+
+async def backfill_home_coordinates() -> Dict[str, int]:
+    """
+    Estimate homeTown_coordinate from the digital address for students without one, in one bulk write.
+
+    Estimates are flagged with homeTown_coordinate_approximate. A coordinate that was not
+    estimated here is never replaced; an earlier estimate is refreshed, and when it moves the
+    distances cached for the old point are dropped.
+    """
+    students = await db.students.find(
+        {
+            "homeTown_GPS_Address": {"$nin": [None, ""]},
+            "$or": [{"homeTown_coordinate": None}, {"homeTown_coordinate_approximate": True}],
+        },
+        {"homeTown_GPS_Address": 1, "homeTown_coordinate": 1},
+    ).to_list(None)
+    coordinates = decode_many(student["homeTown_GPS_Address"] for student in students)
+
+    now = datetime.utcnow()
+    operations = []
+    moved = set()
+    unresolved = 0
+    for student in students:
+        coordinate = coordinates.get(student["homeTown_GPS_Address"])
+        if coordinate is None:
+            unresolved += 1
+            continue
+        previous = geo.coordinate_of(student.get("homeTown_coordinate"))
+        if previous == coordinate:
+            continue
+        if previous:
+            moved.add(previous)
+        operations.append(UpdateOne(
+            {"_id": student["_id"]},
+            {"$set": {
+                "homeTown_coordinate": {"latitude": coordinate[0], "longitude": coordinate[1]},
+                "homeTown_coordinate_approximate": True,
+                "updated_at": now,
+            }}
+        ))
+    if operations:
+        await db.students.bulk_write(operations, ordered=False)
+        invalidate_tags("students")
+    for point in moved:
+        await distance_cache.invalidate_point(point)
+    return {"students": len(students), "updated": len(operations), "moved": len(moved), "unresolved": unresolved}
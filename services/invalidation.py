@@ -0,0 +1,176 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Optional, Set, Tuple
+from pymongo import CursorType
+from pymongo.errors import CollectionInvalid, DuplicateKeyError, OperationFailure, PyMongoError
+from services import cache, metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "cache_invalidations"
+# Capped, so the collection never needs cleaning; a worker that falls further behind than this
+# notices the gap in sequence numbers and clears its caches instead
+CAPPED_BYTES = 4 * 1024 * 1024
+RETRY_SECONDS = 2
+# A re-opened cursor starts this far before the last event seen; repeats are dropped by sequence
+OVERLAP_SECONDS = 5
+# Returned by servers that are not part of a replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+published_total = metrics.counter("invalidation_published_total", "Invalidation events sent to other workers")
+received_total = metrics.counter("invalidation_received_total", "Invalidation events applied from other workers")
+missed_total = metrics.counter("invalidation_missed_total", "Events known to be lost, from sequence gaps")
+recoveries_total = metrics.counter(
+    "invalidation_recoveries_total", "Full local cache clears after lost events or a broken feed", ("reason",)
+)
+latency_seconds = metrics.histogram(
+    "invalidation_latency_seconds", "Delay between a write in one worker and the invalidation in another",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 30.0),
+)
+
+
+class InvalidationBus:
+    """
+    Broadcasts cache invalidations between workers through Mongo.
+
+    Every local invalidation is inserted into a capped collection. Other workers receive it from
+    a change stream or, on a standalone server, from a tailable cursor on the same collection, and
+    apply it to their own caches without sending it back out. Events carry a per-worker sequence
+    number so a receiver can tell when it has lost some; it then clears everything, trading a burst
+    of misses for never serving data a peer has invalidated.
+
+    One sender task per worker inserts the events one after the other, retrying a failed insert
+    before the next, so sequence numbers commit in order and a gap always means a lost event.
+    Tags published while an insert is in flight are merged into the next event.
+    """
+
+    def __init__(self):
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.transport: Optional[str] = None
+        self._sequence = itertools.count(1)
+        self._seen: Dict[str, int] = {}
+        # Tags waiting for the sender, and when the oldest of them was published
+        self._outbox: Set[str] = set()
+        self._outbox_since = 0.0
+        self._ready: Optional[asyncio.Event] = None
+        self._collection = None
+        cache.forward(self.publish)
+
+    def publish(self, tags: Tuple[str, ...]):
+        if self._collection is None or not tags:
+            return
+        if not self._outbox:
+            self._outbox_since = time.time()
+        self._outbox.update(tags)
+        self._ready.set()
+
+    async def _send(self):
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            if not self._outbox:
+                continue
+            tags, self._outbox = sorted(self._outbox), set()
+            event = {"origin": self.worker_id, "seq": next(self._sequence), "tags": tags, "at": self._outbox_since}
+            while True:
+                try:
+                    await self._collection.insert_one(event)
+                except DuplicateKeyError:
+                    # An earlier attempt went through after all
+                    pass
+                except PyMongoError as e:
+                    logger.warning("Invalidation of %s not broadcast yet, retrying: %s", tags, e)
+                    await asyncio.sleep(RETRY_SECONDS)
+                    continue
+                published_total.inc()
+                break
+
+    def receive(self, event: dict):
+        origin = event.get("origin")
+        if origin == self.worker_id:
+            return
+        sequence = event.get("seq", 0)
+        last = self._seen.get(origin)
+        if last is not None and sequence <= last:
+            return
+        self._seen[origin] = sequence
+        if last is not None and sequence > last + 1:
+            missed_total.inc(sequence - last - 1)
+            self.recover("gap")
+        received_total.inc()
+        latency_seconds.observe(max(time.time() - event.get("at", time.time()), 0.0))
+        cache.invalidate_tags(*event.get("tags", ()), remote=True)
+
+    def recover(self, reason: str):
+        """Drop every local cached view after events may have been lost."""
+        recoveries_total.inc(reason=reason)
+        cache.clear_all()
+
+    async def ensure_collection(self, db):
+        try:
+            await db.create_collection(COLLECTION, capped=True, size=CAPPED_BYTES)
+        except (CollectionInvalid, OperationFailure):
+            # Already there
+            pass
+        self._collection = db[COLLECTION]
+
+    async def _watch(self):
+        resume_token = None
+        while True:
+            try:
+                async with self._collection.watch(
+                    [{"$match": {"operationType": "insert"}}], resume_after=resume_token
+                ) as stream:
+                    self.transport = "change_stream"
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self.receive(change["fullDocument"])
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable; tailing %s instead", COLLECTION)
+                    await self._tail()
+                    return
+                logger.warning("Invalidation stream failed: %s", e)
+                # The resume point may be gone; start over from now
+                resume_token = None
+                self.recover("stream")
+            except PyMongoError as e:
+                logger.warning("Invalidation stream interrupted: %s", e)
+                self.recover("stream")
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _tail(self):
+        self.transport = "tailable_cursor"
+        # ObjectIds from different workers are not ordered within a second, so the cursor is
+        # positioned by event time instead
+        since = time.time()
+        while True:
+            try:
+                cursor = self._collection.find(
+                    {"at": {"$gte": since - OVERLAP_SECONDS}}, cursor_type=CursorType.TAILABLE_AWAIT
+                )
+                while cursor.alive:
+                    async for event in cursor:
+                        since = max(since, event.get("at", since))
+                        self.receive(event)
+                    await asyncio.sleep(0.05)
+            except PyMongoError as e:
+                logger.warning("Invalidation cursor interrupted: %s", e)
+                self.recover("cursor")
+            await asyncio.sleep(RETRY_SECONDS)
+
+    async def _run(self):
+        await asyncio.gather(self._send(), self._watch())
+
+    async def start(self, db) -> asyncio.Task:
+        # Bound to the loop serving requests; nothing is published before the collection is set below
+        self._ready = asyncio.Event()
+        await self.ensure_collection(db)
+        return asyncio.create_task(self._run())
+
+
+bus = InvalidationBus()
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Optional
+from database.config import LOOP_WATCHDOG_SECONDS
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_SECONDS = 0.1
+# A sample this late counts as a stall
+STALL_SECONDS = 0.1
+STACK_LIMIT = 25
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+lag_seconds = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke a timer",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+last_lag = metrics.gauge("event_loop_lag_last_seconds", "Lag of the most recent sample")
+stalls_total = metrics.counter("event_loop_stalls_total", "Samples delayed by more than the stall threshold")
+blocked_total = metrics.counter(
+    "event_loop_blocked_total", "Callbacks caught by the watchdog holding the event loop", ("function",)
+)
+
+
+def _culprit(frame) -> str:
+    """The innermost frame in this codebase, or the innermost frame if none is ours."""
+    innermost = frame
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_ROOT) and "site-packages" not in filename:
+            break
+        frame = frame.f_back
+    frame = frame or innermost
+    return f"{os.path.relpath(frame.f_code.co_filename, _ROOT)}:{frame.f_code.co_name}"
+
+
+class LoopMonitor:
+    """
+    Samples event-loop scheduling delay, and optionally catches what is blocking it.
+
+    A task sleeps for a fixed interval and records how much later than asked it woke up; anything
+    synchronous on the loop (a slow print, a hashing loop, a big json encode) shows up as lag.
+
+    With a watchdog threshold set, a thread also watches the sampler's heartbeat. When the loop has
+    not come back for longer than the threshold, the thread takes the loop thread's current stack,
+    so the report names the code that is blocking while it is still blocking. Each stall is
+    reported once and counted by the function at fault.
+    """
+
+    def __init__(self, interval: float = SAMPLE_SECONDS, watchdog_seconds: float = LOOP_WATCHDOG_SECONDS):
+        self.interval = interval
+        self.watchdog_seconds = watchdog_seconds
+        self._beat = time.monotonic()
+        self._loop_thread: Optional[int] = None
+        self._stop = threading.Event()
+
+    async def sample(self):
+        try:
+            while True:
+                started = time.monotonic()
+                await asyncio.sleep(self.interval)
+                self._beat = now = time.monotonic()
+                lag = max(now - started - self.interval, 0.0)
+                lag_seconds.observe(lag)
+                last_lag.set(lag)
+                if lag > STALL_SECONDS:
+                    stalls_total.inc()
+        finally:
+            self._stop.set()
+
+    def _watch(self):
+        reported = None
+        while not self._stop.wait(self.watchdog_seconds / 4):
+            beat = self._beat
+            blocked = time.monotonic() - beat - self.interval
+            if blocked < self.watchdog_seconds or beat == reported:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            reported = beat
+            function = _culprit(frame)
+            blocked_total.inc(function=function)
+            logger.warning(
+                "Event loop blocked for %.0f ms in %s\n%s",
+                blocked * 1e3, function, "".join(traceback.format_stack(frame, limit=STACK_LIMIT)),
+            )
+
+    def start(self) -> asyncio.Task:
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        task = asyncio.create_task(self.sample())
+        if self.watchdog_seconds > 0:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        return task
+
+
+monitor = LoopMonitor()
@@ -0,0 +1,169 @@
+from typing import Optional, Dict, Any, List
+import numpy as np
+from bson import ObjectId
+from fastapi import HTTPException
+from services.service import db
+from services import geo
+from services.cache import AsyncCache, cached
+
+MAX_ZOOM = 22
+TILE_PIXELS = 256
+# Width of a cluster cell on screen; the number of markers returned is bounded by (screen / cell)^2
+CELL_PIXELS = 60
+# Coordinates are sent as integers scaled by 10^PRECISION and delta-encoded
+PRECISION = 5
+REFRESH_SECONDS = 60
+# Most cells a query walks, about a 4K screen of CELL_PIXELS cells; larger boxes are answered
+# from a coarser zoom so the payload stays bounded whatever the box
+MAX_CELLS = 2500
+
+STUDENT = 0
+COMPANY = 1
+
+
+def cell_degrees(zoom: int) -> float:
+    return CELL_PIXELS * 360.0 / (TILE_PIXELS * 2 ** zoom)
+
+
+class MarkerIndex:
+    """
+    Grid clustering index over a fixed set of points.
+
+    Each zoom level gets its own grid, built once with numpy and kept sorted by cell key, so a
+    bounding-box query only walks the cells that are on screen whatever the number of points.
+    """
+
+    def __init__(self, latitudes: np.ndarray, longitudes: np.ndarray, kinds: np.ndarray):
+        self.latitudes = latitudes
+        self.longitudes = longitudes
+        self.kinds = kinds
+        self._grids: Dict[int, Dict[str, np.ndarray]] = {}
+
+    @classmethod
+    def from_points(cls, points: List[tuple]):
+        """Build from (latitude, longitude, kind) tuples."""
+        array = np.array(points, dtype=np.float64).reshape(-1, 3)
+        return cls(array[:, 0], array[:, 1], array[:, 2].astype(np.int8))
+
+    def _grid(self, zoom: int) -> Dict[str, np.ndarray]:
+        grid = self._grids.get(zoom)
+        if grid is not None:
+            return grid
+        size = cell_degrees(zoom)
+        columns = int(np.ceil(360.0 / size)) + 1
+        cx = np.floor((self.longitudes + 180.0) / size).astype(np.int64)
+        cy = np.floor((self.latitudes + 90.0) / size).astype(np.int64)
+        keys, inverse = np.unique(cy * columns + cx, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(keys))
+        grid = {
+            "columns": columns,
+            "size": size,
+            "keys": keys,
+            "counts": counts,
+            "latitude": np.bincount(inverse, weights=self.latitudes, minlength=len(keys)) / np.maximum(counts, 1),
+            "longitude": np.bincount(inverse, weights=self.longitudes, minlength=len(keys)) / np.maximum(counts, 1),
+            "companies": np.bincount(inverse, weights=(self.kinds == COMPANY), minlength=len(keys)).astype(np.int64),
+        }
+        self._grids[zoom] = grid
+        return grid
+
+    @staticmethod
+    def _cell_range(min_lat: float, min_lon: float, max_lat: float, max_lon: float, size: float):
+        x0, x1 = int((min_lon + 180.0) // size), int((max_lon + 180.0) // size)
+        y0, y1 = int((min_lat + 90.0) // size), int((max_lat + 90.0) // size)
+        return x0, x1, y0, y1
+
+    def query(self, min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int) -> Dict[str, Any]:
+        # A box spanning more cells than a screen holds is clustered at a coarser zoom; the zoom
+        # used is returned so the client can tell
+        while zoom > 0:
+            x0, x1, y0, y1 = self._cell_range(min_lat, min_lon, max_lat, max_lon, cell_degrees(zoom))
+            if (x1 - x0 + 1) * (y1 - y0 + 1) <= MAX_CELLS:
+                break
+            zoom -= 1
+        grid = self._grid(zoom)
+        size, columns, keys = grid["size"], grid["columns"], grid["keys"]
+        x0, x1, y0, y1 = self._cell_range(min_lat, min_lon, max_lat, max_lon, size)
+
+        if y1 - y0 + 1 <= len(keys):
+            # One binary search per on-screen row of cells
+            rows = np.arange(y0, y1 + 1, dtype=np.int64) * columns
+            starts = np.searchsorted(keys, rows + x0, side="left")
+            ends = np.searchsorted(keys, rows + x1, side="right")
+            selected = np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)] + [np.array([], dtype=np.int64)])
+        else:
+            # A box far larger than the screen: scanning the occupied cells is cheaper
+            cy, cx = keys // columns, keys % columns
+            selected = np.nonzero((cy >= y0) & (cy <= y1) & (cx >= x0) & (cx <= x1))[0]
+        selected = selected.astype(np.int64)
+
+        scale = 10 ** PRECISION
+        latitudes = np.round(grid["latitude"][selected] * scale).astype(np.int64)
+        longitudes = np.round(grid["longitude"][selected] * scale).astype(np.int64)
+        counts = grid["counts"][selected]
+        companies = grid["companies"][selected]
+        return {
+            "zoom": zoom,
+            "precision": PRECISION,
+            "clusters": int(len(selected)),
+            "points": int(counts.sum()),
+            # First value is absolute, every following value is the difference to the previous one
+            "lat": np.diff(latitudes, prepend=0).tolist(),
+            "lon": np.diff(longitudes, prepend=0).tolist(),
+            "count": counts.tolist(),
+            "companies": companies.tolist(),
+        }
+
+
+def _rows_to_points(students: List[dict], companies: List[dict]) -> List[tuple]:
+    points = []
+    for student in students:
+        coordinate = geo.coordinate_of(student.get("current_location"))
+        if coordinate:
+            points.append((coordinate[0], coordinate[1], STUDENT))
+    for company in companies:
+        coordinate = geo.coordinate_of(company.get("address"))
+        if coordinate:
+            points.append((coordinate[0], coordinate[1], COMPANY))
+    return points
+
+
+# The one global index. Concurrent requests share a single build, and once it is REFRESH_SECONDS
+# old it keeps being served while one background rebuild runs
+index_cache = AsyncCache("markers", maxsize=1, ttl=REFRESH_SECONDS, stale_ttl=REFRESH_SECONDS)
+
+
+@cached(index_cache)
+async def get_global_index() -> MarkerIndex:
+    students = await db.students.find(
+        {"current_location.latitude": {"$ne": None}}, {"current_location": 1, "_id": 0}
+    ).to_list(None)
+    companies = await db.companies.find(
+        {"address.coordinate.latitude": {"$ne": None}}, {"address.coordinate": 1, "_id": 0}
+    ).to_list(None)
+    return MarkerIndex.from_points(_rows_to_points(students, companies))
+
+
+async def get_supervisor_index(supervisor_id: str) -> MarkerIndex:
+    """Small, uncached index over a supervisor's own students and their companies."""
+    supervisor = await db.school_supervisors.find_one({"user_id": supervisor_id}, {"assigned_students": 1})
+    if not supervisor:
+        raise HTTPException(status_code=404, detail="Supervisor not found")
+    student_ids = [ObjectId(student_id) for student_id in supervisor.get("assigned_students") or []]
+    students = await db.students.find({"_id": {"$in": student_ids}}, {"current_location": 1, "internships": 1}).to_list(None)
+    internship_ids = [internship_id for student in students for internship_id in student.get("internships") or []]
+    internships = await db.internships.find({"_id": {"$in": internship_ids}}, {"company_id": 1}).to_list(None)
+    company_ids = list({internship["company_id"] for internship in internships if internship.get("company_id")})
+    companies = await db.companies.find({"_id": {"$in": company_ids}}, {"address.coordinate": 1}).to_list(None)
+    return MarkerIndex.from_points(_rows_to_points(students, companies))
+
+
+async def get_map_markers(
+    min_lat: float, min_lon: float, max_lat: float, max_lon: float, zoom: int, supervisor_id: Optional[str] = None
+) -> Dict[str, Any]:
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise HTTPException(status_code=400, detail=f"zoom must be between 0 and {MAX_ZOOM}")
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lon <= max_lon <= 180):
+        raise HTTPException(status_code=400, detail="Invalid bounding box")
+    index = await get_supervisor_index(supervisor_id) if supervisor_id else await get_global_index()
+    return index.query(min_lat, min_lon, max_lat, max_lon, zoom)
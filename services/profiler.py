@@ -0,0 +1,149 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import signal
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, Iterable, List, Optional, Tuple
+from services import metrics
+
+# CPU time between samples
+SAMPLE_INTERVAL_SECONDS = 0.005
+# Profiles kept in memory; the oldest are dropped first
+BUFFER_SIZE = 200
+STACK_DEPTH = 64
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_ASYNCIO = os.path.dirname(asyncio.__file__)
+
+profiles_total = metrics.counter("profiles_recorded_total", "Request profiles recorded", ("trigger",))
+
+# Profile of the request whose code is running, if it is being profiled
+_active: contextvars.ContextVar[Optional["RequestProfile"]] = contextvars.ContextVar("active_profile", default=None)
+
+
+def _frame_label(code) -> str:
+    filename = code.co_filename
+    if filename.startswith(_ROOT) and "site-packages" not in filename:
+        filename = os.path.relpath(filename, _ROOT)
+    elif "site-packages" in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename})"
+
+
+def _collapse(frame) -> str:
+    """Root-first, semicolon-separated stack, without the event loop frames every sample shares."""
+    codes = []
+    while frame is not None and len(codes) < STACK_DEPTH:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    for index, code in enumerate(codes):
+        # Handle._run is where the loop steps into a task; everything outside it is the loop itself
+        if code.co_name == "_run" and code.co_filename.startswith(_ASYNCIO):
+            del codes[index:]
+            break
+    return ";".join(_frame_label(code) for code in reversed(codes))
+
+
+class RequestProfile:
+    __slots__ = ("id", "method", "path", "route", "trigger", "started_at", "duration", "samples", "stacks")
+
+    def __init__(self, profile_id: int, method: str, path: str, trigger: str):
+        self.id = profile_id
+        self.method = method
+        self.path = path
+        self.route = path
+        self.trigger = trigger
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "trigger": self.trigger,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 6),
+            "samples": self.samples,
+        }
+
+
+class Profiler:
+    """
+    Statistical CPU profiler for individual requests.
+
+    While at least one profiled request is in flight, a SIGPROF interval timer interrupts the
+    process every few milliseconds of CPU time. The handler runs on the event-loop thread in the
+    context of whatever task was interrupted, so a context variable tells it which request the
+    stack belongs to; samples taken while other requests run are ignored. Stacks are kept in
+    collapsed form, ready for flamegraph.pl or speedscope, and finished profiles go into a ring
+    buffer keyed by route template.
+
+    The timer is disarmed when the last profile ends, so requests that are not profiled pay
+    nothing. Signals only reach the main thread, so profiling is skipped when the app runs
+    elsewhere, as under a test client.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS, size: int = BUFFER_SIZE):
+        self.interval = interval
+        self.profiles: Deque[RequestProfile] = deque(maxlen=size)
+        self._ids = itertools.count(1)
+        self._running = 0
+        self._installed = False
+
+    @staticmethod
+    def available() -> bool:
+        return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+    def _sample(self, signum, frame):
+        profile = _active.get()
+        if profile is not None and frame is not None:
+            profile.samples += 1
+            profile.stacks[_collapse(frame)] += 1
+
+    def begin(self, method: str, path: str, trigger: str) -> Optional[Tuple[RequestProfile, contextvars.Token]]:
+        if not self.available():
+            return None
+        if not self._installed:
+            signal.signal(signal.SIGPROF, self._sample)
+            self._installed = True
+        if self._running == 0:
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self._running += 1
+        profile = RequestProfile(next(self._ids), method, path, trigger)
+        return profile, _active.set(profile)
+
+    def end(self, session: Tuple[RequestProfile, contextvars.Token], route: Optional[str] = None):
+        profile, token = session
+        _active.reset(token)
+        self._running -= 1
+        if self._running == 0:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        profile.duration = time.time() - profile.started_at
+        profile.route = route or profile.path
+        self.profiles.append(profile)
+        profiles_total.inc(trigger=profile.trigger)
+
+    def find(self, route: Optional[str] = None, profile_id: Optional[int] = None) -> List[RequestProfile]:
+        return [
+            profile for profile in self.profiles
+            if (route is None or profile.route == route) and (profile_id is None or profile.id == profile_id)
+        ]
+
+    @staticmethod
+    def collapsed(profiles: Iterable[RequestProfile]) -> str:
+        """Merge the stacks of several profiles into collapsed-stack text."""
+        merged: Counter = Counter()
+        for profile in profiles:
+            merged.update(profile.stacks)
+        return "".join(f"{stack} {count}\n" for stack, count in merged.most_common())
+
+
+profiler = Profiler()
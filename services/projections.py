@@ -0,0 +1,56 @@
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, Optional
+from fastapi import HTTPException
+from database.models import _nested_model
+
+# `fields=*` asks for whole documents
+ALL_FIELDS = "*"
+
+# What the supervisor dashboard lists for each student. Names live on the student's user and are
+# joined in by user_id (service.attach_user_names), so user_id must stay in the summary
+STUDENT_SUMMARY_FIELDS = (
+    "user_id", "registration_number", "department_id", "programme_id", "zone_id",
+    "assigned_supervisor", "current_location",
+)
+
+
+@lru_cache(maxsize=None)
+def field_paths(model) -> FrozenSet[str]:
+    """Every document path a model declares, including dotted paths into nested models."""
+    paths = set()
+    for name, field in model.model_fields.items():
+        key = "_id" if name == "id" else name
+        paths.add(key)
+        nested, _ = _nested_model(field.annotation)
+        if nested is not None:
+            paths.update(f"{key}.{path}" for path in field_paths(nested))
+    return frozenset(paths)
+
+
+def projection(model, fields: Optional[str], default: Optional[Iterable[str]] = None) -> Optional[Dict[str, int]]:
+    """
+    Mongo projection for a comma-separated `fields=` value.
+
+    Requested names are checked against the model so typos fail with a 400 instead of silently
+    returning empty documents. Without `fields` the endpoint default applies; None means the whole
+    document.
+    """
+    if fields is not None and fields.strip() == ALL_FIELDS:
+        return None
+    requested = [part.strip() for part in (fields or "").split(",") if part.strip()]
+    if requested:
+        requested = ["_id" if name == "id" else name for name in requested]
+        unknown = sorted(set(requested) - field_paths(model))
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields for {model.__name__}: {', '.join(unknown)}")
+    else:
+        requested = list(default or [])
+    if not requested:
+        return None
+
+    # Mongo rejects a projection naming both a path and one of its parents; the parent covers both
+    paths = set(requested)
+    return {
+        path: 1 for path in sorted(paths)
+        if not any(path.startswith(parent + ".") for parent in paths)
+    }
@@ -0,0 +1,236 @@
+import asyncio
+import itertools
+import json
+import logging
+from collections import OrderedDict, defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo.errors import OperationFailure, PyMongoError
+from services.service import db
+
+logger = logging.getLogger(__name__)
+
+QUEUE_SIZE = 100
+HEARTBEAT_SECONDS = 15
+RETRY_SECONDS = 5
+# Returned by servers that are not part of a replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+
+class LocalBroker:
+    """
+    In-process broker.
+
+    Producers publish events here and every hub in the process receives them. Each worker feeds
+    its own broker from the Mongo change streams, so a networked broker only has to provide the
+    same publish/subscribe pair.
+    """
+
+    def __init__(self):
+        self._handlers: List[Callable[[dict], None]] = []
+
+    def subscribe(self, handler: Callable[[dict], None]):
+        self._handlers.append(handler)
+
+    async def publish(self, event: dict):
+        for handler in self._handlers:
+            handler(event)
+
+
+class Subscription:
+    """
+    Bounded queue of pending events for one connection.
+
+    Events that carry a key replace the pending event with the same key, so a slow client only
+    receives the latest state; when the queue is full the oldest event is dropped.
+    """
+
+    _sequence = itertools.count()
+
+    def __init__(self, topics: Iterable[str], maxsize: int = QUEUE_SIZE):
+        self.topics = set(topics)
+        self.maxsize = maxsize
+        self.dropped = 0
+        self.coalesced = 0
+        self._pending: "OrderedDict[Any, dict]" = OrderedDict()
+        self._ready = asyncio.Event()
+
+    def push(self, event: dict):
+        key = event.get("key") or next(self._sequence)
+        if key in self._pending:
+            self._pending[key] = event
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.maxsize:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+            self._pending[key] = event
+        self._ready.set()
+
+    async def drain(self, timeout: Optional[float] = None) -> List[dict]:
+        if not self._ready.is_set():
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        events = list(self._pending.values())
+        self._pending.clear()
+        self._ready.clear()
+        return events
+
+
+class Hub:
+    """Routes broker events to the subscriptions listening on their topic."""
+
+    def __init__(self, broker):
+        self._subscriptions: Dict[str, set] = defaultdict(set)
+        broker.subscribe(self.dispatch)
+
+    def dispatch(self, event: dict):
+        for subscription in self._subscriptions.get(event["topic"], ()):
+            subscription.push(event)
+
+    def connect(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(topics)
+        for topic in subscription.topics:
+            self._subscriptions[topic].add(subscription)
+        return subscription
+
+    def disconnect(self, subscription: Subscription):
+        for topic in subscription.topics:
+            listeners = self._subscriptions.get(topic)
+            if listeners is not None:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._subscriptions[topic]
+
+    @property
+    def connections(self) -> int:
+        return len({id(subscription) for listeners in self._subscriptions.values() for subscription in listeners})
+
+
+broker = LocalBroker()
+hub = Hub(broker)
+
+
+def student_topic(student_id) -> str:
+    return f"student:{student_id}"
+
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+
+async def publish_location(student_id, location, timestamp: Optional[datetime] = None):
+    await broker.publish({
+        "topic": student_topic(student_id),
+        "key": f"location:{student_id}",
+        "type": "location",
+        "data": {"student_id": student_id, "location": location, "timestamp": timestamp or datetime.utcnow()},
+    })
+
+
+async def publish_notification(notification: dict):
+    await broker.publish({
+        "topic": user_topic(notification.get("user_id")),
+        "type": "notification",
+        "data": notification,
+    })
+
+
+async def publish_logbook_submission(entry: dict):
+    await broker.publish({
+        "topic": student_topic(entry.get("student_id")),
+        "type": "logbook",
+        "data": entry,
+    })
+
+
+def _encode(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+def format_event(event: dict) -> str:
+    return f"event: {event['type']}\ndata: {json.dumps(event['data'], default=_encode)}\n\n"
+
+
+async def supervisor_topics(supervisor_id: str) -> List[str]:
+    supervisor = await db.school_supervisors.find_one({"user_id": supervisor_id}, {"assigned_students": 1})
+    if not supervisor:
+        raise HTTPException(status_code=404, detail="Supervisor not found")
+    topics = [user_topic(supervisor_id)]
+    topics.extend(student_topic(student_id) for student_id in supervisor.get("assigned_students") or [])
+    return topics
+
+
+async def event_stream(request, subscription: Subscription):
+    """Server-Sent Events body for one connection; the subscription is released when the client leaves."""
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            events = await subscription.drain(HEARTBEAT_SECONDS)
+            if not events:
+                yield ": heartbeat\n\n"
+            for event in events:
+                yield format_event(event)
+    finally:
+        hub.disconnect(subscription)
+
+
+# Change stream feeders
+async def _watch(collection, pipeline: List[dict], handle, **options):
+    resume_token = None
+    while True:
+        try:
+            async with collection.watch(pipeline, resume_after=resume_token, **options) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    await handle(change)
+        except OperationFailure as e:
+            if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                logger.warning("Change streams unavailable on %s; live updates disabled", collection.name)
+                return
+            logger.warning("Change stream on %s failed: %s", collection.name, e)
+        except PyMongoError as e:
+            logger.warning("Change stream on %s interrupted: %s", collection.name, e)
+        await asyncio.sleep(RETRY_SECONDS)
+
+
+async def _on_student_change(change: dict):
+    updated = change.get("updateDescription", {}).get("updatedFields", {})
+    if any(field.startswith("current_location") for field in updated):
+        student = change.get("fullDocument") or {}
+        await publish_location(str(change["documentKey"]["_id"]), student.get("current_location"), change.get("wallTime"))
+
+
+async def _on_notification(change: dict):
+    await publish_notification(change["fullDocument"])
+
+
+async def _on_logbook_change(change: dict):
+    if change["operationType"] == "update" and "status" not in change["updateDescription"]["updatedFields"]:
+        return
+    entry = change.get("fullDocument")
+    if entry and entry.get("status") == "Submitted":
+        await publish_logbook_submission(entry)
+
+
+def start_feeds() -> List[asyncio.Task]:
+    return [
+        asyncio.create_task(_watch(
+            db.students, [{"$match": {"operationType": "update"}}], _on_student_change, full_document="updateLookup"
+        )),
+        asyncio.create_task(_watch(
+            db.notifications, [{"$match": {"operationType": "insert"}}], _on_notification
+        )),
+        asyncio.create_task(_watch(
+            db.logbook_entries, [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+            _on_logbook_change, full_document="updateLookup"
+        )),
+    ]
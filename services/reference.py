@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import hashlib
+import logging
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional
+from bson import ObjectId
+from pymongo.errors import OperationFailure, PyMongoError
+from database.models import Zone, Faculty, Department, Programme
+from services import cache, metrics
+
+logger = logging.getLogger(__name__)
+
+COLLECTIONS = {"zones": Zone, "faculties": Faculty, "departments": Department, "programmes": Programme}
+POLL_SECONDS = 30
+RETRY_SECONDS = 5
+# Returned by servers that are not part of a replica set
+CHANGE_STREAMS_UNSUPPORTED = 40573
+
+reloads_total = metrics.counter("reference_reloads_total", "Reference data reloads by trigger", ("trigger",))
+
+
+class ReferenceData:
+    """
+    Immutable snapshot of zones, faculties, departments and programmes.
+
+    Lookups are read-only maps keyed by ObjectId, and `tree` nests programmes under departments
+    under faculties. A refresh builds a new snapshot and swaps it in, so readers never see a
+    half-loaded state and never need a lock.
+    """
+
+    def __init__(self, documents: Mapping[str, List[dict]]):
+        self.zones: Mapping[ObjectId, Zone] = self._index(Zone, documents.get("zones", []))
+        self.faculties: Mapping[ObjectId, Faculty] = self._index(Faculty, documents.get("faculties", []))
+        self.departments: Mapping[ObjectId, Department] = self._index(Department, documents.get("departments", []))
+        self.programmes: Mapping[ObjectId, Programme] = self._index(Programme, documents.get("programmes", []))
+        self.version = self._version(documents)
+        self.tree = self._tree()
+
+    @staticmethod
+    def _index(model, documents: List[dict]) -> Mapping[ObjectId, Any]:
+        return MappingProxyType({document["_id"]: model.from_mongo(document) for document in documents})
+
+    @staticmethod
+    def _version(documents: Mapping[str, List[dict]]) -> str:
+        digest = hashlib.blake2b(digest_size=12)
+        for name in sorted(documents):
+            for document in sorted(documents[name], key=lambda document: str(document["_id"])):
+                digest.update(f"{name}:{document['_id']}:{document.get('updated_at')}:{document.get('name')};".encode())
+        return digest.hexdigest()
+
+    def _tree(self) -> tuple:
+        programmes: Dict[Any, list] = {}
+        for programme in self.programmes.values():
+            programmes.setdefault(programme.department_id, []).append({"id": str(programme.id), "name": programme.name})
+        departments: Dict[Any, list] = {}
+        for department in self.departments.values():
+            departments.setdefault(department.faculty_id, []).append({
+                "id": str(department.id),
+                "name": department.name,
+                "programmes": sorted(programmes.get(department.id, []), key=lambda node: node["name"] or ""),
+            })
+        return tuple(
+            {
+                "id": str(faculty.id),
+                "name": faculty.name,
+                "departments": sorted(departments.get(faculty.id, []), key=lambda node: node["name"] or ""),
+            }
+            for faculty in sorted(self.faculties.values(), key=lambda faculty: faculty.name or "")
+        )
+
+    def zone_name(self, zone_id) -> Optional[str]:
+        zone = self.zones.get(zone_id)
+        return zone.name if zone else None
+
+    def zone_list(self) -> List[Dict[str, Any]]:
+        return [
+            {"id": str(zone.id), "name": zone.name, "region": zone.region}
+            for zone in sorted(self.zones.values(), key=lambda zone: zone.name or "")
+        ]
+
+
+class ReferenceRegistry:
+    """
+    Holds the current reference snapshot for the process.
+
+    Loaded once in the app lifespan, then kept current from a database change stream, or by
+    polling a per-collection version marker (count and latest updated_at) when the server is not
+    a replica set. The database is handed in at startup so this module stays importable from
+    services.service.
+    """
+
+    def __init__(self):
+        self.current = ReferenceData({})
+        self.loaded = False
+        self._db = None
+        self._reload: Optional[asyncio.Task] = None
+        cache.subscribe(self.on_invalidate)
+
+    def on_invalidate(self, tags):
+        # A write reported by another worker, usually well before the poll would notice it
+        if self.loaded and COLLECTIONS.keys() & set(tags) and (self._reload is None or self._reload.done()):
+            # Outside the context of the request that wrote, so its deadline does not apply
+            self._reload = asyncio.get_running_loop().create_task(
+                self.load(trigger="invalidation"), context=contextvars.Context()
+            )
+            self._reload.add_done_callback(_log_failure)
+
+    async def load(self, db=None, trigger: str = "startup") -> ReferenceData:
+        self._db = db if db is not None else self._db
+        documents = {}
+        for name in COLLECTIONS:
+            documents[name] = await self._db[name].find({}).to_list(None)
+        self.current = ReferenceData(documents)
+        self.loaded = True
+        reloads_total.inc(trigger=trigger)
+        return self.current
+
+    async def _marker(self) -> tuple:
+        marker = []
+        for name in COLLECTIONS:
+            summary = await self._db[name].aggregate([
+                {"$group": {"_id": None, "count": {"$sum": 1}, "latest": {"$max": "$updated_at"}}}
+            ]).to_list(None)
+            marker.append((name, summary[0]["count"], summary[0]["latest"]) if summary else (name, 0, None))
+        return tuple(marker)
+
+    async def _poll(self):
+        marker = await self._marker()
+        while True:
+            await asyncio.sleep(POLL_SECONDS)
+            try:
+                latest = await self._marker()
+                if latest != marker:
+                    await self.load(trigger="poll")
+                    marker = latest
+            except PyMongoError as e:
+                logger.warning("Reference data poll failed: %s", e)
+
+    async def follow(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(COLLECTIONS)}}}]
+        while True:
+            try:
+                async with self._db.watch(pipeline) as stream:
+                    # Anything written between the initial load and the stream opening
+                    await self.load(trigger="watch")
+                    while True:
+                        await stream.next()
+                        # Fold a burst of changes into one reload
+                        while await stream.try_next() is not None:
+                            pass
+                        await self.load(trigger="change")
+            except OperationFailure as e:
+                if e.code == CHANGE_STREAMS_UNSUPPORTED:
+                    logger.info("Change streams unavailable; polling reference data every %ss", POLL_SECONDS)
+                    await self._poll()
+                    return
+                logger.warning("Reference data change stream failed: %s", e)
+            except PyMongoError as e:
+                logger.warning("Reference data change stream interrupted: %s", e)
+            await asyncio.sleep(RETRY_SECONDS)
+
+    def start(self) -> asyncio.Task:
+        return asyncio.create_task(self.follow())
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("Reference data reload failed: %s", task.exception())
+
+
+registry = ReferenceRegistry()
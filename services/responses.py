@@ -0,0 +1,83 @@
+import base64
+import json
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Any, AsyncIterator, Callable, Dict
+import bson
+from bson import ObjectId, Decimal128
+from bson.raw_bson import RawBSONDocument
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:
+    # Used when installed; the stdlib encoder produces the same output
+    import orjson
+except ImportError:
+    orjson = None
+
+# Exact-type dispatch for the values Mongo documents carry that JSON does not know about
+ENCODERS: Dict[type, Callable[[Any], Any]] = {
+    ObjectId: str,
+    datetime: datetime.isoformat,
+    date: date.isoformat,
+    time: time.isoformat,
+    Decimal128: lambda value: str(value.to_decimal()),
+    Decimal: str,
+    uuid.UUID: str,
+    bytes: lambda value: base64.b64encode(value).decode("ascii"),
+    set: list,
+    frozenset: list,
+    # Pass-through reads are decoded in one C call right before encoding
+    RawBSONDocument: lambda value: bson.decode(value.raw),
+}
+
+# Streamed responses are flushed in chunks of about this size
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+def _default(value: Any) -> Any:
+    encoder = ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    # Subclasses such as PyObjectId
+    for base, encoder in ENCODERS.items():
+        if isinstance(value, base):
+            return encoder(value)
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class BSONJSONResponse(JSONResponse):
+    """
+    JSON response for raw Mongo documents.
+
+    Values are encoded straight to bytes with a type-dispatch table for ObjectId, datetime and
+    Decimal128, skipping FastAPI's recursive jsonable_encoder pass. Endpoints return an instance
+    directly so the content is not walked twice.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+async def stream_json_array(cursor) -> AsyncIterator[bytes]:
+    """Encode a cursor as a JSON array document by document, so only one batch is held in memory."""
+    chunk = bytearray(b"[")
+    separator = b""
+    async for document in cursor:
+        chunk += separator
+        chunk += dumps(document)
+        separator = b","
+        if len(chunk) >= STREAM_CHUNK_BYTES:
+            yield bytes(chunk)
+            chunk.clear()
+    chunk += b"]"
+    yield bytes(chunk)
@@ -0,0 +1,345 @@
+import asyncio
+import contextvars
+import math
+from datetime import datetime, timedelta, date
+from typing import Optional, List, Dict, Any
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from services.service import db, distance_cache, background_tasks
+from services import geo
+from services.distances import point_key
+from services.cache import invalidate_tags
+
+DEFAULT_MAX_VISITS_PER_DAY = 6
+DEFAULT_MAX_KM_PER_DAY = 300.0
+DEFAULT_PERIOD_DAYS = 28
+VISIT_DURATION_MINUTES = 45
+DEFAULT_OPEN_TIME = "08:00"
+DEFAULT_CLOSE_TIME = "17:00"
+DEFAULT_WORKING_DAYS = [0, 1, 2, 3, 4]  # Monday to Friday
+CLOSED_VISIT_STATUSES = ["completed", "cancelled"]
+
+
+def _clock_minutes(value: Optional[str], default: str) -> int:
+    try:
+        hours, minutes = (value or default).split(":")
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return _clock_minutes(default, default)
+
+
+def _as_date(value) -> Optional[date]:
+    if isinstance(value, datetime):
+        return value.date()
+    return value
+
+
+def _build_stop(visit: dict, internship: Optional[dict], company: Optional[dict]) -> dict:
+    hours = (company or {}).get("working_hours") or {}
+    internship = internship or {}
+    coord = geo.coordinate_of(visit.get("destination_location")) or geo.coordinate_of((company or {}).get("address"))
+    return {
+        "id": visit["_id"],
+        "coord": coord,
+        "open": _clock_minutes(hours.get("open_time"), DEFAULT_OPEN_TIME),
+        "close": _clock_minutes(hours.get("close_time"), DEFAULT_CLOSE_TIME),
+        "days": set(hours.get("days") or DEFAULT_WORKING_DAYS),
+        "first": _as_date(internship.get("start_date")),
+        "last": _as_date(internship.get("end_date")),
+        "current": visit.get("visit_date"),
+    }
+
+
+def _allowed(stop: dict, day: date) -> bool:
+    if day.weekday() not in stop["days"]:
+        return False
+    if stop["first"] and day < stop["first"]:
+        return False
+    if stop["last"] and day > stop["last"]:
+        return False
+    return True
+
+
+def _evaluate(route: List[dict], origin, limits: dict):
+    """Return (km, arrival minutes) for a day route, or None if it breaks a constraint."""
+    if len(route) > limits["max_visits"]:
+        return None
+    km = 0.0
+    clock = None
+    position = origin
+    arrivals = []
+    for stop in route:
+        leg = limits["distance"](position, stop["coord"])
+        km += leg
+        # The supervisor leaves base in time to arrive as the first company opens
+        clock = stop["open"] if clock is None else max(clock + geo.travel_minutes(leg), stop["open"])
+        if clock + VISIT_DURATION_MINUTES > stop["close"]:
+            return None
+        arrivals.append(clock)
+        clock += VISIT_DURATION_MINUTES
+        position = stop["coord"]
+    if route:
+        km += limits["distance"](position, origin)
+    if km > limits["max_km"]:
+        return None
+    return km, arrivals
+
+
+def _order(route: List[dict], origin, limits: dict):
+    """Order a day's stops with nearest neighbour followed by 2-opt, keeping the route feasible."""
+    remaining = list(route)
+    ordered = []
+    position = origin
+    while remaining:
+        nearest = min(remaining, key=lambda stop: limits["distance"](position, stop["coord"]))
+        remaining.remove(nearest)
+        ordered.append(nearest)
+        position = nearest["coord"]
+
+    # Time windows may rule out the geometric order, so also try visiting by closing time
+    best, best_result = None, None
+    for candidate in (route, ordered, sorted(route, key=lambda stop: (stop["close"], stop["open"]))):
+        result = _evaluate(candidate, origin, limits)
+        if result and (best_result is None or result[0] < best_result[0]):
+            best, best_result = candidate, result
+    if best is None:
+        return route, None
+
+    improved = True
+    while improved:
+        improved = False
+        for i in range(len(best) - 1):
+            for j in range(i + 1, len(best)):
+                candidate = best[:i] + best[i:j + 1][::-1] + best[j + 1:]
+                result = _evaluate(candidate, origin, limits)
+                if result and result[0] < best_result[0] - 1e-9:
+                    best, best_result, improved = candidate, result, True
+    return best, best_result
+
+
+def _cheapest_insertion(route: List[dict], stop: dict, origin, limits: dict):
+    best, best_km = None, math.inf
+    for position in range(len(route) + 1):
+        candidate = route[:position] + [stop] + route[position:]
+        result = _evaluate(candidate, origin, limits)
+        if result and result[0] < best_km:
+            best, best_km = candidate, result[0]
+    return best
+
+
+def _sweep_clusters(stops: List[dict], origin, size: int) -> List[List[dict]]:
+    """Group stops into day-sized clusters by sweeping around the supervisor's base."""
+    if not stops:
+        return []
+    ordered = sorted(stops, key=lambda stop: geo.bearing(origin, stop["coord"]))
+    angles = [geo.bearing(origin, stop["coord"]) for stop in ordered]
+    # Start the sweep at the widest angular gap so a dense area is not cut in two
+    gaps = [(angles[i] - angles[i - 1]) % (2 * math.pi) for i in range(len(angles))]
+    start = max(range(len(gaps)), key=gaps.__getitem__)
+    ordered = ordered[start:] + ordered[:start]
+    return [ordered[i:i + size] for i in range(0, len(ordered), size)]
+
+
+def _place_cluster(cluster: List[dict], routes: Dict[date, List[dict]], days: List[date], origin, limits: dict):
+    """Put a cluster on the day that takes most of it; returns the stops that did not fit."""
+    best_day, best_route, best_left = None, None, cluster
+    for day in days:
+        route = routes[day]
+        left = []
+        for stop in cluster:
+            candidate = _cheapest_insertion(route, stop, origin, limits) if _allowed(stop, day) else None
+            if candidate is None:
+                left.append(stop)
+            else:
+                route = candidate
+        if len(left) < len(best_left):
+            best_day, best_route, best_left = day, route, left
+            if not left:
+                break
+    if best_day is not None:
+        routes[best_day] = best_route
+    return best_left
+
+
+async def _load_stops(supervisor_id: str):
+    """A supervisor's open visits and the stops built from them, with their time windows."""
+    visits = await db.visit_locations.find(
+        {"supervisor_id": ObjectId(supervisor_id), "status": {"$nin": CLOSED_VISIT_STATUSES}},
+        {"internship_id": 1, "company_id": 1, "source_location": 1, "destination_location": 1, "visit_date": 1},
+    ).to_list(None)
+
+    internship_ids = list({visit["internship_id"] for visit in visits if visit.get("internship_id")})
+    company_ids = list({visit["company_id"] for visit in visits if visit.get("company_id")})
+    internships = {
+        internship["_id"]: internship
+        for internship in await db.internships.find(
+            {"_id": {"$in": internship_ids}}, {"start_date": 1, "end_date": 1}
+        ).to_list(None)
+    }
+    companies = {
+        company["_id"]: company
+        for company in await db.companies.find(
+            {"_id": {"$in": company_ids}}, {"working_hours": 1, "address.coordinate": 1}
+        ).to_list(None)
+    }
+    stops = [_build_stop(visit, internships.get(visit.get("internship_id")), companies.get(visit.get("company_id"))) for visit in visits]
+    return visits, stops
+
+
+def _route_points(visits: List[dict], stops: List[dict]) -> list:
+    """The base routes start from, followed by every stop; the points the distance matrix covers."""
+    origin = geo.centroid([geo.coordinate_of(visit.get("source_location")) for visit in visits])
+    origin = origin or geo.centroid([stop["coord"] for stop in stops])
+    return [origin] + [stop["coord"] for stop in stops]
+
+
+async def schedule_visits(
+    supervisor_id: str,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    max_visits_per_day: int = DEFAULT_MAX_VISITS_PER_DAY,
+    max_km_per_day: float = DEFAULT_MAX_KM_PER_DAY,
+    incremental: bool = True,
+    reschedule: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Spread a supervisor's pending visits over the days of the supervision period.
+
+    Visits are clustered geographically, each cluster is given a day, and the stops of a day are
+    ordered under the company working hours and the daily visit/distance limits. In incremental
+    mode visits that already hold a valid date stay where they are and only new, invalid or
+    explicitly rescheduled visits are placed, so a single change rewrites a single day.
+    """
+    if max_visits_per_day < 1 or max_km_per_day <= 0:
+        raise HTTPException(status_code=400, detail="Daily limits must be positive")
+
+    visits, stops = await _load_stops(supervisor_id)
+    unscheduled = [{"visit_id": str(stop["id"]), "reason": "missing_coordinates"} for stop in stops if not stop["coord"]]
+    stops = [stop for stop in stops if stop["coord"]]
+
+    first_day = _as_date(start_date) or datetime.utcnow().date()
+    last_day = _as_date(end_date)
+    if last_day is None:
+        ends = [stop["last"] for stop in stops if stop["last"]]
+        last_day = max(ends) if ends else first_day + timedelta(days=DEFAULT_PERIOD_DAYS)
+    if last_day < first_day:
+        raise HTTPException(status_code=400, detail="end_date is before start_date")
+    days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+
+    points = _route_points(visits, stops)
+    origin = points[0]
+    distance = await distance_cache.matrix(points) if stops else geo.haversine_km
+    limits = {"max_visits": max_visits_per_day, "max_km": max_km_per_day, "distance": distance}
+
+    routes: Dict[date, List[dict]] = {day: [] for day in days}
+    touched = set()
+    pending = []
+    forced = {ObjectId(visit_id) for visit_id in reschedule or []}
+    # Keep already planned visits in their current order so untouched days are not rewritten
+    for stop in sorted(stops, key=lambda stop: stop["current"] or datetime.max):
+        day = _as_date(stop["current"])
+        route = None
+        if incremental and stop["id"] not in forced and day in routes and _allowed(stop, day):
+            route = routes[day] + [stop]
+            if _evaluate(route, origin, limits) is None:
+                route = _cheapest_insertion(routes[day], stop, origin, limits)
+        if route is None:
+            pending.append(stop)
+        else:
+            routes[day] = route
+
+    if pending:
+        before = {day: list(route) for day, route in routes.items()}
+        # Clusters holding the most pressing deadline choose their day first
+        clusters = sorted(
+            _sweep_clusters(pending, origin, max_visits_per_day),
+            key=lambda cluster: min(stop["last"] or last_day for stop in cluster),
+        )
+        leftovers = []
+        for cluster in clusters:
+            leftovers.extend(_place_cluster(cluster, routes, days, origin, limits))
+        for stop in leftovers:
+            placed = False
+            for day in days:
+                route = _cheapest_insertion(routes[day], stop, origin, limits) if _allowed(stop, day) else None
+                if route is not None:
+                    routes[day] = route
+                    placed = True
+                    break
+            if not placed:
+                unscheduled.append({"visit_id": str(stop["id"]), "reason": "no_feasible_day"})
+        touched = {day for day in days if routes[day] != before[day]}
+
+    plan = []
+    operations = []
+    now = datetime.utcnow()
+    for day in days:
+        route = routes[day]
+        if not route:
+            continue
+        if day in touched:
+            route, result = _order(route, origin, limits)
+            routes[day] = route
+        else:
+            result = _evaluate(route, origin, limits)
+        km, arrivals = result
+        entries = []
+        for stop, arrival in zip(route, arrivals):
+            visit_date = datetime.combine(day, datetime.min.time()) + timedelta(minutes=round(arrival))
+            if stop["current"] != visit_date:
+                operations.append(UpdateOne({"_id": stop["id"]}, {"$set": {"visit_date": visit_date, "updated_at": now}}))
+            entries.append({"visit_id": str(stop["id"]), "visit_date": visit_date.isoformat()})
+        plan.append({"date": day.isoformat(), "distance_km": round(km, 2), "visits": entries})
+
+    # Visits that lost their slot should not keep advertising a stale date
+    dropped = {ObjectId(entry["visit_id"]) for entry in unscheduled}
+    for stop in stops:
+        if stop["id"] in dropped and stop["current"] is not None:
+            operations.append(UpdateOne({"_id": stop["id"]}, {"$set": {"visit_date": None, "updated_at": now}}))
+
+    if operations:
+        await db.visit_locations.bulk_write(operations, ordered=False)
+        invalidate_tags("visit_locations")
+
+    return {"days": plan, "unscheduled": unscheduled, "updated": len(operations)}
+
+
+async def reschedule_visit(supervisor_id: str, visit_id: str, **options) -> Dict[str, Any]:
+    """Re-place a single visit, leaving every other scheduled visit untouched where possible."""
+    if not ObjectId.is_valid(visit_id):
+        raise HTTPException(status_code=400, detail="Invalid visit location ID")
+    return await schedule_visits(supervisor_id, incremental=True, reschedule=[visit_id], **options)
+
+
+async def precompute_zone_distances(zone_id: str) -> int:
+    """
+    Load the distance matrix schedule_visits asks for, for every supervisor in a zone.
+
+    Each matrix covers the supervisor's base and every open stop pairwise, exactly as scheduling
+    reads it, so the next scheduling run finds every leg cached. Returns the number of pairs.
+    """
+    supervisors = await db.school_supervisors.find({"zone_id": ObjectId(zone_id)}, {"user_id": 1}).to_list(None)
+    pairs = 0
+    for supervisor in supervisors:
+        if not ObjectId.is_valid(supervisor.get("user_id")):
+            continue
+        visits, stops = await _load_stops(supervisor["user_id"])
+        stops = [stop for stop in stops if stop["coord"]]
+        if not stops:
+            continue
+        points = _route_points(visits, stops)
+        await distance_cache.matrix(points)
+        count = len({point_key(point) for point in points})
+        pairs += count * (count + 1) // 2
+    return pairs
+
+
+def schedule_zone_distance_precompute(zone_id: str):
+    if not ObjectId.is_valid(zone_id):
+        raise HTTPException(status_code=400, detail="Invalid zone ID")
+    # A fresh context, so the job is not bound by the deadline of the request that started it
+    task = asyncio.create_task(precompute_zone_distances(zone_id), context=contextvars.Context())
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return {"message": "Distance matrix precomputation scheduled", "zone_id": zone_id}
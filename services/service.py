@@ -1,4 +1,4 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
@@ -7,20 +7,56 @@ from typing import Optional, List,Dict,Any
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorClient
 from geopy.distance import geodesic
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
+import hashlib
+import hmac
+from collections import OrderedDict
 from database.models import (
     PyObjectId, Rating, User, Student, SchoolSupervisor, Evaluation, Notification, VisitLocation, AppCredentials, Token,
     LogBookEntry, MonthlySummary, FinalAssessment, AttachmentReport, WhiteList, Zone,
     Company, Internship, Application
 )
-from database.config import MONGODB_URI, DATABASE_NAME, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_DAYS
+from database.config import MONGODB_URI, DATABASE_NAME, SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_DAYS, ADMIN_TOKEN
+from services import geo, projections, reference, executor, passwords, slowqueries
+from services.slowqueries import traced
+from services.cache import AsyncCache, cached, invalidate_tags
+from services.distances import DistanceCache
 
 # MongoDB setup
-client = AsyncIOMotorClient(MONGODB_URI)
+client = AsyncIOMotorClient(MONGODB_URI, event_listeners=[slowqueries.listener])
 db = client[DATABASE_NAME]
 
+# Pass-through view of the same database: documents stay as raw BSON and are only decoded
+# field by field when accessed, or in one go by the JSON encoder. Used for large reads that are
+# returned to the client unchanged.
+raw_db = db.with_options(codec_options=CodecOptions(document_class=RawBSONDocument))
+
+# Shared site-to-site distance cache
+distance_cache = DistanceCache(db.distance_cache)
+
+# Expensive read views shared by everyone opening them at the same time; entries are tagged with
+# the collections they read and dropped by the writes below
+view_cache = AsyncCache("views", maxsize=2048, ttl=30, stale_ttl=60)
+DASHBOARD_TAGS = ("school_supervisors", "students", "users", "evaluations", "notifications", "zones", "visit_locations")
+ASSIGNED_STUDENTS_TAGS = ("school_supervisors", "students", "internships", "applications", "visit_locations", "evaluations")
+
+# Keep references to fire-and-forget tasks so they are not garbage collected mid-run
+background_tasks = set()
+
+async def ensure_indexes():
+    await db.distance_cache.create_index("a")
+    await db.distance_cache.create_index("b")
+
 # Security setup
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
+# Subjects of the tokens get_current_user accepted, by token digest and most recent last, for the
+# rate limiter, which runs before authentication
+MAX_VERIFIED_TOKENS = 10_000
+verified_tokens: "OrderedDict[bytes, str]" = OrderedDict()
 
 # Authentication and Authorization
 async def verify_app_credentials(app_id: str, app_key: str) -> bool:
@@ -33,43 +69,21 @@ async def verify_app_credentials(app_id: str, app_key: str) -> bool:
         return True
     return False
 
-def get_password_hash(password):
-    # Combine password and key
-    rounds= 1000
-    key="TTU_IMS"
-    combined = password + key
-    hashed = combined
-    
-    # Perform multiple rounds of a simple mixing function
-    for _ in range(rounds):
-        new_hash = ""
-        for i in range(len(hashed)):
-            char = hashed[i]
-            # Simple mixing: rotate ASCII value and wrap around
-            new_char = chr((ord(char) + i + len(hashed)) % 128)
-            new_hash += new_char
-        hashed = new_hash
-    
-    # Convert to a hexadecimal string
-    return ''.join(format(ord(c), '02x') for c in hashed)
-
-def verify_password(plain_password, hashed_password):
-    return get_password_hash(plain_password) == hashed_password
+# Pure-Python rounds take several milliseconds with the GIL held, so they run in worker processes
+get_password_hash = executor.offload(executor.PROCESS)(passwords.get_password_hash)
+verify_password = executor.offload(executor.PROCESS)(passwords.verify_password)
 
 
 
 async def get_user(email: str):
     user_dict = await db.users.find_one({"email": email})
-        # Convert _id to id
-    if user_dict and '_id' in user_dict:
-        user_dict['id'] = str(user_dict.pop('_id')) 
-    print(user_dict)
     if user_dict:
-        return User(**user_dict)
+        # Stored users were validated on write; rebuild them without revalidating
+        return User.from_mongo(user_dict)
 
 async def authenticate_user(email: str, password: str):
     user = await get_user(email)
-    if not user or not verify_password(password, user.password):
+    if not user or not await verify_password(password, user.password):
         return False
     return user
 
@@ -99,13 +113,35 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     user = await get_user(email=email)
     if user is None:
         raise credentials_exception
+    _remember_subject(token, email)
     return user
 
+def _token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+def _remember_subject(token: str, subject: str):
+    digest = _token_digest(token)
+    verified_tokens[digest] = subject
+    verified_tokens.move_to_end(digest)
+    while len(verified_tokens) > MAX_VERIFIED_TOKENS:
+        verified_tokens.popitem(last=False)
+
+def verified_subject(token: str) -> Optional[str]:
+    """Subject of a token get_current_user has already accepted, without decoding it again."""
+    return verified_tokens.get(_token_digest(token))
+
 async def get_current_active_supervisor(current_user: User = Depends(get_current_user)):
     if current_user.role != "Supervisor-School-Base":
         raise HTTPException(status_code=400, detail="User is not a supervisor")
     return current_user
 
+def is_admin_token(token: Optional[str]) -> bool:
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
 async def logout(token: str):
     await db.token_blacklist.insert_one({"token": token, "invalidated_at": datetime.utcnow()})
     return True
@@ -114,9 +150,27 @@ async def is_token_blacklisted(token: str):
     blacklisted_token = await db.token_blacklist.find_one({"token": token})
     return blacklisted_token is not None
 
+async def attach_user_names(students: List[dict]) -> List[dict]:
+    """Add first_name and last_name from each student's user, where names are kept; one query for all."""
+    user_ids = list({student["user_id"] for student in students if student.get("user_id")})
+    if not user_ids:
+        return students
+    names = {
+        user["_id"]: user
+        for user in await db.users.find({"_id": {"$in": user_ids}}, {"first_name": 1, "last_name": 1}).to_list(None)
+    }
+    for student in students:
+        user = names.get(student.get("user_id")) or {}
+        student["first_name"] = user.get("first_name")
+        student["last_name"] = user.get("last_name")
+    return students
+
 # Supervisor Dashboard
-async def get_supervisor_dashboard(supervisor_id: str):
+@cached(view_cache, tags=DASHBOARD_TAGS)
+@traced
+async def get_supervisor_dashboard(supervisor_id: str, fields: Optional[str] = None):
     supervisor_id = supervisor_id.strip()
+    student_projection = projections.projection(Student, fields, projections.STUDENT_SUMMARY_FIELDS)
     supervisor = await db.school_supervisors.find_one({"user_id": supervisor_id})
     if not supervisor:
         raise HTTPException(status_code=404, detail="Supervisor not found")
@@ -132,7 +186,9 @@ async def get_supervisor_dashboard(supervisor_id: str):
 
     # Get students details
     if assigned_students:
-        students = await db.students.find({"_id": {"$in": [ObjectId(id) for id in assigned_students]}}).to_list(None)
+        students = await attach_user_names(await db.students.find(
+            {"_id": {"$in": [ObjectId(id) for id in assigned_students]}}, student_projection
+        ).to_list(None))
     else:
         students = []
 
@@ -142,26 +198,38 @@ async def get_supervisor_dashboard(supervisor_id: str):
     ).sort("created_at", -1).limit(5).to_list(None)
 
     # Find the area the supervisor is posted to
-    zone = None
-  
+    zone_name = None
     if supervisor.get("zone_id"):
-        zone = await db.zones.find_one({"_id": supervisor["zone_id"]})
-   
+        if reference.registry.loaded:
+            zone_name = reference.registry.current.zone_name(supervisor["zone_id"])
+        else:
+            zone = await db.zones.find_one({"_id": supervisor["zone_id"]}, {"name": 1})
+            zone_name = zone["name"] if zone else None
 
     location_posted = {
-        "zone": zone["name"] if zone else None,
+        "zone": zone_name,
         
     }
 
     # Get recent activities
     recent_activities = []
-    
-    # Check recent evaluations
     recent_evals = await db.evaluations.find(
-        {"supervisor_id": ObjectId(supervisor_id)}
+        {"supervisor_id": ObjectId(supervisor_id)}, {"application_id": 1, "created_at": 1}
     ).sort("created_at", -1).limit(3).to_list(None)
+    recent_visits = await db.visit_locations.find(
+        {"supervisor_id": ObjectId(supervisor_id)}, {"student_id": 1, "visit_date": 1}
+    ).sort("visit_date", -1).limit(3).to_list(None)
+
+    # Names of every student in them, in one query rather than one per activity
+    activity_student_ids = {eval["application_id"] for eval in recent_evals} | {visit["student_id"] for visit in recent_visits}
+    activity_students = {}
+    if activity_student_ids:
+        async for student in db.students.find({"_id": {"$in": list(activity_student_ids)}}, {"first_name": 1, "last_name": 1}):
+            activity_students[student["_id"]] = student
+
+    # Check recent evaluations
     for eval in recent_evals:
-        student = await db.students.find_one({"_id": eval["application_id"]})
+        student = activity_students.get(eval["application_id"])
         if student:
             recent_activities.append({
                 "type": "evaluation",
@@ -170,11 +238,8 @@ async def get_supervisor_dashboard(supervisor_id: str):
             })
 
     # Check recent visit locations
-    recent_visits = await db.visit_locations.find(
-        {"supervisor_id": ObjectId(supervisor_id)}
-    ).sort("visit_date", -1).limit(3).to_list(None)
     for visit in recent_visits:
-        student = await db.students.find_one({"_id": visit["student_id"]})
+        student = activity_students.get(visit["student_id"])
         if student:
             recent_activities.append({
                 "type": "visit",
@@ -194,7 +259,8 @@ async def get_supervisor_dashboard(supervisor_id: str):
         "area_posted_to": location_posted,
         "recent_activities": recent_activities[:5]  # Limit to 5 most recent activities
     }
-async def get_student_list(supervisor_id: str, status: Optional[str] = None):
+@traced
+async def get_student_list(supervisor_id: str, status: Optional[str] = None, fields: Optional[str] = None):
     supervisor = await db.school_supervisors.find_one({"user_id": ObjectId(supervisor_id)})
     if not supervisor:
         raise HTTPException(status_code=404, detail="Supervisor not found")
@@ -203,8 +269,10 @@ async def get_student_list(supervisor_id: str, status: Optional[str] = None):
     if status:
         query.update({"status": status})
 
-    students = await db.students.find(query).to_list(None)
-    return students
+    students = await db.students.find(
+        query, projections.projection(Student, fields, projections.STUDENT_SUMMARY_FIELDS)
+    ).to_list(None)
+    return await attach_user_names(students)
 
 
 async def get_student_location(student_id: str):
@@ -220,37 +288,76 @@ async def is_student_at_company(student_id: str, company_id: str, max_distance:
     if not student or not company:
         raise HTTPException(status_code=404, detail="Student or company not found")
     
-    if not student.get("current_location") or not company.get("address"):
+    student_location = geo.coordinate_of(student.get("current_location"))
+    company_location = geo.coordinate_of(company.get("address"))
+    if student_location is None or company_location is None:
         return False
     
-    student_location = (student["current_location"].latitude, student["current_location"].longitude)
-    company_location = (company["address"].coordinate.latitude, company["address"].coordinate.longitude)
-    
-    distance = geodesic(student_location, company_location).meters
+    distance = await distance_meters(student_location, company_location)
     return distance <= max_distance
 
+@executor.offload(executor.THREAD)
+def distance_meters(a, b) -> float:
+    return geodesic(a, b).meters
+
 # Visit Locations
-async def get_visit_locations(supervisor_id: str):
+@traced
+async def get_visit_locations(supervisor_id: str, fields: Optional[str] = None):
     
-    visit_locations = await db.visit_locations.find({"supervisor_id": ObjectId(supervisor_id)}).to_list(None)
+    visit_locations = await db.visit_locations.find(
+        {"supervisor_id": ObjectId(supervisor_id)}, projections.projection(VisitLocation, fields)
+    ).to_list(None)
     return visit_locations
 
 
+@traced
+async def get_visit_locations_version(supervisor_id: str):
+    """Count and latest updated_at of the supervisor's visits; the count catches deletions."""
+    summary = await db.visit_locations.aggregate([
+        {"$match": {"supervisor_id": ObjectId(supervisor_id)}},
+        {"$group": {
+            "_id": None,
+            "count": {"$sum": 1},
+            "latest": {"$max": "$updated_at"},
+            "undated": {"$sum": {"$cond": [{"$ifNull": ["$updated_at", False]}, 0, 1]}},
+        }},
+    ]).to_list(None)
+    if not summary:
+        return [0, None]
+    if summary[0]["undated"]:
+        # A visit without updated_at could change unseen
+        return None
+    return [summary[0]["count"], summary[0]["latest"]]
+
+@traced
 async def update_visit_location(visit_location_id: str, visit_location: VisitLocation):
-    result = await db.visit_locations.update_one(
+    previous = await db.visit_locations.find_one_and_update(
         {"_id": ObjectId(visit_location_id)},
-        {"$set": visit_location.dict(exclude={"id"})}
+        # The timestamps are the server's: updated_at feeds the ETag version, so a client echoing
+        # the value it fetched must not be able to change the data without changing the version
+        {"$set": {**visit_location.dict(exclude={"id", "created_at", "updated_at"}), "updated_at": datetime.utcnow()}},
+        projection={"destination_location": 1},
+        return_document=ReturnDocument.BEFORE
     )
-    if result.modified_count == 0:
+    if previous is None:
         raise HTTPException(status_code=202, detail="Visit location not found")
+
+    # A moved site makes its cached distances useless
+    old_coordinate = geo.coordinate_of(previous.get("destination_location"))
+    if old_coordinate and old_coordinate != geo.coordinate_of(visit_location.destination_location):
+        await distance_cache.invalidate_point(old_coordinate)
+    invalidate_tags("visit_locations")
     return True
 
+@traced
 async def delete_visit_location(visit_location_id: str):
     result = await db.visit_locations.delete_one({"_id": ObjectId(visit_location_id)})
     if result.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Visit location not found")
+    invalidate_tags("visit_locations")
     return True
 
+@traced
 async def update_visit_status(visit_id: str, status: str):
     result = await db.visit_locations.update_one(
         {"_id": ObjectId(visit_id)},
@@ -258,9 +365,11 @@ async def update_visit_status(visit_id: str, status: str):
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=404, detail="Visit location not found")
+    invalidate_tags("visit_locations")
     return {"message": "Visit status updated successfully"}
 
 # Supervisor Profile function
+@traced
 async def get_supervisor_profile(supervisor_id: str):
     # Strip whitespaces from supervisor_id
     supervisor_id = supervisor_id.strip()
@@ -279,6 +388,8 @@ async def get_supervisor_profile(supervisor_id: str):
     try:
         # Convert supervisor_id to ObjectId before querying users collection
         user = await db.users.find_one({"_id": ObjectId(supervisor_id)})
+    except PyMongoError:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid supervisor_id format: {e}")
     
@@ -292,13 +403,25 @@ async def get_supervisor_profile(supervisor_id: str):
     else:
         raise HTTPException(status_code=405, detail="User details for supervisor not found in users collection")
 
+async def get_supervisor_profile_version(supervisor_id: str):
+    """updated_at of the two documents the profile merges, or None when that cannot be told."""
+    supervisor_id = supervisor_id.strip()
+    if not ObjectId.is_valid(supervisor_id):
+        return None
+    supervisor = await db.school_supervisors.find_one({"user_id": supervisor_id}, {"updated_at": 1})
+    user = await db.users.find_one({"_id": ObjectId(supervisor_id)}, {"updated_at": 1})
+    if not supervisor or not user or not supervisor.get("updated_at") or not user.get("updated_at"):
+        return None
+    return [supervisor["_id"], supervisor["updated_at"], user["updated_at"]]
+
 async def update_supervisor_profile(supervisor_id: str, profile_data: dict):
     result = await db.school_supervisors.update_one(
-        {"_id": ObjectId(supervisor_id)},
-        {"$set": profile_data}
+        {"user_id": supervisor_id},
+        {"$set": {**profile_data, "updated_at": datetime.utcnow()}}
     )
-    if result.modified_count == 0:
+    if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Supervisor not found")
+    invalidate_tags("school_supervisors")
     return True
 
 async def delete_supervisor(supervisor_id: str):
@@ -311,18 +434,24 @@ async def delete_supervisor(supervisor_id: str):
         raise HTTPException(status_code=404, detail="Supervisor not found")
 
     await db.users.delete_one({"_id": supervisor["user_id"]})
+    invalidate_tags("school_supervisors", "users")
     return True
 
 # Student Logs
-async def view_student_logs(student_id: str, log_type: str):
+@traced
+def student_logs_cursor(student_id: str, log_type: str, fields: Optional[str] = None):
+    """Cursor over a student's submitted logs, as raw BSON documents."""
     if log_type == "daily":
-        logs = await db.logbook_entries.find({"student_id": ObjectId(student_id), "status": "Submitted"}).to_list(None)
+        collection, model = raw_db.logbook_entries, LogBookEntry
     elif log_type == "monthly":
-        logs = await db.monthly_summaries.find({"student_id": ObjectId(student_id), "status": "Submitted"}).to_list(None)
+        collection, model = raw_db.monthly_summaries, MonthlySummary
     else:
         raise HTTPException(status_code=400, detail="Invalid log type")
-    return logs
+    return collection.find(
+        {"student_id": ObjectId(student_id), "status": "Submitted"}, projections.projection(model, fields)
+    )
 
+@traced
 async def mark_logbook(supervisor_id: str, logbook_id: str, status: str, comments: Optional[str] = None):
     result = await db.logbook_entries.update_one(
         {"_id": ObjectId(logbook_id)},
@@ -351,24 +480,35 @@ async def create_final_report(supervisor_id: str, student_id: str, report_data:
 
     report_data["supervisor_id"] = ObjectId(supervisor_id)
     report_data["student_id"] = ObjectId(student_id)
+    report_data["created_at"] = report_data["updated_at"] = datetime.utcnow()
     result = await db.attachment_reports.insert_one(report_data)
     return str(result.inserted_id)
 
 async def update_final_report(report_id: str, report_data: dict):
     result = await db.attachment_reports.update_one(
         {"_id": ObjectId(report_id)},
-        {"$set": report_data}
+        {"$set": {**report_data, "updated_at": datetime.utcnow()}}
     )
     if result.modified_count == 0:
         raise HTTPException(status_code=202, detail="Final report not found")
     return {"message": "Final report updated successfully"}
 
+@traced
 async def get_final_report(report_id: str):
-    report = await db.attachment_reports.find_one({"_id": ObjectId(report_id)})
-    if not report:
+    report = await raw_db.attachment_reports.find_one({"_id": ObjectId(report_id)})
+    # Not `if not report`: len() would decode the raw document
+    if report is None:
         raise HTTPException(status_code=404, detail="Final report not found")
     return report
 
+async def get_final_report_version(report_id: str):
+    if not ObjectId.is_valid(report_id):
+        return None
+    report = await db.attachment_reports.find_one({"_id": ObjectId(report_id)}, {"updated_at": 1})
+    if not report or not report.get("updated_at"):
+        return None
+    return [report["_id"], report["updated_at"]]
+
 async def delete_final_report(report_id: str):
     result = await db.attachment_reports.delete_one({"_id": ObjectId(report_id)})
     if result.deleted_count == 0:
@@ -390,9 +530,12 @@ async def create_evaluation(supervisor_id: str, application_id: str, evaluation_
         areas_for_improvement=evaluation_data.get("areas_for_improvement", [])
     )
     result = await db.evaluations.insert_one(evaluation.dict(by_alias=True))
+    invalidate_tags("evaluations")
     return str(result.inserted_id)
 
 
+@cached(view_cache, tags=ASSIGNED_STUDENTS_TAGS)
+@traced
 async def get_assigned_students(supervisor_id: str):
     try:
         # Validate supervisor_id
@@ -407,56 +550,54 @@ async def get_assigned_students(supervisor_id: str):
 
         pipeline = [
             {"$match": {"_id": ObjectId(supervisor_id)}},
-            {"$unwind": "$students"},
+            {"$unwind": "$assigned_students"},
             {"$lookup": {
                 "from": "students",
-                "localField": "students",
+                "localField": "assigned_students",
                 "foreignField": "_id",
                 "as": "student_info"
             }},
             {"$unwind": "$student_info"},
+            # A student's active internship is the latest they were placed on
+            {"$addFields": {"internship_id": {"$arrayElemAt": ["$student_info.internships", -1]}}},
             {"$lookup": {
                 "from": "internships",
-                "localField": "student_info.active_internship",
+                "localField": "internship_id",
                 "foreignField": "_id",
                 "as": "active_internship"
             }},
             {"$unwind": "$active_internship"},
+            # Equality lookups on the student, narrowed to the active internship afterwards
             {"$lookup": {
                 "from": "visit_locations",
-                "let": { "student_id": "$students", "internship_id": "$active_internship._id" },
-                "pipeline": [
-                    {"$match": {
-                        "$expr": {
-                            "$and": [
-                                { "$eq": ["$student_id", "$$student_id"] },
-                                { "$eq": ["$internship_id", "$$internship_id"] },
-                                { "$eq": ["$status", "completed"] }
-                            ]
-                        }
-                    }},
-                    { "$limit": 1 }
-                ],
+                "localField": "assigned_students",
+                "foreignField": "student_id",
                 "as": "visit"
             }},
+            {"$lookup": {
+                "from": "applications",
+                "localField": "assigned_students",
+                "foreignField": "student_id",
+                "as": "application"
+            }},
+            {"$addFields": {
+                "visit": {"$filter": {"input": "$visit", "as": "visit", "cond": {"$and": [
+                    { "$eq": ["$$visit.internship_id", "$internship_id"] },
+                    { "$eq": ["$$visit.status", "completed"] }
+                ]}}},
+                "application": {"$arrayElemAt": [{"$filter": {"input": "$application", "as": "application", "cond": {
+                    "$eq": ["$$application.internship_id", "$internship_id"]
+                }}}, -1]}
+            }},
+            # Evaluations are recorded against the application
             {"$lookup": {
                 "from": "evaluations",
-                "let": { "student_id": "$students", "internship_id": "$active_internship._id" },
-                "pipeline": [
-                    {"$match": {
-                        "$expr": {
-                            "$and": [
-                                { "$eq": ["$application_id", "$$student_id"] },
-                                { "$eq": ["$internship_id", "$$internship_id"] }
-                            ]
-                        }
-                    }},
-                    { "$limit": 1 }
-                ],
+                "localField": "application._id",
+                "foreignField": "application_id",
                 "as": "assessment"
             }},
             {"$project": {
-                "student_id": "$students",
+                "student_id": "$assigned_students",
                 "student_name": "$student_info.name",
                 "internship_title": "$active_internship.title",
                 "company_name": "$active_internship.company_name",
@@ -521,11 +662,13 @@ async def get_assigned_students(supervisor_id: str):
 
         return students
 
-    except HTTPException as http_ex:
-        raise http_ex
+    except (HTTPException, PyMongoError):
+        # Database errors, deadline expiry included, are reported by the middleware
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {str(e)}")
 
+@traced
 async def get_supervisor_workload(supervisor_id: str) -> Dict[str, Any]:
     # Convert string ID to PyObjectId
     supervisor_object_id = PyObjectId(supervisor_id)
@@ -536,14 +679,14 @@ async def get_supervisor_workload(supervisor_id: str) -> Dict[str, Any]:
         raise HTTPException(status_code=404, detail="Supervisor not found")
 
     # Create a SchoolSupervisor instance
-    supervisor = SchoolSupervisor(**supervisor_data)
+    supervisor = SchoolSupervisor.from_mongo(supervisor_data)
 
     # Calculate workload information
     total_students = len(supervisor.assigned_students) if supervisor.assigned_students else 0
     
     # Fetch all applications for the assigned students
     student_ids = [PyObjectId(student_id) for student_id in supervisor.assigned_students]
-    applications = await db.applications.find({"student_id": {"$in": student_ids}}).to_list(None)
+    applications = await db.applications.find({"student_id": {"$in": student_ids}}, {"_id": 1}).to_list(None)
 
     # Calculate total supervision time (assuming each application requires 1 hour of supervision)
     total_supervision_time = len(applications)
@@ -557,4 +700,4 @@ async def get_supervisor_workload(supervisor_id: str) -> Dict[str, Any]:
         "department_id": str(supervisor.department_id) if supervisor.department_id else None
     }
 
-    return workload_info
\ No newline at end of file
+    return workload_info
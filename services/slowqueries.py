@@ -0,0 +1,253 @@
+import asyncio
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+from database.config import SLOW_QUERY_MS
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Distinct slow shapes remembered; the least recently seen is forgotten first
+MAX_SHAPES = 500
+# Where each command keeps the filter that decides which index is used
+FILTER_FIELDS = {
+    "find": "filter", "count": "query", "distinct": "query", "findAndModify": "query",
+    "update": "updates", "delete": "deletes", "aggregate": "pipeline",
+}
+# Per-connection and per-session fields that explain does not take
+NOT_EXPLAINED = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "maxTimeMS", "readConcern", "writeConcern"}
+
+command_seconds = metrics.histogram(
+    "mongo_command_duration_seconds", "Mongo command round trips by command name", ("command",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+slow_total = metrics.counter("mongo_slow_commands_total", "Commands slower than the threshold", ("collection", "command"))
+explains_total = metrics.counter("mongo_slow_explains_total", "Explain plans fetched for new slow shapes", ("result",))
+
+# Service function issuing the queries of the code running now
+query_source: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("query_source", default=None)
+
+
+def traced(fn):
+    """
+    Attribute the Mongo commands issued under `fn` to it in the slow-query log.
+
+    Motor copies the caller's context into the thread that runs each command, so the listener sees
+    the innermost traced function. A plain function that builds a cursor sets the source for the
+    rest of its caller's task instead, since the cursor is iterated after it returns.
+    """
+    name = fn.__qualname__
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            token = query_source.set(name)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                query_source.reset(token)
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            query_source.set(name)
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def _shape(value: Any) -> Any:
+    """The structure of a filter with every literal replaced by a placeholder."""
+    if isinstance(value, dict):
+        return {key: _shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # $in lists and the like differ in length only
+        shapes = []
+        for item in map(_shape, value):
+            if item not in shapes:
+                shapes.append(item)
+        return shapes
+    return "?"
+
+
+def command_shape(name: str, command: dict) -> Dict[str, Any]:
+    field = FILTER_FIELDS[name]
+    target = command.get(field)
+    if name in ("update", "delete"):
+        target = [statement.get("q", {}) for statement in target or ()]
+    elif name == "aggregate":
+        target = [
+            {stage: _shape(body) if stage == "$match" else "..."}
+            for step in target or () for stage, body in step.items()
+        ]
+    shape = {"filter": _shape(target or {})}
+    if command.get("sort"):
+        shape["sort"] = {key: direction for key, direction in command["sort"].items()}
+    return shape
+
+
+def _plan_summary(plan: dict) -> str:
+    """Winning plan as a chain of stages, e.g. `FETCH > IXSCAN student_id_1`."""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage += " " + plan["indexName"]
+        stages.append(stage)
+        plan = plan.get("inputStage") or (plan.get("inputStages") or [None])[0]
+    return " > ".join(stages)
+
+
+def _winning_plan(explain: dict) -> Optional[dict]:
+    planner = explain.get("queryPlanner")
+    if planner is None:
+        # Aggregations report the planner of their first stage
+        for stage in explain.get("stages", ()):
+            if "$cursor" in stage:
+                planner = stage["$cursor"].get("queryPlanner")
+                break
+    return planner.get("winningPlan") if planner else None
+
+
+class SlowQuery:
+    __slots__ = ("key", "command", "collection", "shape", "source", "count", "total", "worst", "last_seen", "plan")
+
+    def __init__(self, key: str, command: str, collection: str, shape: dict, source: Optional[str]):
+        self.key = key
+        self.command = command
+        self.collection = collection
+        self.shape = shape
+        self.source = source
+        self.count = 0
+        self.total = 0.0
+        self.worst = 0.0
+        self.last_seen = 0.0
+        self.plan: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "command": self.command,
+            "collection": self.collection,
+            "shape": self.shape,
+            "source": self.source,
+            "count": self.count,
+            "total_ms": round(self.total * 1e3, 1),
+            "max_ms": round(self.worst * 1e3, 1),
+            "last_seen": self.last_seen,
+            "plan": self.plan,
+            "collection_scan": bool(self.plan and "COLLSCAN" in self.plan),
+        }
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """
+    Records Mongo commands slower than SLOW_QUERY_MS, grouped by normalized shape.
+
+    A shape is the command, collection and filter structure with literal values removed, plus the
+    sort, so every supervisor's dashboard query lands in one entry. The first time a shape is slow
+    its command is explained on the event loop and the winning plan kept with it, which shows a
+    collection scan without turning on the server profiler.
+
+    Registered on the client through event_listeners, so every command is timed. The callbacks run
+    on driver threads and only take a lock to update a small dict; explain is handed back to the
+    loop. getMore batches are timed but not grouped, as they carry no filter.
+    """
+
+    def __init__(self, threshold_ms: float = SLOW_QUERY_MS):
+        self.threshold = threshold_ms / 1e3
+        self.queries: "OrderedDict[str, SlowQuery]" = OrderedDict()
+        self._pending: Dict[int, tuple] = {}
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._db = None
+        # Shapes with an explain in flight, and the plans of shapes already explained, most recent last
+        self._explaining: set = set()
+        self._explained: "OrderedDict[str, str]" = OrderedDict()
+
+    def started(self, event):
+        if event.command_name in FILTER_FIELDS:
+            collection = event.command.get(event.command_name)
+            self._pending[event.request_id] = (event.database_name, collection, event.command, query_source.get())
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        seconds = event.duration_micros / 1e6
+        command_seconds.observe(seconds, command=event.command_name)
+        pending = self._pending.pop(event.request_id, None)
+        if pending is None or seconds < self.threshold:
+            return
+        database, collection, command, source = pending
+        shape = command_shape(event.command_name, command)
+        key = json.dumps([event.command_name, collection, shape], sort_keys=True, default=str)
+        slow_total.inc(collection=collection, command=event.command_name)
+        with self._lock:
+            query = self.queries.get(key)
+            new = query is None
+            if new:
+                query = self.queries[key] = SlowQuery(key, event.command_name, collection, shape, source)
+                if len(self.queries) > MAX_SHAPES:
+                    self.queries.popitem(last=False)
+            else:
+                self.queries.move_to_end(key)
+            query.count += 1
+            query.total += seconds
+            query.worst = max(query.worst, seconds)
+            query.last_seen = time.time()
+            query.source = source or query.source
+        if new:
+            logger.warning("Slow %s on %s from %s: %.0f ms %s", event.command_name, collection, source, seconds * 1e3, shape)
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.call_soon_threadsafe(self._schedule_explain, query, database, command)
+
+    def _schedule_explain(self, query: SlowQuery, database: str, command: dict):
+        if query.key in self._explained:
+            # Dropped from the report and slow again: reuse the plan rather than explain it twice
+            self._explained.move_to_end(query.key)
+            query.plan = self._explained[query.key]
+            return
+        if query.key in self._explaining:
+            return
+        self._explaining.add(query.key)
+        # A fresh context: explain must neither inherit a request deadline nor be attributed to it
+        asyncio.get_running_loop().create_task(self._explain(query, database, command), context=contextvars.Context())
+
+    async def _explain(self, query: SlowQuery, database: str, command: dict):
+        explained = {key: value for key, value in command.items() if key not in NOT_EXPLAINED}
+        try:
+            result = await self._db.client[database].command({"explain": explained, "verbosity": "queryPlanner"})
+        except PyMongoError as e:
+            explains_total.inc(result="error")
+            logger.warning("Could not explain slow %s on %s: %s", query.command, query.collection, e)
+            return
+        finally:
+            self._explaining.discard(query.key)
+        plan = _winning_plan(result)
+        query.plan = _plan_summary(plan) if plan else "unknown"
+        self._explained[query.key] = query.plan
+        if len(self._explained) > MAX_SHAPES:
+            self._explained.popitem(last=False)
+        explains_total.inc(result="ok")
+        logger.warning("Plan for slow %s on %s: %s", query.command, query.collection, query.plan)
+
+    def start(self, db):
+        """Allow explains; they run on the calling loop through `db`'s client."""
+        self._loop = asyncio.get_running_loop()
+        self._db = db
+
+    def report(self) -> List[dict]:
+        with self._lock:
+            queries = list(self.queries.values())
+        return [query.as_dict() for query in sorted(queries, key=lambda query: query.total, reverse=True)]
+
+
+listener = SlowQueryListener()
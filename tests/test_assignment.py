@@ -0,0 +1,52 @@
+"""assign_students against the in-memory Mongo stand-in."""
+import asyncio
+import os
+
+# The services package reads these at import time; nothing here connects to them
+os.environ.setdefault("MONGODB_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DATABASE_NAME", "test")
+os.environ.setdefault("SECRET_KEY", "test")
+
+from bson import ObjectId  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from services import assignment  # noqa: E402
+
+
+def test_rebalancing_some_students_keeps_the_rest_of_each_roster(monkeypatch):
+    db = AsyncMongoMockClient()["test"]
+    monkeypatch.setattr(assignment, "db", db)
+    department, zone = ObjectId(), ObjectId()
+    supervisors = [
+        {"_id": ObjectId(), "user_id": str(ObjectId()), "department_id": department, "zone_id": zone, "capacity": 10}
+        for _ in range(2)
+    ]
+    students = [
+        {"_id": ObjectId(), "department_id": department, "zone_id": zone,
+         "current_location": {"latitude": 5.6 + index / 100, "longitude": -0.18}}
+        for index in range(6)
+    ]
+    for index, student in enumerate(students):
+        supervisor = supervisors[index % 2]
+        student["assigned_supervisor"] = supervisor["_id"]
+        supervisor.setdefault("assigned_students", []).append(student["_id"])
+
+    async def scenario():
+        await db.students.insert_many(students)
+        await db.school_supervisors.insert_many(supervisors)
+        moving = [str(students[0]["_id"]), str(students[1]["_id"])]
+        await assignment.assign_students(str(department), moving, rebalance=True)
+        return (
+            await db.students.find().to_list(None),
+            await db.school_supervisors.find().to_list(None),
+        )
+
+    stored_students, stored_supervisors = asyncio.run(scenario())
+    rosters = {supervisor["_id"]: supervisor["assigned_students"] for supervisor in stored_supervisors}
+    # Every student is still on exactly one roster, the one their own link points at
+    on_rosters = [student_id for roster in rosters.values() for student_id in roster]
+    assert sorted(on_rosters) == sorted(student["_id"] for student in students)
+    for student in stored_students:
+        assert student["_id"] in rosters[student["assigned_supervisor"]]
+    # Students outside the rebalanced subset stay where they were
+    for index, student in enumerate(students[2:], start=2):
+        assert student["_id"] in rosters[supervisors[index % 2]["_id"]]